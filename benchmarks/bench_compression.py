@@ -0,0 +1,148 @@
+"""
+spreads.response stored as plain text vs. compressed with a trained dictionary.
+
+Fills a scratch database with synthetic readings (Velhar-style phrasing over
+random cards), measures it, then trains a dictionary, migrates the rows and
+measures again:
+
+  db size        — main file after VACUUM
+  cache hit      — share of the file's pages that fit in --cache-mib, i.e. the
+                   expected page-cache hit rate for reads spread uniformly over
+                   all spreads (helpers open a connection per call, so the
+                   cache that matters is the OS one; sqlite3 exposes no counters)
+  write / read   — save_spread / get_spread_by_id latency, p50 and p99
+
+Run:  python -m benchmarks.bench_compression --rows 5000 --cache-mib 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+_OPENINGS = [
+    "{name}, карты легли так, как легли не случайно.",
+    "Я вижу, {name}, как над твоим вопросом сгущается тишина.",
+    "Звёзды сегодня говорят негромко, {name}, но ясно.",
+    "Слушай внимательно, {name}: колода открыла то, что долго ждало своего часа.",
+]
+_CARD_LINES = [
+    "{card} говорит о силе, которая уже есть в тебе, но пока молчит.",
+    "{card} указывает на перемену: старое уходит, чтобы освободить место новому.",
+    "{card} просит терпения — не торопи события, они созревают сами.",
+    "{card} предупреждает о сомнениях, которые мешают сделать первый шаг.",
+    "{card} несёт энергию начала: то, что ты задумал, получит поддержку.",
+    "{card} напоминает, что ответ скрыт в твоём собственном сердце.",
+    "{card} — знак того, что прошлое ещё держит тебя за руку.",
+    "{card} открывает дорогу, но идти по ней придётся самому.",
+]
+_ADVICE = [
+    "Совет карт: доверься интуиции и не бойся тишины.",
+    "Совет карт: отпусти то, что уже отслужило своё.",
+    "Совет карт: сделай маленький шаг сегодня, не дожидаясь знака.",
+    "Совет карт: береги силы — впереди важный поворот.",
+]
+_CLOSINGS = [
+    "Луна растёт, и вместе с ней растёт то, что ты посеял. 🌙",
+    "Помни: карты показывают путь, но выбор всегда за тобой. ✨",
+    "Возвращайся, когда почувствуешь, что пора спросить снова.",
+]
+_NAMES = ["Анна", "Мария", "Олег", "Ирина", "Дмитрий", "Елена", "Сергей", "Ольга"]
+
+
+def _reading(rng: random.Random, cards: tuple[str, ...]) -> str:
+    name = rng.choice(_NAMES)
+    parts = [rng.choice(_OPENINGS).format(name=name)]
+    for card in rng.sample(cards, rng.randint(3, 7)):
+        parts.append(f"*{card}*\n" + " ".join(
+            line.format(card=card) for line in rng.sample(_CARD_LINES, 2)
+        ))
+    parts += [rng.choice(_ADVICE), rng.choice(_CLOSINGS)]
+    return "\n\n".join(parts)
+
+
+def _pct(samples: list[float], q: float) -> float:
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+async def _measure(db, label: str, ids: list[int], write_ms: list[float], args, rng) -> dict:
+    read_ms = []
+    for spread_id in rng.sample(ids, min(args.reads, len(ids))):
+        started = time.perf_counter()
+        await db.get_spread_by_id(spread_id)
+        read_ms.append((time.perf_counter() - started) * 1000)
+    storage = await db.get_response_storage_report()
+    cache_pages = args.cache_mib * 1024 * 1024 // storage["page_size"]
+    return {
+        "label": label,
+        "db_mib": os.path.getsize(db.DB_PATH) / 1024 / 1024,
+        "response_mib": storage["response_bytes"] / 1024 / 1024,
+        "cache_hit": min(1.0, cache_pages / storage["page_count"]),
+        "write_p50": _pct(write_ms, 50), "write_p99": _pct(write_ms, 99),
+        "read_p50": _pct(read_ms, 50), "read_p99": _pct(read_ms, 99),
+    }
+
+
+async def _insert(db, n: int, rng, cards) -> tuple[list[int], list[float]]:
+    ids, write_ms = [], []
+    for i in range(n):
+        text = _reading(rng, cards)
+        started = time.perf_counter()
+        ids.append(await db.save_spread(i % 500 + 1, "three_paths", "что меня ждёт", text))
+        write_ms.append((time.perf_counter() - started) * 1000)
+    return ids, write_ms
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    os.environ.setdefault("BOT_TOKEN", "123456:fake")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    import database as db
+    from config import config
+    from services import compression
+    from services.deck import CARD_NAMES
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        await db.init_db()
+
+        config.response_compression = False
+        ids, write_ms = await _insert(db, args.rows, rng, CARD_NAMES)
+        await db.vacuum()
+        before = await _measure(db, "plain text", ids, write_ms, args, rng)
+
+        config.response_compression = True
+        await compression.train()
+        started = time.perf_counter()
+        migrated = await compression.migrate()
+        migrate_s = time.perf_counter() - started
+        more_ids, write_ms = await _insert(db, min(args.rows, 1000), rng, CARD_NAMES)
+        after = await _measure(db, "compressed", ids + more_ids, write_ms, args, rng)
+        after["migrate_s"] = migrate_s
+        after["rewritten"] = migrated["rewritten"]
+    return [before, after]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rows", type=int, default=5000)
+    p.add_argument("--reads", type=int, default=1000)
+    p.add_argument("--cache-mib", type=int, default=4, help="page cache budget for the hit-rate estimate")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+
+    from services import codec
+    before, after = asyncio.run(run(args))
+    print(f"codec: {codec.backend()} + dictionary; {after['rewritten']} rows migrated "
+          f"in {after['migrate_s']:.1f} s")
+    print(f"{'':<12}{'db MiB':>8}{'text MiB':>10}{'cache hit':>11}"
+          f"{'write p50/p99 ms':>18}{'read p50/p99 ms':>17}")
+    for r in (before, after):
+        print(f"{r['label']:<12}{r['db_mib']:>8.1f}{r['response_mib']:>10.1f}{r['cache_hit']:>10.0%}"
+              f"{r['write_p50']:>10.2f}/{r['write_p99']:<7.2f}{r['read_p50']:>9.2f}/{r['read_p99']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
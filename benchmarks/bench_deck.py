@@ -0,0 +1,52 @@
+"""
+Card draw hot path: legacy per-call deck rebuild vs. services.deck.
+
+Run:  python -m benchmarks.bench_deck --iterations 200000
+"""
+import argparse
+import random
+import timeit
+
+from services import deck
+
+
+def _legacy_draw_cards(n: int) -> list[str]:
+    """The pre-deck implementation: rebuild 78 names on every call."""
+    all_cards = list(deck.MAJOR_ARCANA)
+    for suit, ranks in deck.MINOR_SUITS.items():
+        for rank in ranks:
+            all_cards.append(f"{rank} {suit}")
+    return random.sample(all_cards, min(n, len(all_cards)))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--iterations", type=int, default=100_000)
+    p.add_argument("--cards", type=int, default=3)
+    p.add_argument("--spreads", type=int, default=10_000, help="batch size for draw_many")
+    args = p.parse_args(argv)
+
+    n, k = args.iterations, args.cards
+    rng = deck.make_rng(0)
+    cases = {
+        "legacy draw_cards": lambda: _legacy_draw_cards(k),
+        "deck.draw_names": lambda: deck.draw_names(k, rng),
+        "deck.draw": lambda: deck.draw(k, rng),
+        "deck.draw (reversed 0.5)": lambda: deck.draw(k, rng, reversed_rate=0.5),
+    }
+    print(f"{'case':<28}{'µs/draw':>10}{'draws/s':>14}")
+    baseline = None
+    for name, fn in cases.items():
+        seconds = min(timeit.repeat(fn, number=n, repeat=3))
+        per_draw = seconds / n * 1e6
+        baseline = baseline or per_draw
+        print(f"{name:<28}{per_draw:>10.2f}{n / seconds:>14,.0f}   x{baseline / per_draw:.1f}")
+
+    batch = args.spreads
+    seconds = min(timeit.repeat(lambda: deck.draw_many(k, batch, rng), number=10, repeat=3)) / 10
+    per_draw = seconds / batch * 1e6
+    print(f"{'deck.draw_many':<28}{per_draw:>10.2f}{batch / seconds:>14,.0f}   x{baseline / per_draw:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Referral codes at scale: issuing and resolving codes as users grows to 10M.
+
+Fills a scratch database (the real schema, unique index on referral_code)
+with users carrying their permutation codes, so a single duplicate would
+abort the fill with an IntegrityError. At each checkpoint it measures, for
+users without a code yet:
+
+  issue    — generate_and_save_referral_code: one SELECT + one UPDATE, no
+             existence probe and no retry loop, at any table size
+  resolve  — find_user_by_referral_code on random existing codes (index lookup)
+
+Run:  python -m benchmarks.bench_refcode --users 10000000 --samples 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+_ID_BASE = 5_000_000_000   # filled users get Telegram-sized ids from here
+_CHUNK = 100_000
+
+
+def _pct(samples: list[float], q: int) -> float:
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+def _fill(path: str, start: int, stop: int, encode) -> float:
+    """Insert users [start, stop) with their codes; returns encode seconds."""
+    encode_s = 0.0
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA synchronous = OFF")
+        for lo in range(start, stop, _CHUNK):
+            ids = range(_ID_BASE + lo, _ID_BASE + min(lo + _CHUNK, stop))
+            started = time.perf_counter()
+            rows = [(uid, encode(uid)) for uid in ids]
+            encode_s += time.perf_counter() - started
+            conn.executemany("INSERT INTO users (user_id, referral_code) VALUES (?, ?)", rows)
+            conn.commit()
+    return encode_s
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    os.environ.setdefault("BOT_TOKEN", "123456:fake")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    import database as db
+    from services import refcode
+
+    rng = random.Random(args.seed)
+    checkpoints = [n for n in (10_000, 100_000, 1_000_000, 10_000_000) if n < args.users]
+    checkpoints.append(args.users)
+    results, filled, fresh_id = [], 0, 1
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        await db.init_db()
+        for size in checkpoints:
+            started = time.perf_counter()
+            encode_s = await asyncio.to_thread(_fill, db.DB_PATH, filled, size, refcode.encode)
+            fill_s = time.perf_counter() - started
+            encoded, filled = size - filled, size
+
+            issue_ms = []
+            for _ in range(args.samples):
+                await db.create_user(fresh_id, None)
+                started = time.perf_counter()
+                await db.generate_and_save_referral_code(fresh_id)
+                issue_ms.append((time.perf_counter() - started) * 1000)
+                fresh_id += 1
+
+            resolve_ms = []
+            for _ in range(args.samples):
+                code = refcode.encode(_ID_BASE + rng.randrange(size))
+                started = time.perf_counter()
+                found = await db.find_user_by_referral_code(code)
+                resolve_ms.append((time.perf_counter() - started) * 1000)
+                assert found is not None
+            results.append({
+                "users": size,
+                "fill_s": fill_s,
+                "encode_us": encode_s / encoded * 1e6,
+                "issue_p50": _pct(issue_ms, 50), "issue_p99": _pct(issue_ms, 99),
+                "resolve_p50": _pct(resolve_ms, 50), "resolve_p99": _pct(resolve_ms, 99),
+                "db_mib": os.path.getsize(db.DB_PATH) / 1024 / 1024,
+            })
+    return results
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=10_000_000)
+    p.add_argument("--samples", type=int, default=300)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    print(f"{results[-1]['users']:,} users filled, 0 duplicate codes (unique index)")
+    print(f"{'users':>12}{'encode µs':>11}{'issue p50/p99 ms':>19}{'resolve p50/p99 ms':>21}{'db MiB':>9}")
+    for r in results:
+        print(f"{r['users']:>12,}{r['encode_us']:>11.1f}{r['issue_p50']:>11.2f}/{r['issue_p99']:<7.2f}"
+              f"{r['resolve_p50']:>12.2f}/{r['resolve_p99']:<8.2f}{r['db_mib']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
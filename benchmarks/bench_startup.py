@@ -0,0 +1,70 @@
+"""
+Cold start: wall time of `import bot` in a fresh interpreter, against a budget.
+
+Exits non-zero when the median exceeds --budget-ms or when a module that must
+load lazily (openai) is imported at startup — usable as a CI gate.
+
+Run:  python -m benchmarks.bench_startup --runs 5 --budget-ms 4000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from services import startup
+
+# Must not be imported by `import bot`; they load on first use
+LAZY_MODULES = ("openai",)
+
+_PROBE = (
+    "import sys, bot; "
+    "print(','.join(m for m in {lazy!r} if m in sys.modules))"
+)
+
+
+def _cold_import(root: str, env: dict) -> tuple[float, list[str]]:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(lazy=LAZY_MODULES)],
+        capture_output=True, text=True, env=env, cwd=root, check=True,
+    )
+    elapsed = time.perf_counter() - started
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return elapsed, loaded
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--budget-ms", type=float, default=4000.0, help="median cold import budget")
+    p.add_argument("--top", type=int, default=10, help="heaviest imports to list")
+    args = p.parse_args(argv)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "BOT_TOKEN": "0:bench", "OPENAI_API_KEY": "sk-bench"}
+    samples, eager = [], set()
+    for _ in range(args.runs):
+        elapsed, loaded = _cold_import(root, env)
+        samples.append(elapsed * 1000)
+        eager.update(loaded)
+
+    median = statistics.median(samples)
+    print(f"cold `import bot`: median {median:.0f} ms, min {min(samples):.0f} ms, "
+          f"max {max(samples):.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print()
+    print(startup.format_report(startup.profile_imports("bot"), top=args.top))
+
+    failed = False
+    if eager:
+        print(f"\nFAIL: imported at startup but should be lazy: {', '.join(sorted(eager))}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nFAIL: cold start {median:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+«Год под звёздами»: one 12-month completion vs. intro + 4 quarters in parallel.
+
+The fake OpenAI server answers after a fixed time-to-first-token plus a decode
+time proportional to the reply length, and replies fill ~70% of max_tokens —
+so the monolithic call pays for all twelve months serially, the fan-out for
+the longest quarter.
+
+Run:  python -m benchmarks.bench_year --runs 5 --ttft 0.5 --tps 80
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.fake_servers import FakeOpenAI
+
+_FILL = 0.7  # share of max_tokens a reply uses
+
+
+def _responder(body: dict) -> str:
+    n_tokens = int(body.get("max_tokens", 2048) * _FILL)
+    return ("звезда " * (n_tokens * FakeOpenAI._CHARS_PER_TOKEN // 7)).strip()
+
+
+async def _measure(oracle, fanout: bool, runs: int) -> dict:
+    from config import config
+    config.year_fanout = fanout
+    first, total = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        seen_first = None
+
+        async def on_section(index: int, text: str):
+            nonlocal seen_first
+            if seen_first is None:
+                seen_first = time.perf_counter() - started
+
+        await oracle.generate_year_under_stars("что принесёт год", on_section=on_section)
+        total.append(time.perf_counter() - started)
+        first.append(seen_first)
+    return {
+        "first_section_s": statistics.median(first),
+        "total_s": statistics.median(total),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    ai = FakeOpenAI(latency=args.ttft, tokens_per_second=args.tps, responder=_responder)
+    url = await ai.start()
+    os.environ.setdefault("BOT_TOKEN", "123456:fake")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.environ["OPENAI_BASE_URL"] = url + "/v1"
+
+    # Imported late: config.py reads the environment at import time
+    from services import oracle
+    try:
+        report = {
+            "monolithic": await _measure(oracle, fanout=False, runs=args.runs),
+            "fanout": await _measure(oracle, fanout=True, runs=args.runs),
+        }
+    finally:
+        await oracle.client.close()
+        await ai.stop()
+    return report
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--ttft", type=float, default=0.5, help="seconds to first token")
+    p.add_argument("--tps", type=float, default=80.0, help="decode speed, tokens/s")
+    args = p.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    base = report["monolithic"]
+    print(f"{'mode':<12}{'first section s':>18}{'total s':>10}")
+    for mode, r in report.items():
+        print(f"{mode:<12}{r['first_section_s']:>18.2f}{r['total_s']:>10.2f}"
+              f"   x{base['total_s'] / r['total_s']:.1f} total")
+
+
+if __name__ == "__main__":
+    main()
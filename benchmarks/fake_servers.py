@@ -0,0 +1,367 @@
+"""
+Local aiohttp stand-ins for the Telegram Bot API and OpenAI chat completions.
+
+Point the bot at them with TELEGRAM_API_URL / OPENAI_BASE_URL (see config.py).
+Both servers record every call so tests and benchmarks can assert on traffic.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict, deque
+from typing import Callable, Optional, Sequence
+
+from aiohttp import ClientError, ClientSession, web
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "VELHAR",
+    "username": "velhar_fake_bot",
+}
+
+DEFAULT_REPLY = (
+    "Звёзды расступаются, и карты открывают свой узор... "
+    "Ты стоишь на пороге, где прошлое ещё держит тебя за руку, "
+    "а будущее уже зовёт тихим светом. "
+    "Прислушайся к потокам — они знают больше, чем кажется."
+)
+
+
+class _FakeServer:
+    """Shared lifecycle: bind an ephemeral port, expose base_url."""
+
+    def __init__(self):
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+        self.connections: set[int] = set()
+
+    def _build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self._build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{bound_host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _track_connection(self, request: web.Request):
+        if request.transport is not None:
+            self.connections.add(id(request.transport))
+
+
+# ─── Telegram Bot API ─────────────────────────────────────────────────────────
+
+class FakeTelegram(_FakeServer):
+    """
+    Answers Bot API methods with plausible results.
+
+    latency         — seconds added before every response
+    error_429_rate  — probability of answering 429 Too Many Requests
+    chat_limit      — (n, seconds): like Telegram, answer 429 to a message
+                      method once a chat got n of them within `seconds`
+
+    deliver() plays Telegram's side of a webhook: POSTs an update to the URL
+    registered via setWebhook over a keep-alive session, retrying until 2xx.
+    """
+
+    # Methods whose result is a Message object; everything else returns True
+    _MESSAGE_METHODS = {
+        "sendmessage", "editmessagetext", "editmessagereplymarkup", "sendinvoice",
+    }
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_429_rate: float = 0.0,
+        seed: int = 0,
+        chat_limit: Optional[tuple[int, float]] = None,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.error_429_rate = error_429_rate
+        self.chat_limit = chat_limit
+        self._chat_sends: dict[str, deque] = defaultdict(deque)
+        self._rng = random.Random(seed)
+        self._message_ids = itertools.count(1000)
+        self.calls: Counter = Counter()
+        self.log: list[tuple[str, dict]] = []
+        self.rate_limited = 0
+        self.webhook_url = ""
+        self._webhook_session: Optional[ClientSession] = None
+
+    async def stop(self):
+        if self._webhook_session:
+            await self._webhook_session.close()
+            self._webhook_session = None
+        await super().stop()
+
+    async def deliver(self, update: dict, retry_delay: float = 0.05, timeout: float = 30.0) -> int:
+        """POST update to the current webhook until it is accepted; returns attempts used."""
+        if self._webhook_session is None:
+            self._webhook_session = ClientSession()
+        deadline = time.monotonic() + timeout
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                if self.webhook_url:
+                    async with self._webhook_session.post(self.webhook_url, json=update) as resp:
+                        if resp.status < 300:
+                            return attempts
+            except (ClientError, asyncio.TimeoutError):
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"update {update.get('update_id')} not accepted")
+            await asyncio.sleep(retry_delay)
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        return app
+
+    def reset(self):
+        self.calls.clear()
+        self.log.clear()
+        self.rate_limited = 0
+        self._chat_sends.clear()
+
+    def _message(self, params: dict) -> dict:
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text") or "",
+        }
+
+    def _over_chat_limit(self, method: str, params: dict) -> bool:
+        if not self.chat_limit or method.lower() not in self._MESSAGE_METHODS:
+            return False
+        n, window = self.chat_limit
+        now = time.monotonic()
+        sends = self._chat_sends[params.get("chat_id", "")]
+        while sends and now - sends[0] >= window:
+            sends.popleft()
+        if len(sends) >= n:
+            return True
+        sends.append(now)
+        return False
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self._track_connection(request)
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        self.log.append((method, params))
+        over_limit = self._over_chat_limit(method, params)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if over_limit or (self.error_429_rate and self._rng.random() < self.error_429_rate):
+            self.rate_limited += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+                status=429,
+            )
+
+        name = method.lower()
+        if name == "getme":
+            result = BOT_USER
+        elif name in self._MESSAGE_METHODS:
+            result = self._message(params)
+        elif name == "setwebhook":
+            self.webhook_url = params.get("url", "")
+            result = True
+        elif name == "deletewebhook":
+            self.webhook_url = ""
+            result = True
+        elif name == "getupdates":
+            result = []
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+# ─── OpenAI chat completions ──────────────────────────────────────────────────
+
+class FakeOpenAI(_FakeServer):
+    """
+    Minimal /v1/chat/completions (plain and SSE streaming).
+
+    latency          — seconds before the first byte
+    chunk_delay      — seconds between streamed chunks
+    error_429_rate   — probability of answering 429 rate_limit_exceeded
+    responder        — fn(request_body) -> reply text (default: DEFAULT_REPLY)
+    latencies        — per-request latency overrides, by arrival order (then `latency`)
+    fail_first       — answer 429 to the first N requests regardless of error_429_rate
+    tokens_per_second — simulated decode speed: a non-streamed reply of N tokens
+                       takes an extra N / tokens_per_second seconds (0 = instant)
+
+    Prompt prefix caching is simulated like the real API: prompts of at least
+    prefix_cache_min_tokens report cached_tokens for the longest previously
+    seen prefix, in 128-token steps.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        chunk_delay: float = 0.0,
+        error_429_rate: float = 0.0,
+        responder: Optional[Callable[[dict], str]] = None,
+        seed: int = 0,
+        latencies: Sequence[float] = (),
+        fail_first: int = 0,
+        prefix_cache_min_tokens: int = 1024,
+        tokens_per_second: float = 0.0,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.latencies = list(latencies)
+        self.fail_first = fail_first
+        self.prefix_cache_min_tokens = prefix_cache_min_tokens
+        self.tokens_per_second = tokens_per_second
+        self._seen_prefixes: set[int] = set()
+        self.chunk_delay = chunk_delay
+        self.error_429_rate = error_429_rate
+        self.responder = responder
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self.requests: list[dict] = []
+        self.rate_limited = 0
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle)
+        app.router.add_get("/v1/models", self._models)
+        return app
+
+    def reset(self):
+        self.requests.clear()
+        self.rate_limited = 0
+        self._seen_prefixes.clear()
+
+    async def _models(self, request: web.Request) -> web.Response:
+        self._track_connection(request)
+        return web.json_response({
+            "object": "list",
+            "data": [{"id": "gpt-4o", "object": "model", "created": 0, "owned_by": "fake"}],
+        })
+
+    _CHARS_PER_TOKEN = 4
+    _CACHE_STEP = 128  # tokens
+
+    @classmethod
+    def _tokens(cls, text: str) -> int:
+        return max(1, len(text) // cls._CHARS_PER_TOKEN)
+
+    def _cached_tokens(self, prompt: str) -> int:
+        """Longest cached prefix (tokens), then remember every prefix of this prompt."""
+        step = self._CACHE_STEP * self._CHARS_PER_TOKEN
+        start = self.prefix_cache_min_tokens * self._CHARS_PER_TOKEN
+        cached = 0
+        for end in range(start, len(prompt) + 1, step):
+            key = hash(prompt[:end])
+            if key in self._seen_prefixes:
+                cached = end // self._CHARS_PER_TOKEN
+            else:
+                self._seen_prefixes.add(key)
+        return cached
+
+    def _usage(self, body: dict, text: str) -> dict:
+        prompt = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+        prompt_tokens = self._tokens(prompt)
+        completion_tokens = self._tokens(text)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": self._cached_tokens(prompt)},
+        }
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self._track_connection(request)
+        body = await request.json()
+        index = len(self.requests)
+        self.requests.append(body)
+
+        latency = self.latencies[index] if index < len(self.latencies) else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+
+        if index < self.fail_first or (
+            self.error_429_rate and self._rng.random() < self.error_429_rate
+        ):
+            self.rate_limited += 1
+            return web.json_response(
+                {"error": {
+                    "message": "Rate limit reached",
+                    "type": "rate_limit_error",
+                    "code": "rate_limit_exceeded",
+                }},
+                status=429,
+                headers={"retry-after-ms": "10"},
+            )
+
+        text = self.responder(body) if self.responder else DEFAULT_REPLY
+        completion_id = f"chatcmpl-fake-{next(self._ids)}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o")
+
+        if not body.get("stream"):
+            if self.tokens_per_second:
+                await asyncio.sleep(self._tokens(text) / self.tokens_per_second)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": self._usage(body, text),
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            piece = word if i == 0 else " " + word
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        await response.write(f"data: {json.dumps(final)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
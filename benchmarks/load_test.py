@@ -0,0 +1,235 @@
+"""
+End-to-end load test: the real dispatcher against fake Telegram + OpenAI servers.
+
+Each synthetic user goes through /start → onboarding (name, zodiac) →
+card of day → pay for «Зеркало судьбы» → mirror spread.
+
+Run:  python -m benchmarks.load_test --users 50 --concurrency 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.fake_servers import FakeOpenAI, FakeTelegram, BOT_USER
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--concurrency", type=int, default=10)
+    p.add_argument("--tg-latency", type=float, default=0.02, help="seconds per Bot API call")
+    p.add_argument("--tg-429-rate", type=float, default=0.0)
+    p.add_argument("--openai-latency", type=float, default=0.5, help="seconds per completion")
+    p.add_argument("--openai-429-rate", type=float, default=0.0)
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+    return p.parse_args(argv)
+
+
+# ─── Synthetic updates ────────────────────────────────────────────────────────
+
+_update_ids = itertools.count(1)
+
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"U{uid}", "username": f"user{uid}"}
+
+
+def _message(uid: int, **fields) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": _user(uid),
+            **fields,
+        },
+    }
+
+
+def _callback(uid: int, data: str) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(uid),
+            "chat_instance": str(uid),
+            "data": data,
+            "message": {
+                "message_id": next(_update_ids),
+                "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"},
+                "from": BOT_USER,
+                "text": "menu",
+            },
+        },
+    }
+
+
+def _payment(uid: int, product_type: str, amount: int) -> dict:
+    return _message(uid, successful_payment={
+        "currency": "XTR",
+        "total_amount": amount,
+        "invoice_payload": product_type,
+        "telegram_payment_charge_id": f"charge-{uid}-{product_type}",
+        "provider_payment_charge_id": "",
+    })
+
+
+def journey(uid: int) -> list[dict]:
+    return [
+        _message(uid, text="/start"),
+        _message(uid, text=f"Путник {uid}"),
+        _callback(uid, "zodiac:Лев"),
+        _callback(uid, "spread_day"),
+        _message(uid, text="что меня ждёт на работе"),
+        _callback(uid, "pay:mirror"),
+        _payment(uid, "mirror", 50),
+        _message(uid, text="как сложатся отношения"),
+    ]
+
+
+# ─── Runner ───────────────────────────────────────────────────────────────────
+
+async def run(args: argparse.Namespace) -> dict:
+    tg = FakeTelegram(latency=args.tg_latency, error_429_rate=args.tg_429_rate)
+    ai = FakeOpenAI(latency=args.openai_latency, error_429_rate=args.openai_429_rate)
+    tg_url = await tg.start()
+    ai_url = await ai.start()
+
+    tmpdir = tempfile.mkdtemp(prefix="velhar-load-")
+    os.environ.update({
+        "BOT_TOKEN": "123456:fake",
+        "OPENAI_API_KEY": "sk-fake",
+        "ADMIN_ID": "0",
+        "WEBHOOK_URL": "http://localhost",
+        "DATABASE_URL": os.path.join(tmpdir, "load.db"),
+        "TELEGRAM_API_URL": tg_url,
+        "OPENAI_BASE_URL": ai_url + "/v1",
+    })
+
+    # Imported late: config.py reads the environment at import time
+    from aiogram import BaseMiddleware
+    from aiogram.types import Update
+    from bot import create_bot_and_dp
+    from database import init_db
+    from handlers import spreads
+    from services import jobs, metrics, summarizer, transport
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    class HandlerTimer(BaseMiddleware):
+        async def __call__(self, handler, event, data):
+            name = data["handler"].callback.__name__
+            metrics.incr(f"handler.{name}.calls")
+            with metrics.timer(f"handler.{name}"):
+                return await handler(event, data)
+
+    await init_db()
+    bot, dp = await create_bot_and_dp()
+    for observer in (dp.message, dp.callback_query, dp.pre_checkout_query):
+        observer.middleware(HandlerTimer())
+
+    workers = jobs.start_workers(bot, spreads.process_spread_job, spreads.on_spread_job_failed)
+    metrics.reset()
+    errors: Counter = Counter()
+    sem = asyncio.Semaphore(args.concurrency)
+    updates_fed = 0
+
+    async def drive(uid: int):
+        nonlocal updates_fed
+        async with sem:
+            for payload in journey(uid):
+                update = Update.model_validate(payload, context={"bot": bot})
+                try:
+                    with metrics.timer("update"):
+                        await dp.feed_update(bot, update)
+                except Exception as e:
+                    errors[type(e).__name__] += 1
+                updates_fed += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(drive(100_000 + i) for i in range(args.users)))
+    updates_done = time.perf_counter() - started
+    # Paid spreads finish in the job workers after their updates returned
+    await jobs.wait_idle(timeout=120)
+    elapsed = time.perf_counter() - started
+    await jobs.stop_workers(workers)
+    await summarizer.drain()
+
+    snap = metrics.snapshot()
+    report = {
+        "users": args.users,
+        "updates": updates_fed,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(updates_fed / elapsed, 2) if elapsed else None,
+        "updates_seconds": round(updates_done, 3),
+        "jobs": {k[len("jobs."):]: v for k, v in snap["counters"].items() if k.startswith("jobs.")},
+        "update_latency_ms": snap["timings"].get("update"),
+        "handlers": {
+            name[len("handler."):]: timing
+            for name, timing in snap["timings"].items()
+            if name.startswith("handler.")
+        },
+        "time_to_openai_ms": snap["timings"].get("spread.time_to_openai_ms"),
+        "db_ops_per_update": round(snap["counters"].get("db.ops", 0) / max(updates_fed, 1), 2),
+        "telegram_calls": dict(tg.calls),
+        "telegram_calls_per_update": snap["timings"].get("telegram.calls_per_update"),
+        "telegram_coalesced": snap["counters"].get("telegram.coalesced.sendChatAction", 0),
+        "telegram_429": tg.rate_limited,
+        "openai_requests": len(ai.requests),
+        "openai_429": ai.rate_limited,
+        "connections": transport.report(),
+        "errors": dict(errors),
+    }
+
+    await bot.session.close()
+    await tg.stop()
+    await ai.stop()
+    return report
+
+
+def print_report(report: dict):
+    print(f"users: {report['users']}  updates: {report['updates']}  "
+          f"time: {report['seconds']} s  → {report['updates_per_sec']} updates/s")
+    print(f"DB ops per update: {report['db_ops_per_update']}")
+    print(f"updates handled in {report['updates_seconds']} s; spread jobs: {report['jobs']}")
+    if report["time_to_openai_ms"]:
+        t = report["time_to_openai_ms"]
+        print(f"time to OpenAI request: p50 {t['p50']:.1f} ms, p99 {t['p99']:.1f} ms")
+    print(f"OpenAI requests: {report['openai_requests']} (429 injected: {report['openai_429']})")
+    print(f"Telegram calls: {sum(report['telegram_calls'].values())} "
+          f"(429 injected: {report['telegram_429']})")
+    if report["telegram_calls_per_update"]:
+        t = report["telegram_calls_per_update"]
+        print(f"  per update: mean {t['mean']:.2f}, p95 {t['p95']:.0f}; "
+              f"chat actions coalesced: {report['telegram_coalesced']:.0f}")
+    for method, n in sorted(report["telegram_calls"].items(), key=lambda kv: -kv[1]):
+        print(f"  {method:<28}{n:>6}")
+    for client, c in report["connections"].items():
+        print(f"{client} connections: {c['new_connections']} new for {c['requests']} requests "
+              f"(reuse {c['reuse_rate']:.0%})")
+    print(f"\n{'handler':<32}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, t in sorted(report["handlers"].items()):
+        print(f"{name:<32}{t['count']:>7}{t['p50']:>10.1f}{t['p99']:>10.1f}")
+    if report["errors"]:
+        print(f"\nerrors: {report['errors']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
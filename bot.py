@@ -1,5 +1,7 @@
 import asyncio
 import logging
+
+from services import startup  # first: process-start reference for startup.mark()
 from aiohttp import web
 
 from aiogram import Bot, Dispatcher
@@ -12,6 +14,8 @@ from config import config
 from database import init_db
 from handlers import start, spreads, payment, admin
 from handlers import reactions, referral, about, intent_handler
+from services import identity, jobs, lifecycle, oracle, outbound, summarizer, transport
+from services.utils import spawn
 from services.reminders import setup_scheduler
 
 logging.basicConfig(
@@ -24,9 +28,13 @@ logger = logging.getLogger(__name__)
 async def create_bot_and_dp() -> tuple[Bot, Dispatcher]:
     bot = Bot(
         token=config.bot_token,
+        session=transport.telegram_session(),
         default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN),
     )
     dp = Dispatcher(storage=MemoryStorage())
+    dp.update.outer_middleware(startup.first_update_middleware())
+    dp.update.outer_middleware(lifecycle.update_middleware())
+    dp.update.outer_middleware(outbound.update_middleware())
 
     # Register routers (order matters: FSM-aware first, catch-all last)
     dp.include_router(admin.router)
@@ -38,51 +46,86 @@ async def create_bot_and_dp() -> tuple[Bot, Dispatcher]:
     dp.include_router(spreads.router)     # SpreadState + spread callbacks
     dp.include_router(intent_handler.router)  # default_state free-text (LAST)
 
+    # Deep links need @username; fetched once here instead of per click
+    spawn(identity.get_me(bot), name="get-me")
     return bot, dp
 
 
+async def warm_up(bot: Bot):
+    """
+    Create the OpenAI client and pre-open connections, off the startup path:
+    importing openai takes ~0.5 s, so it runs in a thread while updates are
+    already being served.
+    """
+    client = await asyncio.to_thread(oracle.get_client)
+    await transport.warm_up(bot, client)
+
+
 # ─── Polling mode (local dev / testing) ──────────────────────────────────────
 
 async def run_polling():
     await init_db()
     bot, dp = await create_bot_and_dp()
+    spawn(warm_up(bot), name="warm-up")
+    spawn(summarizer.requeue_unsummarized(), name="summary-requeue")
 
     # Start APScheduler
     scheduler = setup_scheduler(bot)
     scheduler.start()
     logger.info("APScheduler started")
+    workers = jobs.start_workers(bot, spreads.process_spread_job, spreads.on_spread_job_failed)
 
+    startup.mark("ready")
     logger.info("Starting VELHAR bot in polling mode...")
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        # aiogram stops fetching on SIGTERM/SIGINT; handlers it started keep running
+        await dp.start_polling(
+            bot, allowed_updates=dp.resolve_used_update_types(), close_bot_session=False,
+        )
     finally:
-        scheduler.shutdown(wait=False)
+        await lifecycle.shutdown(workers, scheduler)
         await bot.session.close()
 
 
 # ─── Webhook mode (production) ────────────────────────────────────────────────
 
-async def run_webhook():
+async def run_webhook(handover: bool = False):
+    """
+    handover=True: zero-downtime replacement of a running instance. This
+    process gets fully ready, listens on the same port (SO_REUSEPORT), owns the
+    webhook, and only then tells the previous process (pid file) to drain.
+    The webhook is never deleted, so Telegram always has someone to deliver to.
+    Without handover the port is exclusive: an accidental second start fails
+    with EADDRINUSE instead of splitting updates (and scheduled jobs) in two.
+    """
+    lifecycle.install_signal_handlers()
     await init_db()
     bot, dp = await create_bot_and_dp()
+    if handover:
+        await warm_up(bot)
+    else:
+        spawn(warm_up(bot), name="warm-up")
+    spawn(summarizer.requeue_unsummarized(), name="summary-requeue")
 
     # Start APScheduler
     scheduler = setup_scheduler(bot)
     scheduler.start()
     logger.info("APScheduler started")
+    workers = jobs.start_workers(bot, spreads.process_spread_job, spreads.on_spread_job_failed)
 
     webhook_path = f"/webhook/{config.bot_token}"
     webhook_url  = config.webhook_url.rstrip("/") + webhook_path
 
-    await bot.set_webhook(webhook_url)
-    logger.info(f"Webhook set: {webhook_url}")
-
     app = web.Application()
 
     async def handle_telegram(request: web.Request) -> web.Response:
         data   = await request.json()
         update = Update(**data)
         await dp.feed_update(bot, update)
+        if not lifecycle.accepting():
+            # Draining: still handle what arrives on open connections, but make
+            # Telegram reconnect — to the process that now owns the port
+            return web.Response(headers={"Connection": "close"})
         return web.Response()
 
     async def health(_: web.Request) -> web.Response:
@@ -93,17 +136,27 @@ async def run_webhook():
 
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, "0.0.0.0", 8080)
-    await site.start()
-    logger.info("Webhook server listening on :8080")
-
+    site = web.TCPSite(runner, "0.0.0.0", config.webhook_port, reuse_port=handover)
     try:
-        await asyncio.Event().wait()  # run forever
+        # Fails with EADDRINUSE unless both processes asked for SO_REUSEPORT;
+        # shut down cleanly then, workers and scheduler are already running
+        await site.start()
+        logger.info(f"Webhook server listening on :{config.webhook_port}")
+
+        # Listening before registering: no update is sent to a closed port
+        await bot.set_webhook(webhook_url)
+        logger.info(f"Webhook set: {webhook_url}")
+        if handover:
+            lifecycle.retire_previous(config.pid_file)
+        lifecycle.write_pid_file(config.pid_file)
+        startup.mark("ready")
+
+        await lifecycle.wait_for_stop()
     finally:
-        scheduler.shutdown(wait=False)
-        await bot.delete_webhook()
+        await lifecycle.shutdown(workers, scheduler, stop_intake=site.stop)
         await runner.cleanup()
         await bot.session.close()
+        lifecycle.remove_pid_file(config.pid_file)
 
 
 # ─── Entry point ──────────────────────────────────────────────────────────────
@@ -112,8 +165,11 @@ if __name__ == "__main__":
     import sys
 
     mode = sys.argv[1] if len(sys.argv) > 1 else "polling"
+    handover = "--handover" in sys.argv[2:]
 
-    if mode == "webhook":
-        asyncio.run(run_webhook())
+    if mode == "--profile-startup":
+        print(startup.format_report(startup.profile_imports("bot")))
+    elif mode == "webhook":
+        asyncio.run(run_webhook(handover=handover))
     else:
         asyncio.run(run_polling())
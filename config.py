@@ -17,6 +17,102 @@ class Config:
     free_card_of_day_limit: int = 1
     free_three_paths_limit: int = 1
 
+    # Alternative API endpoints (local Bot API server, OpenAI-compatible proxy,
+    # or the fake servers in benchmarks/). Empty = official endpoints.
+    telegram_api_url: str = ""
+    openai_base_url: str = ""
+
+    # Card-of-day response cache (opt-in: cached readings are not personalised
+    # with name/question, only with card, topic, moon, time of day and zodiac)
+    card_cache_enabled: bool = False
+    card_cache_fresh_days: int = 30       # a user never sees the same entry within this window
+    card_cache_memory_keys: int = 1024    # in-process LRU size (cache keys)
+    card_cache_max_rows: int = 50_000     # SQLite tier size; least recently used rows evicted
+
+    # Pre-generated «Карта дня» pool, built overnight (off-peak) for every
+    # (card, zodiac) with the day's moon phase; served with the user's name filled in
+    card_pool_enabled: bool = False
+    card_pool_concurrency: int = 4
+    card_pool_hour: int = 1               # MSK hour of the nightly build
+
+    # OpenAI resilience (services.resilience): retries within the per-spread
+    # deadline, hedged duplicate request past the observed p95 (costs tokens),
+    # circuit breaker that fails fast while upstream keeps erroring
+    openai_max_attempts: int = 3
+    openai_hedging: bool = False
+    openai_breaker_threshold: int = 5     # consecutive failures before opening
+    openai_breaker_reset: float = 30.0    # seconds open before a trial call
+
+    # HTTP transport shared by the Bot API and OpenAI clients (services.transport)
+    http_pool_size: int = 100             # max connections per client
+    http_keepalive: float = 30.0          # idle seconds before a pooled connection is closed
+    http_connect_timeout: float = 5.0
+    http_warmup_connections: int = 2      # opened per client at startup; 0 = no warm-up
+    telegram_timeout: float = 60.0        # Bot API request timeout
+    openai_read_timeout: float = 120.0    # per request; whole-call deadlines are per spread
+    openai_http2: bool = False            # requires the h2 package
+
+    # Outbound Bot API budget (services.outbound): calls wait locally for a
+    # slot instead of running into Telegram's 429s
+    telegram_chat_rate: float = 1.0       # messages/s per private chat...
+    telegram_chat_burst: int = 5          # ...after a burst of this many
+    telegram_group_per_minute: int = 20
+    telegram_global_rate: int = 30        # messages/s across all chats
+
+    # Spread summaries (memory context) are batched: one JSON-output request
+    # per summary_batch_size spreads or per summary_window seconds
+    summary_batch_size: int = 20
+    summary_window: float = 3.0
+
+    # Token budget for the per-user session context (memories fill what's left)
+    context_token_budget: int = 300
+
+    # Single-flight guard per (user, spread type); the TTL only matters if a
+    # worker dies mid-generation — normally the lock is released on completion
+    spread_lock_ttl: float = 300.0
+
+    # Durable queue for paid spreads (services.jobs): handlers enqueue, a
+    # worker pool generates and delivers. Lease must outlive the longest
+    # spread deadline; an expired lease means the worker died and the job reruns.
+    job_workers: int = 4
+    job_lease: float = 180.0
+    job_max_attempts: int = 3
+    job_poll_interval: float = 0.5
+
+    # «Год под звёздами» as five concurrent completions (intro + 4 quarters)
+    # over one card draw, streamed section by section into the placeholder
+    year_fanout: bool = False
+
+    # Graceful shutdown (services.lifecycle): seconds to drain in-flight
+    # updates, jobs and background work after SIGTERM; keep below systemd's
+    # TimeoutStopSec (velhar.service)
+    shutdown_timeout: float = 25.0
+
+    # Webhook server; the pid file lets `bot.py webhook --handover` find and
+    # retire the instance it replaces
+    webhook_port: int = 8080
+    pid_file: str = "velhar.pid"
+
+    # Cold storage for old spreads (services.archive): nightly, spreads older
+    # than archive_after_days move compressed into a separate SQLite file
+    # (default: next to the main one), except each user's latest
+    # archive_keep_recent; the main file is VACUUMed afterwards
+    archive_enabled: bool = False
+    archive_database_url: str = ""
+    archive_after_days: int = 90
+    archive_keep_recent: int = 5          # >= the memory context window (5)
+    archive_batch_size: int = 500
+    archive_hour: int = 4                 # MSK hour of the nightly run
+
+    # Store spreads.response compressed (services.codec) with a dictionary
+    # trained on past readings: `python -m services.compression train`, then
+    # `migrate` to re-encode existing rows (with this off, migrate decompresses)
+    response_compression: bool = False
+
+    # Key of the referral-code permutation (services.refcode); empty = derived
+    # from bot_token. Set it explicitly if the token may ever be rotated.
+    referral_code_key: str = ""
+
 
 # Prices in Telegram Stars (XTR)
 PRICES_STARS = {
@@ -46,6 +142,13 @@ PRODUCT_DESCRIPTIONS = {
 }
 
 
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 def load_config() -> Config:
     return Config(
         bot_token=os.getenv("BOT_TOKEN", ""),
@@ -53,6 +156,27 @@ def load_config() -> Config:
         admin_id=int(os.getenv("ADMIN_ID", "0")),
         webhook_url=os.getenv("WEBHOOK_URL", ""),
         database_url=os.getenv("DATABASE_URL", "velhar.db"),
+        telegram_api_url=os.getenv("TELEGRAM_API_URL", ""),
+        openai_base_url=os.getenv("OPENAI_BASE_URL", ""),
+        card_cache_enabled=_env_bool("CARD_CACHE_ENABLED"),
+        card_pool_enabled=_env_bool("CARD_POOL_ENABLED"),
+        card_pool_concurrency=int(os.getenv("CARD_POOL_CONCURRENCY", "4")),
+        openai_max_attempts=int(os.getenv("OPENAI_MAX_ATTEMPTS", "3")),
+        openai_hedging=_env_bool("OPENAI_HEDGING"),
+        http_pool_size=int(os.getenv("HTTP_POOL_SIZE", "100")),
+        http_keepalive=float(os.getenv("HTTP_KEEPALIVE", "30")),
+        http_warmup_connections=int(os.getenv("HTTP_WARMUP_CONNECTIONS", "2")),
+        openai_http2=_env_bool("OPENAI_HTTP2"),
+        job_workers=int(os.getenv("JOB_WORKERS", "4")),
+        year_fanout=_env_bool("YEAR_FANOUT"),
+        shutdown_timeout=float(os.getenv("SHUTDOWN_TIMEOUT", "25")),
+        webhook_port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        pid_file=os.getenv("PID_FILE", "velhar.pid"),
+        archive_enabled=_env_bool("ARCHIVE_ENABLED"),
+        archive_database_url=os.getenv("ARCHIVE_DATABASE_URL", ""),
+        archive_after_days=int(os.getenv("ARCHIVE_AFTER_DAYS", "90")),
+        response_compression=_env_bool("RESPONSE_COMPRESSION"),
+        referral_code_key=os.getenv("REFERRAL_CODE_KEY", ""),
     )
 
 
@@ -1,16 +1,30 @@
-import secrets
+import logging
+import os
+import sqlite3
+import time
 import aiosqlite
+from contextlib import closing
 from datetime import datetime, date, timedelta
 from typing import Optional
 from config import config
+from services import codec, memory, metrics, refcode
+
+logger = logging.getLogger(__name__)
 
 
 DB_PATH = config.database_url
 
+
+def _connect():
+    """Open a connection to DB_PATH (one per helper call, counted as a DB op)."""
+    metrics.incr("db.ops")
+    return aiosqlite.connect(DB_PATH)
+
+
 # ─── Schema init + migrations ─────────────────────────────────────────────────
 
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 user_id                    INTEGER PRIMARY KEY,
@@ -54,6 +68,110 @@ async def init_db():
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
         """)
+        # Spreads whose summary batch was lost with its process (services.summarizer)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_spreads_unsummarized ON spreads(id) WHERE summary IS NULL"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                day       DATE NOT NULL,
+                metric    TEXT NOT NULL,
+                dimension TEXT NOT NULL DEFAULT '',
+                value     INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, metric, dimension)
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                id                INTEGER PRIMARY KEY AUTOINCREMENT,
+                cache_key         TEXT NOT NULL,
+                text              TEXT NOT NULL,
+                prompt_tokens     INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                latency_ms        REAL DEFAULT 0,
+                hits              INTEGER DEFAULT 0,
+                created_at        DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_used_at      DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_response_cache_key ON response_cache(cache_key)"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache_seen (
+                user_id   INTEGER NOT NULL,
+                cache_key TEXT NOT NULL,
+                entry_id  INTEGER NOT NULL,
+                seen_at   DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, cache_key, entry_id)
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS card_pool (
+                pool_date  DATE NOT NULL,
+                card       TEXT NOT NULL,
+                zodiac     TEXT NOT NULL DEFAULT '',
+                moon_phase TEXT NOT NULL,
+                text       TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (pool_date, card, zodiac)
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS spread_jobs (
+                id                     INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id                INTEGER NOT NULL,
+                chat_id                INTEGER NOT NULL,
+                spread_type            TEXT NOT NULL,
+                question               TEXT,
+                placeholder_message_id INTEGER,
+                source_message_id      INTEGER,
+                status                 TEXT NOT NULL DEFAULT 'pending',
+                attempts               INTEGER NOT NULL DEFAULT 0,
+                available_at           REAL NOT NULL,
+                lease_until            REAL,
+                worker                 TEXT,
+                spread_id              INTEGER,
+                error                  TEXT,
+                created_at             DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at             DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_spread_jobs_claim "
+            "ON spread_jobs(status, available_at)"
+        )
+        try:
+            await db.execute("ALTER TABLE spread_jobs ADD COLUMN source_message_id INTEGER")
+        except Exception:
+            pass
+        # One job per triggering message: a redelivered update is dropped, a
+        # second paid purchase of the same spread type is not
+        await db.execute("DROP INDEX IF EXISTS idx_spread_jobs_active")
+        await db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_spread_jobs_source "
+            "ON spread_jobs(chat_id, source_message_id) WHERE source_message_id IS NOT NULL"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS inflight_locks (
+                user_id     INTEGER NOT NULL,
+                spread_type TEXT NOT NULL,
+                token       TEXT NOT NULL,
+                expires_at  REAL NOT NULL,
+                PRIMARY KEY (user_id, spread_type)
+            )
+        """)
+        # Dictionaries for compressed spread responses (services.codec); the
+        # newest one compresses new rows, all of them stay for decoding
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS compression_dicts (
+                id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind       TEXT NOT NULL,
+                data       BLOB NOT NULL,
+                samples    INTEGER NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
         # Idempotent migrations for users table
         _new_cols = [
             ("daily_paid_mirror",          "INTEGER DEFAULT 0"),
@@ -67,19 +185,109 @@ async def init_db():
             ("ai_question_count",          "INTEGER DEFAULT 0"),
             ("spreads_since_memory",       "INTEGER DEFAULT 0"),
             ("velhar_state",               "TEXT DEFAULT 'calm'"),
+            ("memory_ring",                "TEXT"),
+            ("referral_count",             "INTEGER DEFAULT 0"),
         ]
+        async with db.execute("PRAGMA table_info(users)") as cur:
+            had_cols = {row[1] for row in await cur.fetchall()}
         for col, definition in _new_cols:
             try:
                 await db.execute(f"ALTER TABLE users ADD COLUMN {col} {definition}")
             except Exception:
                 pass
+        if "referral_count" not in had_cols:
+            await _backfill_referral_counts(db)
+        await _ensure_referral_code_index(db)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_subscription "
+            "ON users(subscription_until) WHERE is_subscribed = TRUE"
+        )
+        async with db.execute("SELECT 1 FROM stats_daily LIMIT 1") as cur:
+            if await cur.fetchone() is None:
+                await _backfill_stats_daily(db)
+        async with db.execute("SELECT 1 FROM users WHERE memory_ring IS NULL LIMIT 1") as cur:
+            if await cur.fetchone() is not None:
+                await _backfill_memory_rings(db)
         await db.commit()
+        await _load_compression_dicts(db)
+
+
+async def _ensure_referral_code_index(db):
+    """
+    users.referral_code is UNIQUE in CREATE TABLE, but databases that got the
+    column from a migration (ALTER TABLE can't add UNIQUE) have no index on it.
+    The old probe-then-UPDATE scheme could race into duplicates there: every
+    holder but the lowest user id loses the code and is issued a new one.
+    """
+    async with db.execute(
+        """
+        SELECT 1 FROM pragma_index_list('users') AS il
+        JOIN pragma_index_info(il.name) AS ii
+        WHERE il."unique" AND ii.name = 'referral_code'
+        """
+    ) as cur:
+        if await cur.fetchone() is not None:
+            return
+    async with db.execute(
+        """
+        UPDATE users SET referral_code = NULL
+        WHERE referral_code IS NOT NULL AND user_id NOT IN (
+            SELECT MIN(user_id) FROM users WHERE referral_code IS NOT NULL GROUP BY referral_code
+        )
+        RETURNING user_id
+        """
+    ) as cur:
+        reissued = [row[0] for row in await cur.fetchall()]
+    if reissued:
+        logger.warning(f"[referral] duplicate codes cleared for users {reissued}; they get new ones")
+    await db.execute("CREATE UNIQUE INDEX idx_users_referral_code ON users(referral_code)")
+
+
+async def _backfill_referral_counts(db):
+    """Fill users.referral_count once, right after the column is added."""
+    await db.execute(
+        """
+        UPDATE users SET referral_count = r.n
+        FROM (
+            SELECT referred_by, COUNT(*) AS n FROM users
+            WHERE referred_by IS NOT NULL GROUP BY referred_by
+        ) AS r
+        WHERE users.user_id = r.referred_by
+        """
+    )
+
+
+async def _backfill_memory_rings(db):
+    """Build users.memory_ring from spreads for users that don't have one yet."""
+    async with db.execute(
+        """
+        SELECT user_id, id, spread_type, question, summary, created_at FROM (
+            SELECT s.*, ROW_NUMBER() OVER (
+                PARTITION BY s.user_id ORDER BY s.created_at DESC, s.id DESC
+            ) AS rn
+            FROM spreads s JOIN users u ON u.user_id = s.user_id
+            WHERE u.memory_ring IS NULL
+        )
+        WHERE rn <= ?
+        ORDER BY user_id, rn DESC
+        """,
+        (memory.RING_SIZE,),
+    ) as cur:
+        rows = await cur.fetchall()
+    rings: dict[int, Optional[str]] = {}
+    for user_id, *spread in rows:
+        rings[user_id] = memory.ring_push(rings.get(user_id), memory.ring_entry(*spread))
+    await db.executemany(
+        "UPDATE users SET memory_ring = ? WHERE user_id = ?",
+        [(ring, user_id) for user_id, ring in rings.items()],
+    )
+    await db.execute("UPDATE users SET memory_ring = '[]' WHERE memory_ring IS NULL")
 
 
 # ─── User helpers ─────────────────────────────────────────────────────────────
 
 async def get_user(user_id: int) -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT * FROM users WHERE user_id = ?", (user_id,)
@@ -89,19 +297,21 @@ async def get_user(user_id: int) -> Optional[dict]:
 
 
 async def create_user(user_id: int, username: Optional[str]):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
+    async with _connect() as db:
+        cursor = await db.execute(
             """
             INSERT OR IGNORE INTO users (user_id, username, last_reset_date, last_active)
             VALUES (?, ?, ?, ?)
             """,
             (user_id, username, date.today().isoformat(), datetime.utcnow().isoformat()),
         )
+        if cursor.rowcount:
+            await _bump_stat(db, "new_users")
         await db.commit()
 
 
 async def update_username(user_id: int, username: Optional[str]):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET username = ? WHERE user_id = ?",
             (username, user_id),
@@ -110,7 +320,7 @@ async def update_username(user_id: int, username: Optional[str]):
 
 
 async def update_user_name(user_id: int, name: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET name = ? WHERE user_id = ?",
             (name, user_id),
@@ -119,7 +329,7 @@ async def update_user_name(user_id: int, name: str):
 
 
 async def update_user_zodiac(user_id: int, zodiac: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET zodiac_sign = ? WHERE user_id = ?",
             (zodiac, user_id),
@@ -128,7 +338,7 @@ async def update_user_zodiac(user_id: int, zodiac: str):
 
 
 async def update_last_active(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET last_active = ? WHERE user_id = ?",
             (datetime.utcnow().isoformat(), user_id),
@@ -137,7 +347,7 @@ async def update_last_active(user_id: int):
 
 
 async def reset_daily_counters_if_needed(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT last_reset_date FROM users WHERE user_id = ?", (user_id,)
@@ -162,7 +372,7 @@ async def reset_daily_counters_if_needed(user_id: int):
 
 
 async def increment_free_used(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET daily_free_used = daily_free_used + 1, total_spreads = total_spreads + 1 WHERE user_id = ?",
             (user_id,),
@@ -171,7 +381,7 @@ async def increment_free_used(user_id: int):
 
 
 async def increment_total_spreads(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET total_spreads = total_spreads + 1 WHERE user_id = ?",
             (user_id,),
@@ -179,26 +389,8 @@ async def increment_total_spreads(user_id: int):
         await db.commit()
 
 
-async def increment_paid_mirror(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE users SET daily_paid_mirror = daily_paid_mirror + 1, total_spreads = total_spreads + 1 WHERE user_id = ?",
-            (user_id,),
-        )
-        await db.commit()
-
-
-async def increment_paid_year(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE users SET daily_paid_year = daily_paid_year + 1, total_spreads = total_spreads + 1 WHERE user_id = ?",
-            (user_id,),
-        )
-        await db.commit()
-
-
 async def set_subscription(user_id: int, until: datetime):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET is_subscribed = TRUE, subscription_until = ? WHERE user_id = ?",
             (until.isoformat(), user_id),
@@ -209,35 +401,39 @@ async def set_subscription(user_id: int, until: datetime):
 # ─── Referral helpers ─────────────────────────────────────────────────────────
 
 async def generate_and_save_referral_code(user_id: int) -> str:
-    """Generate a unique referral code and store it. Returns the code."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Check if already has one
-        db.row_factory = aiosqlite.Row
+    """The user's referral code, issued on first call (services.refcode). Returns the code."""
+    async with _connect() as db:
         async with db.execute(
             "SELECT referral_code FROM users WHERE user_id = ?", (user_id,)
         ) as cur:
             row = await cur.fetchone()
-        if row and row["referral_code"]:
-            return row["referral_code"]
+        if row and row[0]:
+            return row[0]
 
-        for _ in range(10):
-            code = secrets.token_urlsafe(6).upper()[:8]
-            async with db.execute(
-                "SELECT user_id FROM users WHERE referral_code = ?", (code,)
-            ) as cur:
-                exists = await cur.fetchone()
-            if not exists:
-                await db.execute(
-                    "UPDATE users SET referral_code = ? WHERE user_id = ?",
-                    (code, user_id),
-                )
-                await db.commit()
-                return code
-    return secrets.token_urlsafe(8).upper()
+        # A permutation of user_id: unique by construction, no probe needed —
+        # except against codes stored under an earlier key (services.refcode)
+        code = refcode.encode(user_id)
+        try:
+            await db.execute(
+                "UPDATE users SET referral_code = ? WHERE user_id = ? AND referral_code IS NULL",
+                (code, user_id),
+            )
+        except sqlite3.IntegrityError:
+            logger.warning(
+                f"[referral] code for user {user_id} was issued under an earlier key; "
+                "using the fallback code (set REFERRAL_CODE_KEY to keep codes stable)"
+            )
+            code = refcode.encode(user_id, fallback=True)
+            await db.execute(
+                "UPDATE users SET referral_code = ? WHERE user_id = ? AND referral_code IS NULL",
+                (code, user_id),
+            )
+        await db.commit()
+        return code
 
 
 async def find_user_by_referral_code(code: str) -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT * FROM users WHERE referral_code = ?", (code.upper(),)
@@ -246,26 +442,53 @@ async def find_user_by_referral_code(code: str) -> Optional[dict]:
             return dict(row) if row else None
 
 
-async def set_referred_by(user_id: int, referrer_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
+REFERRALS_PER_BONUS = 3
+
+
+async def set_referred_by(user_id: int, referrer_id: int) -> Optional[tuple[int, bool]]:
+    """
+    Link user to referrer (only once) and, in the same commit, count the
+    referral and award a bonus spread on every REFERRALS_PER_BONUS-th one.
+    Returns (referrer's referral_count, bonus awarded), or None if the user
+    was already referred or the referrer is gone.
+    """
+    async with _connect() as db:
+        cursor = await db.execute(
             "UPDATE users SET referred_by = ? WHERE user_id = ? AND referred_by IS NULL",
             (referrer_id, user_id),
         )
+        if not cursor.rowcount:
+            return None
+        # SET expressions see the old referral_count, RETURNING the new one
+        async with db.execute(
+            """
+            UPDATE users SET
+                referral_count = referral_count + 1,
+                referral_bonuses_available = referral_bonuses_available
+                    + ((referral_count + 1) % ? = 0)
+            WHERE user_id = ?
+            RETURNING referral_count
+            """,
+            (REFERRALS_PER_BONUS, referrer_id),
+        ) as cur:
+            row = await cur.fetchone()
         await db.commit()
+    if row is None:
+        return None
+    return row[0], row[0] % REFERRALS_PER_BONUS == 0
 
 
 async def count_referrals(referrer_id: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         async with db.execute(
-            "SELECT COUNT(*) as cnt FROM users WHERE referred_by = ?", (referrer_id,)
+            "SELECT referral_count FROM users WHERE user_id = ?", (referrer_id,)
         ) as cur:
             row = await cur.fetchone()
-            return row[0] if row else 0
+            return (row[0] or 0) if row else 0
 
 
 async def add_referral_bonus(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET referral_bonuses_available = referral_bonuses_available + 1 WHERE user_id = ?",
             (user_id,),
@@ -275,7 +498,7 @@ async def add_referral_bonus(user_id: int):
 
 async def use_referral_bonus(user_id: int) -> bool:
     """Consume one referral bonus. Returns True if bonus was available."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT referral_bonuses_available FROM users WHERE user_id = ?", (user_id,)
@@ -293,63 +516,165 @@ async def use_referral_bonus(user_id: int) -> bool:
 
 # ─── Spreads helpers ──────────────────────────────────────────────────────────
 
+def _encode_response(response: str) -> str | bytes:
+    return codec.encode(response) if config.response_compression else response
+
+
+def _spread_row(row) -> dict:
+    spread = dict(row)
+    spread["response"] = codec.decode(spread["response"])
+    return spread
+
+
+# save_spread(counter=...): usage counters bumped in the spread's own commit
+SPREAD_COUNTERS = {
+    "total":  "total_spreads = total_spreads + 1",
+    "mirror": "daily_paid_mirror = daily_paid_mirror + 1, total_spreads = total_spreads + 1",
+    "year":   "daily_paid_year = daily_paid_year + 1, total_spreads = total_spreads + 1",
+}
+
+
 async def save_spread(
     user_id: int,
     spread_type: str,
     question: Optional[str],
     response: str,
     summary: Optional[str] = None,
+    memory_used: Optional[bool] = None,
+    job_id: Optional[int] = None,
+    counter: Optional[str] = None,
 ) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
+    """
+    Insert a spread and push it onto the user's memory ring (services.memory).
+    When memory_used is given, the user's memory counter and
+    last_active are settled in the same commit (see handlers.spreads). When
+    job_id is given, the spread is linked to its queue job in the same commit,
+    so a retried job never generates twice; counter (a SPREAD_COUNTERS key)
+    is bumped in that commit too, so it is never skipped or doubled.
+    """
+    async with _connect() as db:
+        async with db.execute(
             """
             INSERT INTO spreads (user_id, spread_type, question, response, summary)
             VALUES (?, ?, ?, ?, ?)
+            RETURNING id, created_at
             """,
-            (user_id, spread_type, question, response, summary),
+            (user_id, spread_type, question, _encode_response(response), summary),
+        ) as cur:
+            spread_id, created_at = await cur.fetchone()
+        await _bump_stat(db, "spreads", spread_type)
+        async with db.execute("SELECT memory_ring FROM users WHERE user_id = ?", (user_id,)) as cur:
+            row = await cur.fetchone()
+        if row is not None:
+            entry = memory.ring_entry(spread_id, spread_type, question, summary, created_at)
+            await db.execute(
+                "UPDATE users SET memory_ring = ? WHERE user_id = ?",
+                (memory.ring_push(row[0], entry), user_id),
+            )
+        if memory_used is not None:
+            await db.execute(
+                """
+                UPDATE users
+                SET spreads_since_memory = CASE WHEN ? THEN 0 ELSE spreads_since_memory + 1 END,
+                    last_active = ?
+                WHERE user_id = ?
+                """,
+                (memory_used, datetime.utcnow().isoformat(), user_id),
+            )
+        if counter is not None:
+            await db.execute(
+                f"UPDATE users SET {SPREAD_COUNTERS[counter]} WHERE user_id = ?", (user_id,),
+            )
+        if job_id is not None:
+            await db.execute(
+                "UPDATE spread_jobs SET spread_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (spread_id, job_id),
+            )
+        await db.commit()
+        return spread_id
+
+
+async def get_unsummarized_spreads(limit: int) -> list[tuple[int, str]]:
+    """(id, response) of the latest spreads still without a summary."""
+    async with _connect() as db:
+        async with db.execute(
+            "SELECT id, response FROM spreads WHERE summary IS NULL ORDER BY id DESC LIMIT ?",
+            (limit,),
+        ) as cur:
+            rows = await cur.fetchall()
+    return [(spread_id, codec.decode(response)) for spread_id, response in rows]
+
+
+async def set_spread_summaries(summaries: list[tuple[int, str]]):
+    """
+    Bulk-fill spreads.summary from (spread_id, summary) pairs (services.summarizer),
+    and the matching memory ring entries in the same commit.
+    """
+    by_id = dict(summaries)
+    async with _connect() as db:
+        await db.executemany(
+            "UPDATE spreads SET summary = ? WHERE id = ?",
+            [(summary, spread_id) for spread_id, summary in summaries],
         )
+        marks = ",".join("?" * len(by_id))
+        async with db.execute(
+            f"""
+            SELECT user_id, memory_ring FROM users
+            WHERE user_id IN (SELECT DISTINCT user_id FROM spreads WHERE id IN ({marks}))
+            """,
+            tuple(by_id),
+        ) as cur:
+            rings = await cur.fetchall()
+        updates = []
+        for user_id, ring in rings:
+            patched = memory.ring_set_summaries(ring, by_id)
+            if patched is not None:
+                updates.append((patched, user_id))
+        await db.executemany("UPDATE users SET memory_ring = ? WHERE user_id = ?", updates)
         await db.commit()
-        return cursor.lastrowid
 
 
 async def get_spread_by_id(spread_id: int) -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Hot table first, then the archive (see archive_spreads)."""
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT * FROM spreads WHERE id = ?", (spread_id,)
         ) as cur:
             row = await cur.fetchone()
-            return dict(row) if row else None
+    if row:
+        return _spread_row(row)
+    return await get_archived_spread(spread_id)
 
 
 async def get_recent_spreads(user_id: int, limit: int = 3) -> list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT * FROM spreads WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
             (user_id, limit),
         ) as cur:
             rows = await cur.fetchall()
-            return [dict(r) for r in rows]
+            return [_spread_row(r) for r in rows]
 
 
 async def get_spreads_last_7_days(user_id: int) -> list[dict]:
     since = (datetime.utcnow() - timedelta(days=7)).isoformat()
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT * FROM spreads WHERE user_id = ? AND created_at >= ? ORDER BY created_at",
             (user_id, since),
         ) as cur:
             rows = await cur.fetchall()
-            return [dict(r) for r in rows]
+            return [_spread_row(r) for r in rows]
 
 
 # ─── Reminder helpers ─────────────────────────────────────────────────────────
 
 async def get_inactive_users(days: int = 3) -> list[dict]:
     threshold = (datetime.utcnow() - timedelta(days=days)).isoformat()
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             """
@@ -366,7 +691,7 @@ async def get_inactive_users(days: int = 3) -> list[dict]:
 async def get_all_active_users() -> list[dict]:
     """Users who were active in the last 30 days."""
     threshold = (datetime.utcnow() - timedelta(days=30)).isoformat()
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT * FROM users WHERE last_active >= ?", (threshold,)
@@ -377,7 +702,7 @@ async def get_all_active_users() -> list[dict]:
 
 async def get_users_with_spreads_this_week() -> list[dict]:
     since = (datetime.utcnow() - timedelta(days=7)).isoformat()
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             """
@@ -399,7 +724,7 @@ async def create_payment(
     payment_id: str,
     product_type: str,
 ) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cursor = await db.execute(
             """
             INSERT INTO payments (user_id, amount, payment_id, status, product_type)
@@ -412,16 +737,25 @@ async def create_payment(
 
 
 async def update_payment_status(payment_id: str, status: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE payments SET status = ? WHERE payment_id = ?",
-            (status, payment_id),
+    async with _connect() as db:
+        cursor = await db.execute(
+            "UPDATE payments SET status = ? WHERE payment_id = ? AND status IS NOT ?",
+            (status, payment_id, status),
         )
+        if cursor.rowcount and status == "succeeded":
+            async with db.execute(
+                "SELECT amount, product_type FROM payments WHERE payment_id = ?",
+                (payment_id,),
+            ) as cur:
+                row = await cur.fetchone()
+            if row:
+                await _bump_stat(db, "payments", row[1] or "")
+                await _bump_stat(db, "revenue", row[1] or "", row[0] or 0)
         await db.commit()
 
 
 async def get_payment_by_id(payment_id: str) -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT * FROM payments WHERE payment_id = ?", (payment_id,)
@@ -434,7 +768,7 @@ async def get_payment_by_id(payment_id: str) -> Optional[dict]:
 
 async def increment_ai_question_count(user_id: int) -> int:
     """Increment and return the new ai_question_count."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET ai_question_count = ai_question_count + 1 WHERE user_id = ?",
             (user_id,),
@@ -449,7 +783,7 @@ async def increment_ai_question_count(user_id: int) -> int:
 
 async def set_velhar_state(user_id: int, state: str):
     """Set velhar_state: 'calm' or 'cold'."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET velhar_state = ? WHERE user_id = ?",
             (state, user_id),
@@ -459,7 +793,7 @@ async def set_velhar_state(user_id: int, state: str):
 
 async def reset_velhar_state(user_id: int):
     """Reset to calm state and clear AI question counter."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET velhar_state = 'calm', ai_question_count = 0 WHERE user_id = ?",
             (user_id,),
@@ -468,7 +802,7 @@ async def reset_velhar_state(user_id: int):
 
 
 async def increment_spreads_since_memory(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET spreads_since_memory = spreads_since_memory + 1 WHERE user_id = ?",
             (user_id,),
@@ -477,7 +811,7 @@ async def increment_spreads_since_memory(user_id: int):
 
 
 async def reset_spreads_since_memory(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE users SET spreads_since_memory = 0 WHERE user_id = ?",
             (user_id,),
@@ -485,43 +819,681 @@ async def reset_spreads_since_memory(user_id: int):
         await db.commit()
 
 
-# ─── Stats ────────────────────────────────────────────────────────────────────
+# ─── Response cache helpers ───────────────────────────────────────────────────
 
-async def get_stats() -> dict:
-    async with aiosqlite.connect(DB_PATH) as db:
+async def get_cache_entries(cache_key: str) -> list[dict]:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
+        async with db.execute(
+            "SELECT * FROM response_cache WHERE cache_key = ? ORDER BY id", (cache_key,)
+        ) as cur:
+            rows = await cur.fetchall()
+            return [dict(r) for r in rows]
 
-        async with db.execute("SELECT COUNT(*) as cnt FROM users") as cur:
-            total_users = (await cur.fetchone())["cnt"]
 
+async def get_seen_cache_entry_ids(user_id: int, cache_key: str, fresh_days: int) -> set[int]:
+    """Entries this user was served for cache_key within the freshness window."""
+    async with _connect() as db:
         async with db.execute(
-            "SELECT COUNT(*) as cnt FROM users WHERE is_subscribed = TRUE AND subscription_until > datetime('now')"
+            """
+            SELECT entry_id FROM response_cache_seen
+            WHERE user_id = ? AND cache_key = ? AND seen_at >= datetime('now', ?)
+            """,
+            (user_id, cache_key, f"-{fresh_days} days"),
         ) as cur:
-            active_subs = (await cur.fetchone())["cnt"]
+            return {row[0] for row in await cur.fetchall()}
+
+
+async def mark_cache_entry_served(user_id: int, cache_key: str, entry_id: int, hit: bool):
+    async with _connect() as db:
+        await db.execute(
+            """
+            INSERT INTO response_cache_seen (user_id, cache_key, entry_id, seen_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(user_id, cache_key, entry_id) DO UPDATE SET seen_at = CURRENT_TIMESTAMP
+            """,
+            (user_id, cache_key, entry_id),
+        )
+        if hit:
+            await db.execute(
+                "UPDATE response_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (entry_id,),
+            )
+        await db.commit()
+
+
+async def add_cache_entry(
+    cache_key: str,
+    text: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    latency_ms: float,
+    max_rows: int,
+    fresh_days: int,
+) -> tuple[int, set[str]]:
+    """
+    Insert an entry; trims the table to max_rows by least recent use.
+    Returns the new id and the cache keys that lost rows to the trim.
+    """
+    async with _connect() as db:
+        cursor = await db.execute(
+            """
+            INSERT INTO response_cache (cache_key, text, prompt_tokens, completion_tokens, latency_ms)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (cache_key, text, prompt_tokens, completion_tokens, latency_ms),
+        )
+        entry_id = cursor.lastrowid
+        evicted: set[str] = set()
+        if entry_id > max_rows:
+            cursor = await db.execute(
+                """
+                DELETE FROM response_cache WHERE id IN (
+                    SELECT id FROM response_cache ORDER BY last_used_at ASC, id ASC
+                    LIMIT max(0, (SELECT COUNT(*) FROM response_cache) - ?)
+                )
+                RETURNING cache_key
+                """,
+                (max_rows,),
+            )
+            evicted = {row[0] for row in await cursor.fetchall()}
+            await db.execute(
+                "DELETE FROM response_cache_seen WHERE seen_at < datetime('now', ?)",
+                (f"-{fresh_days} days",),
+            )
+        await db.commit()
+        return entry_id, evicted
 
-        month_start = date.today().replace(day=1).isoformat()
+
+async def get_response_cache_report() -> dict:
+    """All-time totals of the SQLite tier: entries (misses) vs hits and their savings."""
+    async with _connect() as db:
         async with db.execute(
-            "SELECT COALESCE(SUM(amount), 0) as revenue FROM payments WHERE status = 'succeeded' AND created_at >= ?",
-            (month_start,),
+            """
+            SELECT COUNT(*),
+                   COALESCE(SUM(hits), 0),
+                   COALESCE(SUM(hits * latency_ms), 0),
+                   COALESCE(SUM(hits * (prompt_tokens + completion_tokens)), 0)
+            FROM response_cache
+            """
         ) as cur:
-            month_revenue = (await cur.fetchone())["revenue"]
+            entries, hits, latency_saved_ms, tokens_saved = await cur.fetchone()
+    served = entries + hits
+    return {
+        "entries": entries,
+        "hits": hits,
+        "hit_rate": hits / served if served else 0.0,
+        "latency_saved_ms": latency_saved_ms,
+        "tokens_saved": tokens_saved,
+    }
 
-        today = date.today().isoformat()
+
+# ─── Card-of-day pool helpers ─────────────────────────────────────────────────
+
+async def get_card_pool_keys(pool_date: date) -> set[tuple[str, str]]:
+    """(card, zodiac) pairs already generated for pool_date."""
+    async with _connect() as db:
+        async with db.execute(
+            "SELECT card, zodiac FROM card_pool WHERE pool_date = ?", (pool_date.isoformat(),)
+        ) as cur:
+            return {(row[0], row[1]) for row in await cur.fetchall()}
+
+
+async def save_card_pool_entry(pool_date: date, card: str, zodiac: str, moon_phase: str, text: str):
+    async with _connect() as db:
+        await db.execute(
+            """
+            INSERT OR IGNORE INTO card_pool (pool_date, card, zodiac, moon_phase, text)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (pool_date.isoformat(), card, zodiac, moon_phase, text),
+        )
+        await db.commit()
+
+
+async def get_card_pool_text(pool_date: date, card: str, zodiac: str, moon_phase: str) -> Optional[str]:
+    async with _connect() as db:
         async with db.execute(
-            "SELECT COALESCE(SUM(daily_free_used + daily_paid_mirror + daily_paid_year), 0) as cnt FROM users WHERE last_reset_date = ?",
-            (today,),
+            """
+            SELECT text FROM card_pool
+            WHERE pool_date = ? AND card = ? AND zodiac = ? AND moon_phase = ?
+            """,
+            (pool_date.isoformat(), card, zodiac, moon_phase),
+        ) as cur:
+            row = await cur.fetchone()
+            return row[0] if row else None
+
+
+async def delete_card_pool_before(pool_date: date) -> int:
+    async with _connect() as db:
+        cursor = await db.execute(
+            "DELETE FROM card_pool WHERE pool_date < ?", (pool_date.isoformat(),)
+        )
+        await db.commit()
+        return cursor.rowcount
+
+
+# ─── Spread job queue (services.jobs) ─────────────────────────────────────────
+
+async def enqueue_spread_job(
+    user_id: int,
+    chat_id: int,
+    spread_type: str,
+    question: Optional[str],
+    placeholder_message_id: Optional[int],
+    source_message_id: Optional[int] = None,
+) -> Optional[int]:
+    """New pending job id, or None if a job for this source message already exists."""
+    async with _connect() as db:
+        cursor = await db.execute(
+            """
+            INSERT OR IGNORE INTO spread_jobs
+                (user_id, chat_id, spread_type, question, placeholder_message_id,
+                 source_message_id, available_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (user_id, chat_id, spread_type, question, placeholder_message_id,
+             source_message_id, time.time()),
+        )
+        await db.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+
+
+async def claim_spread_job(worker: str, lease: float, max_attempts: int) -> Optional[dict]:
+    """
+    Atomically lease the oldest runnable job: pending and due, or running with
+    an expired lease (its worker died). Bumps attempts.
+    """
+    now = time.time()
+    async with _connect() as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            """
+            UPDATE spread_jobs
+            SET status = 'running', attempts = attempts + 1, lease_until = ?,
+                worker = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM spread_jobs
+                WHERE attempts < ?
+                  AND ((status = 'pending' AND available_at <= ?)
+                       OR (status = 'running' AND lease_until < ?))
+                ORDER BY id LIMIT 1
+            )
+            RETURNING *
+            """,
+            (now + lease, worker, max_attempts, now, now),
         ) as cur:
-            spreads_today = (await cur.fetchone())["cnt"]
+            row = await cur.fetchone()
+        await db.commit()
+        return dict(row) if row else None
+
 
+async def finish_spread_job(job_id: int, worker: str) -> bool:
+    """Mark done; False if the lease was lost to another worker meanwhile."""
+    async with _connect() as db:
+        cursor = await db.execute(
+            """
+            UPDATE spread_jobs SET status = 'done', lease_until = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND worker = ? AND status = 'running'
+            """,
+            (job_id, worker),
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
+
+async def retry_or_fail_spread_job(
+    job_id: int, worker: str, error: str, retry_at: float, max_attempts: int,
+) -> Optional[str]:
+    """Back to pending (due at retry_at) or failed once attempts run out; returns new status."""
+    async with _connect() as db:
+        db.row_factory = aiosqlite.Row
         async with db.execute(
-            "SELECT COALESCE(SUM(total_spreads), 0) as cnt FROM users"
+            """
+            UPDATE spread_jobs
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                available_at = ?, lease_until = NULL, error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND worker = ? AND status = 'running'
+            RETURNING status
+            """,
+            (max_attempts, retry_at, error[:500], job_id, worker),
         ) as cur:
-            spreads_total = (await cur.fetchone())["cnt"]
+            row = await cur.fetchone()
+        await db.commit()
+        return row["status"] if row else None
 
+
+async def release_spread_job(job_id: int, worker: str) -> bool:
+    """
+    Hand a job interrupted by shutdown back to the queue right away: pending,
+    attempt not counted (it did not fail), no need to wait out the lease.
+    """
+    async with _connect() as db:
+        cursor = await db.execute(
+            """
+            UPDATE spread_jobs
+            SET status = 'pending', attempts = MAX(attempts - 1, 0), available_at = ?,
+                lease_until = NULL, worker = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND worker = ? AND status = 'running'
+            """,
+            (time.time(), job_id, worker),
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
+
+async def fail_abandoned_spread_jobs(max_attempts: int) -> list[dict]:
+    """Running jobs whose last allowed attempt's lease expired → failed; returns them."""
+    async with _connect() as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            """
+            UPDATE spread_jobs
+            SET status = 'failed', error = COALESCE(error, 'lease expired'),
+                lease_until = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND lease_until < ? AND attempts >= ?
+            RETURNING *
+            """,
+            (time.time(), max_attempts),
+        ) as cur:
+            rows = await cur.fetchall()
+        await db.commit()
+        return [dict(r) for r in rows]
+
+
+async def get_spread_job_counts() -> dict:
+    async with _connect() as db:
+        async with db.execute(
+            "SELECT status, COUNT(*) FROM spread_jobs GROUP BY status"
+        ) as cur:
+            return {status: n for status, n in await cur.fetchall()}
+
+
+# ─── In-flight generation locks (services.singleflight) ──────────────────────
+
+async def try_acquire_inflight_lock(
+    user_id: int, spread_type: str, token: str, ttl: float,
+) -> bool:
+    """Take the (user_id, spread_type) lock unless another holder's lock is still live."""
+    now = time.time()
+    async with _connect() as db:
+        cursor = await db.execute(
+            """
+            INSERT INTO inflight_locks (user_id, spread_type, token, expires_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id, spread_type) DO UPDATE
+            SET token = excluded.token, expires_at = excluded.expires_at
+            WHERE inflight_locks.expires_at <= ?
+            """,
+            (user_id, spread_type, token, now + ttl, now),
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
+
+async def release_inflight_lock(user_id: int, spread_type: str, token: str):
+    async with _connect() as db:
+        await db.execute(
+            "DELETE FROM inflight_locks WHERE user_id = ? AND spread_type = ? AND token = ?",
+            (user_id, spread_type, token),
+        )
+        await db.commit()
+
+
+# ─── Spread archive (services.archive) ────────────────────────────────────────
+#
+# Spreads past config.archive_after_days move to spreads_archive in a separate
+# SQLite file, response compressed (services.codec). Each user's latest
+# archive_keep_recent spreads stay hot, so memory context and the weekly
+# summary never need the archive; get_spread_by_id falls back to it.
+
+def archive_path() -> str:
+    if config.archive_database_url:
+        return config.archive_database_url
+    root, _ = os.path.splitext(DB_PATH)
+    return root + ".archive.db"
+
+
+_ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archive.spreads_archive (
+        id          INTEGER PRIMARY KEY,
+        user_id     INTEGER NOT NULL,
+        spread_type TEXT NOT NULL,
+        question    TEXT,
+        response    BLOB NOT NULL,
+        summary     TEXT,
+        created_at  DATETIME,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def _archive_blob(response: str | bytes) -> bytes:
+    return response if isinstance(response, bytes) else codec.compress(response)
+
+
+async def archive_spreads(before: datetime, keep_recent: int, limit: int) -> int:
+    """
+    Move up to `limit` spreads created before `before` (UTC) into the archive,
+    keeping each user's newest keep_recent (at least 1) and any spread a live
+    job still has to deliver. Insert and delete commit together (the archive
+    is ATTACHed), so a crash never loses or duplicates a row. Returns rows moved.
+    """
+    async with _connect() as db:
+        await db.execute("ATTACH DATABASE ? AS archive", (archive_path(),))
+        await db.execute(_ARCHIVE_SCHEMA)
+        async with db.execute(
+            """
+            SELECT id, user_id, spread_type, question, response, summary, created_at
+            FROM (
+                SELECT s.*, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS rn
+                FROM spreads s
+            )
+            WHERE rn > ? AND created_at < ?
+              AND id NOT IN (
+                  SELECT spread_id FROM spread_jobs
+                  WHERE status IN ('pending', 'running') AND spread_id IS NOT NULL
+              )
+            ORDER BY id
+            LIMIT ?
+            """,
+            (max(keep_recent, 1), before.strftime("%Y-%m-%d %H:%M:%S"), limit),
+        ) as cur:
+            rows = await cur.fetchall()
+        if rows:
+            await db.executemany(
+                """
+                INSERT OR REPLACE INTO archive.spreads_archive
+                    (id, user_id, spread_type, question, response, summary, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(*r[:4], _archive_blob(r[4]), *r[5:]) for r in rows],
+            )
+            await db.executemany("DELETE FROM spreads WHERE id = ?", [(r[0],) for r in rows])
+            await db.commit()
+        return len(rows)
+
+
+async def get_archived_spread(spread_id: int) -> Optional[dict]:
+    """Archived spread in the same shape as a spreads row, or None."""
+    path = archive_path()
+    if not os.path.exists(path):
+        return None
+    metrics.incr("db.ops")
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            """
+            SELECT id, user_id, spread_type, question, response, summary, created_at
+            FROM spreads_archive WHERE id = ?
+            """,
+            (spread_id,),
+        ) as cur:
+            row = await cur.fetchone()
+    if row is None:
+        return None
+    return _spread_row(row)
+
+
+async def get_storage_report() -> dict:
+    """Row counts and file sizes of the hot database and the archive."""
+    async with _connect() as db:
+        async with db.execute("SELECT COUNT(*) FROM spreads") as cur:
+            hot_rows = (await cur.fetchone())[0]
+    path = archive_path()
+    archive_rows = 0
+    if os.path.exists(path):
+        metrics.incr("db.ops")
+        async with aiosqlite.connect(path) as db:
+            async with db.execute("SELECT COUNT(*) FROM spreads_archive") as cur:
+                archive_rows = (await cur.fetchone())[0]
+    return {
+        "hot_rows":      hot_rows,
+        "hot_bytes":     os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0,
+        "archive_rows":  archive_rows,
+        "archive_bytes": os.path.getsize(path) if os.path.exists(path) else 0,
+    }
+
+
+# ─── Response compression (services.compression) ──────────────────────────────
+#
+# spreads.response holds either plain text or a codec blob (SQLite keeps the
+# BLOB as is despite the TEXT column); readers decode through _spread_row.
+
+async def _load_compression_dicts(db):
+    codec.reset()
+    async with db.execute("SELECT id, kind, data FROM compression_dicts ORDER BY id") as cur:
+        rows = await cur.fetchall()
+    for dict_id, kind, data in rows:
+        codec.load_dictionary(dict_id, kind, data, active=True)
+
+
+def _fetch_compression_dict(dict_id: int) -> Optional[tuple[str, bytes]]:
+    # Synchronous but rare: only for a dictionary trained after this process loaded its set
+    try:
+        with closing(sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)) as conn:
+            return conn.execute(
+                "SELECT kind, data FROM compression_dicts WHERE id = ?", (dict_id,)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+
+
+codec.set_loader(_fetch_compression_dict)
+
+
+async def save_compression_dict(kind: str, data: bytes, samples: int) -> int:
+    """Store a dictionary and make it the one new rows are compressed with."""
+    async with _connect() as db:
+        cursor = await db.execute(
+            "INSERT INTO compression_dicts (kind, data, samples) VALUES (?, ?, ?)",
+            (kind, data, samples),
+        )
+        await db.commit()
+    codec.load_dictionary(cursor.lastrowid, kind, data, active=True)
+    return cursor.lastrowid
+
+
+async def get_response_samples(limit: int) -> list[str]:
+    """The latest `limit` spread texts (dictionary training input)."""
+    async with _connect() as db:
+        async with db.execute(
+            "SELECT response FROM spreads ORDER BY id DESC LIMIT ?", (limit,)
+        ) as cur:
+            rows = await cur.fetchall()
+    return [codec.decode(r[0]) for r in rows]
+
+
+async def recompress_spreads(after_id: int, limit: int) -> tuple[Optional[int], int]:
+    """
+    Re-encode up to `limit` spreads with id > after_id with the current
+    settings (active dictionary, or plain text when compression is off).
+    Returns (last id seen — None when there is nothing left, rows rewritten).
+    """
+    async with _connect() as db:
+        async with db.execute(
+            "SELECT id, response FROM spreads WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ) as cur:
+            rows = await cur.fetchall()
+        if not rows:
+            return None, 0
+        updates = []
+        for spread_id, stored in rows:
+            encoded = _encode_response(codec.decode(stored))
+            if encoded != stored:
+                updates.append((encoded, spread_id))
+        if updates:
+            await db.executemany("UPDATE spreads SET response = ? WHERE id = ?", updates)
+            await db.commit()
+        return rows[-1][0], len(updates)
+
+
+async def get_response_storage_report() -> dict:
+    """How spreads.response is stored, plus the main file's page usage."""
+    async with _connect() as db:
+        async with db.execute(
+            """
+            SELECT COUNT(*),
+                   COALESCE(SUM(typeof(response) = 'blob'), 0),
+                   COALESCE(SUM(length(CAST(response AS BLOB))), 0)
+            FROM spreads
+            """
+        ) as cur:
+            rows, compressed, response_bytes = await cur.fetchone()
+        pragmas = {}
+        for name in ("page_size", "page_count", "freelist_count"):
+            async with db.execute(f"PRAGMA {name}") as cur:
+                pragmas[name] = (await cur.fetchone())[0]
     return {
-        "total_users": total_users,
+        "rows":           rows,
+        "compressed":     compressed,
+        "response_bytes": response_bytes,
+        "dictionary":     codec.active_dictionary(),
+        **pragmas,
+    }
+
+
+# ─── Maintenance ──────────────────────────────────────────────────────────────
+
+async def checkpoint() -> tuple[int, int, int]:
+    """
+    Fold the WAL (if any) back into the main file and refresh planner stats;
+    run at shutdown so the next start opens a clean database.
+    Returns SQLite's (busy, wal_frames, checkpointed_frames); (0, -1, -1) outside WAL mode.
+    """
+    async with _connect() as db:
+        async with db.execute("PRAGMA wal_checkpoint(TRUNCATE)") as cur:
+            row = await cur.fetchone()
+        await db.execute("PRAGMA optimize")
+        return tuple(row)
+
+
+async def vacuum():
+    """
+    Rebuild the main file so pages freed by archive_spreads go back to the
+    filesystem. Blocks writers while it runs — schedule off-peak.
+    """
+    async with _connect() as db:
+        await db.execute("VACUUM")
+        await db.execute("PRAGMA optimize")
+
+
+# ─── Stats ────────────────────────────────────────────────────────────────────
+#
+# /stats reads the stats_daily rollup instead of scanning users/payments/spreads.
+# Rows are (day, metric, dimension) counters bumped in the same transaction as
+# the write they describe:
+#   new_users / ''            — users created
+#   spreads   / spread_type   — spreads saved
+#   payments  / product_type  — succeeded payments
+#   revenue   / product_type  — succeeded payment amounts
+
+_STATS_TTL = 60.0
+_stats_cache: dict[str, tuple[float, dict]] = {}
+
+
+async def _bump_stat(db, metric: str, dimension: str = "", value: int = 1):
+    await db.execute(
+        """
+        INSERT INTO stats_daily (day, metric, dimension, value)
+        VALUES (date('now'), ?, ?, ?)
+        ON CONFLICT(day, metric, dimension) DO UPDATE SET value = value + excluded.value
+        """,
+        (metric, dimension, value),
+    )
+
+
+async def _backfill_stats_daily(db):
+    """One-time rollup of existing rows (databases created before stats_daily)."""
+    await db.execute("""
+        INSERT INTO stats_daily (day, metric, dimension, value)
+        SELECT date(created_at), 'new_users', '', COUNT(*)
+        FROM users WHERE created_at IS NOT NULL GROUP BY date(created_at)
+    """)
+    await db.execute("""
+        INSERT INTO stats_daily (day, metric, dimension, value)
+        SELECT date(created_at), 'spreads', spread_type, COUNT(*)
+        FROM spreads GROUP BY date(created_at), spread_type
+    """)
+    await db.execute("""
+        INSERT INTO stats_daily (day, metric, dimension, value)
+        SELECT date(created_at), 'payments', COALESCE(product_type, ''), COUNT(*)
+        FROM payments WHERE status = 'succeeded'
+        GROUP BY date(created_at), COALESCE(product_type, '')
+    """)
+    await db.execute("""
+        INSERT INTO stats_daily (day, metric, dimension, value)
+        SELECT date(created_at), 'revenue', COALESCE(product_type, ''), COALESCE(SUM(amount), 0)
+        FROM payments WHERE status = 'succeeded'
+        GROUP BY date(created_at), COALESCE(product_type, '')
+    """)
+
+
+async def get_stats_daily(days: int = 7) -> list[dict]:
+    """Per-day rollup rows for the last `days` days (today included), oldest first."""
+    async with _connect() as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            """
+            SELECT day, metric, dimension, value FROM stats_daily
+            WHERE day >= date('now', ?)
+            ORDER BY day, metric, dimension
+            """,
+            (f"-{days - 1} days",),
+        ) as cur:
+            rows = await cur.fetchall()
+            return [dict(r) for r in rows]
+
+
+async def get_stats() -> dict:
+    cached = _stats_cache.get(DB_PATH)
+    if cached and time.monotonic() - cached[0] < _STATS_TTL:
+        return cached[1]
+
+    async with _connect() as db:
+        db.row_factory = aiosqlite.Row
+
+        async with db.execute(
+            """
+            SELECT
+                COALESCE(SUM(CASE WHEN metric = 'new_users' THEN value END), 0) AS total_users,
+                COALESCE(SUM(CASE WHEN metric = 'spreads' THEN value END), 0) AS spreads_total,
+                COALESCE(SUM(CASE WHEN metric = 'spreads' AND day = date('now') THEN value END), 0) AS spreads_today,
+                COALESCE(SUM(CASE WHEN metric = 'revenue' AND day >= date('now', 'start of month') THEN value END), 0) AS month_revenue
+            FROM stats_daily
+            """
+        ) as cur:
+            totals = dict(await cur.fetchone())
+
+        async with db.execute(
+            "SELECT COUNT(*) as cnt FROM users WHERE is_subscribed = TRUE AND subscription_until > datetime('now')"
+        ) as cur:
+            active_subs = (await cur.fetchone())["cnt"]
+
+        async with db.execute(
+            """
+            SELECT dimension, SUM(value) AS value FROM stats_daily
+            WHERE metric = 'revenue' AND day >= date('now', 'start of month')
+            GROUP BY dimension ORDER BY value DESC
+            """
+        ) as cur:
+            revenue_by_product = {r["dimension"]: r["value"] for r in await cur.fetchall()}
+
+    by_day: dict[str, dict] = {}
+    for row in await get_stats_daily(7):
+        day = by_day.setdefault(row["day"], {"spreads": 0, "revenue": 0, "new_users": 0})
+        if row["metric"] in day:
+            day[row["metric"]] += row["value"]
+
+    stats = {
+        "total_users": totals["total_users"],
         "active_subs": active_subs,
-        "month_revenue": month_revenue,
-        "spreads_today": spreads_today,
-        "spreads_total": spreads_total,
+        "month_revenue": totals["month_revenue"],
+        "spreads_today": totals["spreads_today"],
+        "spreads_total": totals["spreads_total"],
+        "revenue_by_product": revenue_by_product,
+        "by_day": by_day,
     }
+    _stats_cache[DB_PATH] = (time.monotonic(), stats)
+    return stats
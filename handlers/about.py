@@ -4,7 +4,7 @@ from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
-from services.utils import velhar_typing
+from services.utils import spawn, velhar_presence
 from texts.velhar_voice import ABOUT_1, ABOUT_2, ABOUT_3
 
 router = Router()
@@ -14,25 +14,29 @@ _QUESTION_BUTTON = InlineKeyboardMarkup(inline_keyboard=[[
 ]])
 
 
+# Pause between lore parts; «typing…» stays visible throughout
+_ABOUT_PAUSE = 2.5
+
+
 async def _send_about(bot, chat_id: int):
-    await velhar_typing(bot, chat_id, long=True)
+    """Paced lore sequence — runs as a background task, not in the handler."""
     await bot.send_message(chat_id, ABOUT_1)
 
-    await asyncio.sleep(2.5)
-    await velhar_typing(bot, chat_id, long=True)
+    async with velhar_presence(bot, chat_id):
+        await asyncio.sleep(_ABOUT_PAUSE)
     await bot.send_message(chat_id, ABOUT_2)
 
-    await asyncio.sleep(2.5)
-    await velhar_typing(bot, chat_id, long=True)
+    async with velhar_presence(bot, chat_id):
+        await asyncio.sleep(_ABOUT_PAUSE)
     await bot.send_message(chat_id, ABOUT_3, reply_markup=_QUESTION_BUTTON)
 
 
 @router.message(Command("about"))
 async def cmd_about(message: Message):
-    await _send_about(message.bot, message.chat.id)
+    spawn(_send_about(message.bot, message.chat.id), name=f"about:{message.chat.id}")
 
 
 @router.callback_query(F.data == "about")
 async def cb_about(callback: CallbackQuery):
     await callback.answer()
-    await _send_about(callback.bot, callback.message.chat.id)
+    spawn(_send_about(callback.bot, callback.message.chat.id), name=f"about:{callback.message.chat.id}")
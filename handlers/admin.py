@@ -3,8 +3,18 @@ from aiogram.filters import Command
 from aiogram.types import Message
 
 from config import config
-from database import get_stats
-from texts.messages import ADMIN_STATS_TEMPLATE, NOT_ADMIN
+from database import get_stats, get_response_cache_report
+from services import oracle
+from texts.messages import (
+    ADMIN_STATS_TEMPLATE,
+    ADMIN_STATS_PRODUCTS_HEADER,
+    ADMIN_STATS_PRODUCT_LINE,
+    ADMIN_STATS_DAYS_HEADER,
+    ADMIN_STATS_DAY_LINE,
+    ADMIN_CACHE_TEMPLATE,
+    ADMIN_PROMPT_CACHE_TEMPLATE,
+    NOT_ADMIN,
+)
 
 router = Router()
 
@@ -16,5 +26,41 @@ async def cmd_stats(message: Message):
         return
 
     stats = await get_stats()
-    text = ADMIN_STATS_TEMPLATE.format(**stats)
-    await message.answer(text, parse_mode="Markdown")
+    sections = [ADMIN_STATS_TEMPLATE.format(**stats)]
+
+    if stats["revenue_by_product"]:
+        sections.append("\n".join(
+            [ADMIN_STATS_PRODUCTS_HEADER]
+            + [
+                ADMIN_STATS_PRODUCT_LINE.format(product=product or "—", revenue=revenue)
+                for product, revenue in stats["revenue_by_product"].items()
+            ]
+        ))
+
+    if stats["by_day"]:
+        sections.append("\n".join(
+            [ADMIN_STATS_DAYS_HEADER]
+            + [
+                ADMIN_STATS_DAY_LINE.format(day=day[5:], **row)
+                for day, row in stats["by_day"].items()
+            ]
+        ))
+
+    await message.answer("\n\n".join(sections), parse_mode="Markdown")
+
+
+@router.message(Command("cachestats"))
+async def cmd_cache_stats(message: Message):
+    if message.from_user.id != config.admin_id:
+        await message.answer(NOT_ADMIN)
+        return
+
+    report = await get_response_cache_report()
+    await message.answer(
+        ADMIN_CACHE_TEMPLATE.format(
+            latency_saved_s=report["latency_saved_ms"] / 1000, **report,
+        )
+        + "\n\n"
+        + ADMIN_PROMPT_CACHE_TEMPLATE.format(**oracle.prompt_cache_report()),
+        parse_mode="Markdown",
+    )
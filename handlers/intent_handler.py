@@ -12,7 +12,6 @@ from aiogram.types import Message
 
 from database import (
     get_user,
-    get_recent_spreads,
     increment_ai_question_count,
     set_velhar_state,
     reset_velhar_state,
@@ -21,8 +20,9 @@ from database import (
 from keyboards.menus import main_menu, back_to_main
 from services.intent_detector import detect_intent
 from services.oracle import _ask_velhar
-from services.context import build_system_prompt
-from services.utils import velhar_typing
+from services.context import build_session_context
+from services.memory import read_ring
+from services.utils import velhar_typing, velhar_presence
 from texts.velhar_voice import (
     INTENT_WHO,
     INTENT_REAL,
@@ -60,13 +60,13 @@ async def handle_free_text(message: Message, state: FSMContext):
     # ── Cold state: only trolling intents get the cold response ──────────────
     if velhar_state == "cold":
         if intent in ("who_are_you", "are_you_real", "are_you_ai", "doubt", "future"):
-            await velhar_typing(message.bot, message.chat.id, long=False)
+            await velhar_typing(message.bot, message.chat.id)
             await message.answer(STATE_COLD_DEFAULT)
             return
         elif intent is None:
             # Real question — reset cold state, show menu
             await reset_velhar_state(uid)
-            await velhar_typing(message.bot, message.chat.id, long=False)
+            await velhar_typing(message.bot, message.chat.id)
             await message.answer(
                 "Велхар слышит тебя.\n\nВыбери расклад:",
                 reply_markup=main_menu(),
@@ -76,15 +76,15 @@ async def handle_free_text(message: Message, state: FSMContext):
 
     # ── Intent dispatch ───────────────────────────────────────────────────────
     if intent == "who_are_you":
-        await velhar_typing(message.bot, message.chat.id, long=False)
+        await velhar_typing(message.bot, message.chat.id)
         await message.answer(INTENT_WHO)
 
     elif intent == "are_you_real":
-        await velhar_typing(message.bot, message.chat.id, long=False)
+        await velhar_typing(message.bot, message.chat.id)
         await message.answer(INTENT_REAL)
 
     elif intent == "are_you_ai":
-        await velhar_typing(message.bot, message.chat.id, long=False)
+        await velhar_typing(message.bot, message.chat.id)
         count = await increment_ai_question_count(uid)
         if count <= 2:
             await message.answer(INTENT_AI_SOFT)
@@ -95,25 +95,25 @@ async def handle_free_text(message: Message, state: FSMContext):
             await message.answer(INTENT_AI_COLD)
 
     elif intent == "doubt":
-        await velhar_typing(message.bot, message.chat.id, long=False)
+        await velhar_typing(message.bot, message.chat.id)
         await message.answer(INTENT_DOUBT)
 
     elif intent == "need_help":
-        await velhar_typing(message.bot, message.chat.id, long=False)
+        await velhar_typing(message.bot, message.chat.id)
         await state.set_state(SupportState.listening)
         await message.answer(INTENT_HELP)
 
     elif intent == "future":
-        await velhar_typing(message.bot, message.chat.id, long=False)
+        await velhar_typing(message.bot, message.chat.id)
         await message.answer(INTENT_FUTURE, reply_markup=main_menu())
 
     elif intent == "thanks":
-        await velhar_typing(message.bot, message.chat.id, long=False)
+        await velhar_typing(message.bot, message.chat.id)
         await message.answer(INTENT_THANKS)
 
     else:
         # No recognized intent — gently show the menu
-        await velhar_typing(message.bot, message.chat.id, long=False)
+        await velhar_typing(message.bot, message.chat.id)
         await message.answer(UNKNOWN_MESSAGE, reply_markup=main_menu())
 
 
@@ -126,19 +126,12 @@ async def handle_support_reply(message: Message, state: FSMContext):
     uid = message.from_user.id
 
     user = await get_user(uid)
-    recent = await get_recent_spreads(uid, limit=3)
-    system_prompt = build_system_prompt(user or {}, recent)
+    recent = read_ring(user)
+    context = build_session_context(user or {}, recent, support=True, question=message.text)
 
-    support_addon = (
-        "\n\nВАЖНО ДЛЯ ЭТОГО ОТВЕТА:\n"
-        "Пользователю сейчас тяжело. Отвечай тепло, без расклада таро. "
-        "Выслушай и поддержи. Не предлагай карты, если только пользователь не попросит сам. "
-        "Напомни: ты не заменяешь живых людей, которые могут помочь."
-    )
-
-    await velhar_typing(message.bot, message.chat.id, long=True)
     try:
-        response = await _ask_velhar(message.text, system_prompt + support_addon)
+        async with velhar_presence(message.bot, message.chat.id):
+            response = await _ask_velhar(message.text, context, spread_type="support")
         await message.answer(response, reply_markup=back_to_main())
     except Exception:
         logger.exception("Support reply failed")
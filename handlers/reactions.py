@@ -5,6 +5,7 @@ from aiogram.types import CallbackQuery
 
 from database import get_spread_by_id
 from keyboards.menus import main_menu
+from services import identity
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -52,11 +53,11 @@ async def react_share(callback: CallbackQuery):
     if len(response_text) > 700:
         preview += "..."
 
-    bot_info = await callback.bot.get_me()
+    bot_username = await identity.username(callback.bot)
     share_text = (
         f"🌌 *Послание VELHAR*\n\n"
         f"{preview}\n\n"
-        f"_Получи своё послание: @{bot_info.username}_"
+        f"_Получи своё послание: @{bot_username}_"
     )
 
     await callback.message.answer(share_text, parse_mode="Markdown")
@@ -7,10 +7,11 @@ from aiogram.types import Message, CallbackQuery
 from database import (
     get_user,
     generate_and_save_referral_code,
-    count_referrals,
+    REFERRALS_PER_BONUS,
     use_referral_bonus,
 )
 from keyboards.menus import back_to_main, cancel_input
+from services import identity
 from texts.messages import ASK_QUESTION
 
 router = Router()
@@ -35,15 +36,13 @@ async def cb_referral(callback: CallbackQuery):
 async def _send_referral_card(uid: int, msg: Message, edit: bool = False):
     user      = await get_user(uid)
     code      = await generate_and_save_referral_code(uid)
-    ref_count = await count_referrals(uid)
+    ref_count = (user or {}).get("referral_count") or 0
     bonuses   = (user or {}).get("referral_bonuses_available") or 0
 
     # How many more referrals until next bonus
-    remainder = ref_count % 3
-    next_bonus_in = (3 - remainder) if remainder != 0 else 3
+    next_bonus_in = REFERRALS_PER_BONUS - ref_count % REFERRALS_PER_BONUS
 
-    bot_info = await msg.bot.get_me()
-    link = f"https://t.me/{bot_info.username}?start={code}"
+    link = await identity.start_link(msg.bot, code)
 
     bonus_line = (
         f"🎁 *У тебя есть {bonuses} бонусный расклад!*\n"
@@ -1,20 +1,19 @@
-import asyncio
-from aiogram import Router, F
+import functools
+import logging
+import time
+from aiogram import Bot, Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from config import config
 from database import (
     get_user,
-    update_last_active,
+    get_spread_by_id,
     increment_free_used,
     increment_total_spreads,
-    increment_paid_mirror,
-    increment_paid_year,
-    get_recent_spreads,
     save_spread,
-    increment_spreads_since_memory,
-    reset_spreads_since_memory,
 )
 from keyboards.menus import (
     back_to_main,
@@ -23,10 +22,10 @@ from keyboards.menus import (
     subscription_menu,
     reaction_keyboard,
 )
-from services import oracle
-from services.context import build_system_prompt, get_moon_phase_text, get_time_of_day
-from services.memory import should_use_memory, MEMORY_ADDON
-from services.utils import velhar_typing
+from services import jobs, metrics, oracle, singleflight, summarizer
+from services.context import build_session_context, get_moon_phase_text, get_time_of_day
+from services.memory import read_ring, should_use_memory
+from services.utils import velhar_presence
 from services.limiter import (
     ensure_user,
     can_use_card_of_day,
@@ -41,6 +40,7 @@ from texts.messages import (
     ASK_QUESTION_COMPAT,
     NOT_FULLMOON,
     ERROR_GENERIC,
+    SPREAD_IN_PROGRESS,
     SPREAD_CARD_OF_DAY_INTRO,
     SPREAD_THREE_PATHS_INTRO,
     SPREAD_MIRROR_INTRO,
@@ -51,6 +51,8 @@ from texts.messages import (
 )
 from texts.velhar_voice import LIMIT_REACHED, get_loading
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
 
@@ -68,6 +70,69 @@ class SpreadState(StatesGroup):
 
 # ─── Core helper ──────────────────────────────────────────────────────────────
 
+# Velhar never answers instantly: the reply waits at least this long, but the
+# wait overlaps generation, so it only costs time when the answer is faster.
+_MIN_PRESENCE = 1.5
+
+
+async def _generate(
+    user_id: int,
+    spread_type: str,
+    question: str | None,
+    generator_fn,
+    job_id: int | None = None,
+    counter: str | None = None,
+) -> tuple[int, str]:
+    """Build context, optionally inject memory, call oracle, save. Returns (spread_id, text)."""
+    started = time.perf_counter()
+    user = await get_user(user_id)
+    recent = read_ring(user)
+
+    # Memory illusion — mark the context when a recurring topic is detected.
+    # The counter write is deferred to save_spread's commit.
+    memory_used = should_use_memory(user or {}, question, recent)
+    context = build_session_context(
+        user or {}, recent, memory=memory_used, question=question,
+    )
+
+    metrics.observe("spread.time_to_openai_ms", (time.perf_counter() - started) * 1000)
+    text = await generator_fn(question, context=context, user=user)
+
+    # Summary is filled in later by the batched summarizer
+    spread_id = await save_spread(
+        user_id, spread_type, question, text,
+        memory_used=memory_used, job_id=job_id, counter=counter,
+    )
+    summarizer.enqueue(spread_id, text)
+    return spread_id, text
+
+
+async def _replace_message(
+    bot: Bot, chat_id: int, message_id: int | None, text: str, reply_markup=None, parse_mode=None,
+):
+    """
+    Edit the placeholder in place (one Bot API call instead of delete + send);
+    send a new message only if the placeholder is gone. Idempotent: repeating
+    it re-edits the same message instead of sending twice.
+    """
+    if message_id is not None:
+        try:
+            await bot.edit_message_text(
+                text,
+                chat_id=chat_id,
+                message_id=message_id,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode,
+            )
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" in e.message:
+                return
+            if "message to edit not found" not in e.message:
+                raise
+    await bot.send_message(chat_id, text, reply_markup=reply_markup, parse_mode=parse_mode)
+
+
 async def _generate_and_send(
     msg_placeholder: Message,
     intro: str,
@@ -77,35 +142,17 @@ async def _generate_and_send(
     spread_type: str,
     counter_fn=None,
 ):
-    """Build context, optionally inject memory, call oracle, save, show reactions."""
+    """Generate inline and replace the placeholder with the reading + reactions."""
     try:
-        await msg_placeholder.bot.send_chat_action(msg_placeholder.chat.id, "typing")
-
-        user   = await get_user(user_id)
-        recent = await get_recent_spreads(user_id, limit=5)
-
-        system_prompt = build_system_prompt(user or {}, recent[:3])
-
-        # Memory illusion — inject MEMORY_ADDON when recurring topic detected
-        if should_use_memory(user or {}, question, recent):
-            system_prompt += MEMORY_ADDON
-            await reset_spreads_since_memory(user_id)
-        else:
-            await increment_spreads_since_memory(user_id)
-
-        text = await generator_fn(question, system_prompt=system_prompt)
-
-        try:
-            summary = await oracle.generate_summary(text)
-        except Exception:
-            summary = None
+        async with velhar_presence(
+            msg_placeholder.bot, msg_placeholder.chat.id, min_duration=_MIN_PRESENCE,
+        ):
+            spread_id, text = await _generate(user_id, spread_type, question, generator_fn)
 
-        spread_id = await save_spread(user_id, spread_type, question, text, summary)
-        await update_last_active(user_id)
-
-        await msg_placeholder.delete()
-        await msg_placeholder.bot.send_message(
+        await _replace_message(
+            msg_placeholder.bot,
             msg_placeholder.chat.id,
+            msg_placeholder.message_id,
             intro + text,
             reply_markup=reaction_keyboard(spread_id),
             parse_mode="Markdown",
@@ -118,10 +165,113 @@ async def _generate_and_send(
         await msg_placeholder.edit_text(ERROR_GENERIC, reply_markup=back_to_main())
 
 
+async def _run_spread(
+    message: Message,
+    intro: str,
+    generator_fn,
+    spread_type: str,
+    counter_fn=None,
+):
+    """
+    Inline (free and subscription) spreads: one generation per (user, spread
+    type) at a time; repeats get a short notice. Paid ones go through _enqueue_spread.
+    """
+    uid = message.from_user.id
+    async with singleflight.guard(uid, spread_type) as acquired:
+        if not acquired:
+            await message.answer(SPREAD_IN_PROGRESS)
+            return
+        placeholder = await message.answer(_loading(spread_type))
+        await _generate_and_send(
+            placeholder, intro, generator_fn, message.text,
+            user_id=uid, spread_type=spread_type, counter_fn=counter_fn,
+        )
+
+
 def _loading(spread_type: str) -> str:
     return get_loading(spread_type, get_moon_phase_text(), get_time_of_day())
 
 
+# ─── Queued (paid) spreads ────────────────────────────────────────────────────
+
+# Paid readings are long; generating them inside the update handler loses the
+# result if the process dies mid-way. Handlers only enqueue a spread_jobs row
+# and services.jobs workers generate and deliver into the placeholder.
+# spread type -> (intro, generator, database.SPREAD_COUNTERS key)
+QUEUED_SPREADS = {
+    "spread_deep":   (SPREAD_MIRROR_INTRO, oracle.generate_mirror_of_fate, "mirror"),
+    "spread_year":   (SPREAD_YEAR_INTRO,   oracle.generate_year_under_stars, "year"),
+    "ritual":        (SPREAD_RITUAL_INTRO, oracle.generate_fullmoon_ritual, "total"),
+    "spread_compat": (SPREAD_COMPAT_INTRO, oracle.generate_compatibility, "total"),
+}
+
+
+async def _enqueue_spread(message: Message, spread_type: str):
+    placeholder = await message.answer(_loading(spread_type))
+    job_id = await jobs.enqueue(
+        message.from_user.id, message.chat.id, spread_type, message.text, placeholder.message_id,
+        source_message_id=message.message_id,
+    )
+    if job_id is None:
+        await placeholder.edit_text(SPREAD_IN_PROGRESS)
+
+
+async def _deliver_to_placeholder(bot: Bot, job: dict, text: str, reply_markup=None, parse_mode=None):
+    """Put the result into the job's placeholder message (see _replace_message)."""
+    await _replace_message(
+        bot, job["chat_id"], job["placeholder_message_id"], text,
+        reply_markup=reply_markup, parse_mode=parse_mode,
+    )
+
+
+def _section_streamer(bot: Bot, job: dict, intro: str):
+    """on_section callback: grow the placeholder as sections arrive (best effort)."""
+    sections: list[str] = []
+
+    async def on_section(index: int, text: str):
+        sections.append(text)
+        if job["placeholder_message_id"] is None:
+            return
+        try:
+            await bot.edit_message_text(
+                intro + "\n\n".join(sections) + "\n\n…",
+                chat_id=job["chat_id"],
+                message_id=job["placeholder_message_id"],
+                parse_mode="Markdown",
+            )
+        except TelegramBadRequest as e:
+            logger.warning(f"[jobs] section {index} of job {job['id']} not shown: {e.message}")
+
+    return on_section
+
+
+async def process_spread_job(bot: Bot, job: dict):
+    """services.jobs entry point: generate at most once per job, then deliver."""
+    intro, generator_fn, counter = QUEUED_SPREADS[job["spread_type"]]
+    if job["spread_type"] == "spread_year" and config.year_fanout:
+        generator_fn = functools.partial(
+            generator_fn, on_section=_section_streamer(bot, job, intro),
+        )
+    if job["spread_id"] is None:
+        async with velhar_presence(bot, job["chat_id"]):
+            spread_id, text = await _generate(
+                job["user_id"], job["spread_type"], job["question"], generator_fn,
+                job_id=job["id"], counter=counter,
+            )
+    else:
+        # An earlier attempt saved the reading but died before delivering it
+        spread_id = job["spread_id"]
+        text = (await get_spread_by_id(spread_id))["response"]
+    await _deliver_to_placeholder(
+        bot, job, intro + text, reply_markup=reaction_keyboard(spread_id), parse_mode="Markdown",
+    )
+
+
+async def on_spread_job_failed(bot: Bot, job: dict):
+    logger.error(f"[jobs] spread job {job['id']} ({job['spread_type']}) failed: {job.get('error')}")
+    await _deliver_to_placeholder(bot, job, ERROR_GENERIC, reply_markup=back_to_main())
+
+
 # ─── Card of day  (spread_day / spread:card_of_day) ───────────────────────────
 
 @router.callback_query(F.data.in_({"spread_day", "spread:card_of_day"}))
@@ -146,12 +296,9 @@ async def msg_card_of_day(message: Message, state: FSMContext):
     if not allowed:
         await message.answer(LIMIT_REACHED, reply_markup=limit_reached_menu())
         return
-    placeholder = await message.answer(_loading("spread_day"))
-    await velhar_typing(message.bot, message.chat.id, long=True)
-    await _generate_and_send(
-        placeholder, SPREAD_CARD_OF_DAY_INTRO,
-        oracle.generate_card_of_day, message.text,
-        user_id=uid, spread_type="spread_day", counter_fn=increment_free_used,
+    await _run_spread(
+        message, SPREAD_CARD_OF_DAY_INTRO, oracle.generate_card_of_day,
+        spread_type="spread_day", counter_fn=increment_free_used,
     )
 
 
@@ -179,12 +326,9 @@ async def msg_three_paths(message: Message, state: FSMContext):
     if not allowed:
         await message.answer(LIMIT_REACHED, reply_markup=limit_reached_menu())
         return
-    placeholder = await message.answer(_loading("spread_question"))
-    await velhar_typing(message.bot, message.chat.id, long=True)
-    await _generate_and_send(
-        placeholder, SPREAD_THREE_PATHS_INTRO,
-        oracle.generate_three_paths, message.text,
-        user_id=uid, spread_type="spread_question", counter_fn=increment_free_used,
+    await _run_spread(
+        message, SPREAD_THREE_PATHS_INTRO, oracle.generate_three_paths,
+        spread_type="spread_question", counter_fn=increment_free_used,
     )
 
 
@@ -199,14 +343,7 @@ async def cb_mirror(callback: CallbackQuery, state: FSMContext):
 @router.message(SpreadState.waiting_question_mirror)
 async def msg_mirror(message: Message, state: FSMContext):
     await state.clear()
-    uid = message.from_user.id
-    placeholder = await message.answer(_loading("spread_deep"))
-    await velhar_typing(message.bot, message.chat.id, long=True)
-    await _generate_and_send(
-        placeholder, SPREAD_MIRROR_INTRO,
-        oracle.generate_mirror_of_fate, message.text,
-        user_id=uid, spread_type="spread_deep", counter_fn=increment_paid_mirror,
-    )
+    await _enqueue_spread(message, "spread_deep")
 
 
 # ─── Year under stars  (spread:year) ──────────────────────────────────────────
@@ -220,14 +357,7 @@ async def cb_year(callback: CallbackQuery, state: FSMContext):
 @router.message(SpreadState.waiting_question_year)
 async def msg_year(message: Message, state: FSMContext):
     await state.clear()
-    uid = message.from_user.id
-    placeholder = await message.answer(_loading("spread_year"))
-    await velhar_typing(message.bot, message.chat.id, long=True)
-    await _generate_and_send(
-        placeholder, SPREAD_YEAR_INTRO,
-        oracle.generate_year_under_stars, message.text,
-        user_id=uid, spread_type="spread_year", counter_fn=increment_paid_year,
-    )
+    await _enqueue_spread(message, "spread_year")
 
 
 # ─── Ritual  (ritual / spread:ritual) ─────────────────────────────────────────
@@ -245,14 +375,7 @@ async def cb_ritual(callback: CallbackQuery, state: FSMContext):
 @router.message(SpreadState.waiting_question_ritual)
 async def msg_ritual(message: Message, state: FSMContext):
     await state.clear()
-    uid = message.from_user.id
-    placeholder = await message.answer(_loading("ritual"))
-    await velhar_typing(message.bot, message.chat.id, long=True)
-    await _generate_and_send(
-        placeholder, SPREAD_RITUAL_INTRO,
-        oracle.generate_fullmoon_ritual, message.text,
-        user_id=uid, spread_type="ritual", counter_fn=increment_total_spreads,
-    )
+    await _enqueue_spread(message, "ritual")
 
 
 # ─── Compatibility  (spread:compat) ───────────────────────────────────────────
@@ -266,14 +389,7 @@ async def cb_compat(callback: CallbackQuery, state: FSMContext):
 @router.message(SpreadState.waiting_question_compat)
 async def msg_compat(message: Message, state: FSMContext):
     await state.clear()
-    uid = message.from_user.id
-    placeholder = await message.answer(_loading("spread_compat"))
-    await velhar_typing(message.bot, message.chat.id, long=True)
-    await _generate_and_send(
-        placeholder, SPREAD_COMPAT_INTRO,
-        oracle.generate_compatibility, message.text,
-        user_id=uid, spread_type="spread_compat", counter_fn=increment_total_spreads,
-    )
+    await _enqueue_spread(message, "spread_compat")
 
 
 # ─── Month spread  (subscription) ─────────────────────────────────────────────
@@ -299,11 +415,7 @@ async def cb_month_spread(callback: CallbackQuery, state: FSMContext):
 @router.message(SpreadState.waiting_question_month)
 async def msg_month_spread(message: Message, state: FSMContext):
     await state.clear()
-    uid = message.from_user.id
-    placeholder = await message.answer(_loading("month_spread"))
-    await velhar_typing(message.bot, message.chat.id, long=True)
-    await _generate_and_send(
-        placeholder, SPREAD_MONTH_INTRO,
-        oracle.generate_subscription_spread, message.text,
-        user_id=uid, spread_type="month_spread", counter_fn=increment_total_spreads,
+    await _run_spread(
+        message, SPREAD_MONTH_INTRO, oracle.generate_subscription_spread,
+        spread_type="month_spread", counter_fn=increment_total_spreads,
     )
@@ -12,12 +12,11 @@ from database import (
     generate_and_save_referral_code,
     find_user_by_referral_code,
     set_referred_by,
-    count_referrals,
-    add_referral_bonus,
 )
 from keyboards.menus import main_menu, subscription_menu, zodiac_keyboard
 from services.limiter import ensure_user, is_user_subscribed
 from texts.messages import WELCOME, WELCOME_BACK, SUBSCRIPTION_INFO
+from texts.velhar_voice import START_GREETING, ONBOARDING_NAME, ONBOARDING_ZODIAC
 
 router = Router()
 
@@ -43,11 +42,10 @@ async def cmd_start(message: Message, state: FSMContext):
     if ref_code:
         referrer = await find_user_by_referral_code(ref_code)
         if referrer and referrer["user_id"] != user.id:
-            await set_referred_by(user.id, referrer["user_id"])
-            ref_count = await count_referrals(referrer["user_id"])
-            # Award bonus for every 3rd referral
-            if ref_count > 0 and ref_count % 3 == 0:
-                await add_referral_bonus(referrer["user_id"])
+            referred = await set_referred_by(user.id, referrer["user_id"])
+            # set_referred_by awards the bonus for every 3rd referral
+            if referred and referred[1]:
+                ref_count = referred[0]
                 try:
                     await message.bot.send_message(
                         referrer["user_id"],
@@ -66,7 +64,6 @@ async def cmd_start(message: Message, state: FSMContext):
     # If user has no name — start onboarding
     if not db_user or not db_user.get("name"):
         await state.set_state(OnboardingState.waiting_name)
-        from texts.velhar_voice import START_GREETING, ONBOARDING_NAME
         await message.answer(
             START_GREETING + "\n\n" + ONBOARDING_NAME,
             parse_mode="Markdown",
@@ -87,7 +84,6 @@ async def onboarding_name(message: Message, state: FSMContext):
     name = message.text.strip()[:50]
     await update_user_name(message.from_user.id, name)
     await state.set_state(OnboardingState.waiting_zodiac)
-    from texts.velhar_voice import ONBOARDING_ZODIAC
     await message.answer(
         f"✨ *{name}*... хорошее имя для путника между мирами.\n\n"
         f"{ONBOARDING_ZODIAC}",
@@ -0,0 +1,39 @@
+"""
+Cold-storage tiering for spreads (opt-in via ARCHIVE_ENABLED).
+
+Nightly, services.reminders moves spreads older than config.archive_after_days
+into the archive file in small batches (each its own short transaction, so
+updates keep flowing between them), then VACUUMs the hot database to return
+the freed pages. Reads stay transparent: database.get_spread_by_id falls back
+to the archive.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from config import config
+from database import archive_spreads, get_storage_report, vacuum
+from services import codec, metrics
+
+logger = logging.getLogger(__name__)
+
+
+async def run(now: datetime | None = None, compact: bool = True) -> dict:
+    """Archive everything due, compact if anything moved; returns a storage report."""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=config.archive_after_days)
+    moved = 0
+    with metrics.timer("archive.run_ms"):
+        while True:
+            n = await archive_spreads(cutoff, config.archive_keep_recent, config.archive_batch_size)
+            moved += n
+            if n < config.archive_batch_size:
+                break
+            await asyncio.sleep(0)
+        if moved and compact:
+            await vacuum()
+
+    metrics.incr("archive.moved", moved)
+    report = {"moved": moved, "codec": codec.backend(), **await get_storage_report()}
+    logger.info(f"[archive] {report}")
+    return report
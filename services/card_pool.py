@@ -0,0 +1,103 @@
+"""
+Pre-generated «Карта дня» pool (opt-in via CARD_POOL_ENABLED).
+
+Built overnight by services.reminders for every (card, zodiac) pair with that
+day's moon phase; each text addresses the reader through NAME_MARKER, which is
+filled in at request time. Re-running a build only generates missing entries,
+so an interrupted night resumes where it stopped.
+"""
+import asyncio
+import datetime
+import logging
+from typing import Awaitable, Callable, Iterable
+
+from config import config
+from database import (
+    get_card_pool_keys,
+    save_card_pool_entry,
+    get_card_pool_text,
+    delete_card_pool_before,
+)
+from keyboards.menus import ZODIAC_SIGNS
+from services import metrics
+from services.context import MOSCOW_TZ, get_moon_phase_text
+from services.deck import CARD_NAMES
+
+logger = logging.getLogger(__name__)
+
+NAME_MARKER = "{{name}}"
+
+# "" = users who skipped the zodiac step
+POOL_ZODIACS: tuple[str, ...] = tuple(value for _, value in ZODIAC_SIGNS) + ("",)
+
+# fn(card, zodiac, moon_phase) -> text containing NAME_MARKER
+PoolGenerator = Callable[[str, str, str], Awaitable[str]]
+
+
+def pool_date_today() -> datetime.date:
+    return datetime.datetime.now(MOSCOW_TZ).date()
+
+
+def moon_phase_for(pool_date: datetime.date) -> str:
+    noon = datetime.datetime.combine(pool_date, datetime.time(12), tzinfo=MOSCOW_TZ)
+    return get_moon_phase_text(noon)
+
+
+async def build_pool(
+    generate: PoolGenerator,
+    pool_date: datetime.date | None = None,
+    concurrency: int | None = None,
+    cards: Iterable[str] = CARD_NAMES,
+    zodiacs: Iterable[str] = POOL_ZODIACS,
+) -> dict:
+    """Generate the missing pool entries for pool_date with bounded concurrency."""
+    pool_date  = pool_date or pool_date_today()
+    moon_phase = moon_phase_for(pool_date)
+    existing   = await get_card_pool_keys(pool_date)
+    todo = [(c, z) for c in cards for z in zodiacs if (c, z) not in existing]
+
+    sem = asyncio.Semaphore(concurrency or config.card_pool_concurrency)
+    generated = failed = 0
+
+    async def one(card: str, zodiac: str):
+        nonlocal generated, failed
+        async with sem:
+            try:
+                text = await generate(card, zodiac, moon_phase)
+                await save_card_pool_entry(pool_date, card, zodiac, moon_phase, text)
+                generated += 1
+            except Exception as e:
+                failed += 1
+                logger.warning(f"[card_pool] {card}/{zodiac or '-'} failed: {e}")
+
+    await asyncio.gather(*(one(c, z) for c, z in todo))
+    await delete_card_pool_before(pool_date)
+
+    result = {
+        "date": pool_date.isoformat(),
+        "moon_phase": moon_phase,
+        "already_present": len(existing),
+        "generated": generated,
+        "failed": failed,
+    }
+    logger.info(f"[card_pool] build finished: {result}")
+    return result
+
+
+def fill(template: str, user: dict) -> str:
+    name = user.get("name") or "путник"
+    if NAME_MARKER in template:
+        return template.replace(NAME_MARKER, name)
+    return f"{name}... {template}"
+
+
+async def serve(card: str, user: dict) -> str | None:
+    """Personalised pool text for today, or None (caller falls back to live generation)."""
+    template = await get_card_pool_text(
+        pool_date_today(), card, user.get("zodiac_sign") or "", get_moon_phase_text(),
+    )
+    if template is None:
+        metrics.incr("card_pool.misses")
+        return None
+    metrics.incr("card_pool.hits")
+    return fill(template, user)
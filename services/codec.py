@@ -0,0 +1,171 @@
+"""
+Compressed text blobs: spreads.response (RESPONSE_COMPRESSION) and
+spreads_archive.
+
+Every blob starts with a format byte so old rows stay readable when the
+encoder changes:
+  0x01  zlib
+  0x02  zstd (needs the optional zstandard package to write and read)
+  0x03  zlib with a preset dictionary    — then a 2-byte dictionary id
+  0x04  zstd with a trained dictionary   — then a 2-byte dictionary id
+
+Dictionaries live in the compression_dicts table and are loaded at init_db;
+they are never deleted, since any blob (archived ones too) may reference one.
+Spread texts share most of their phrasing, so a dictionary trained on past
+readings lets even a single short reading compress well.
+"""
+import struct
+import zlib
+from collections import Counter
+from typing import Callable
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+FORMAT_ZLIB = 0x01
+FORMAT_ZSTD = 0x02
+FORMAT_ZLIB_DICT = 0x03
+FORMAT_ZSTD_DICT = 0x04
+
+_ZLIB_LEVEL = 9
+_ZSTD_LEVEL = 19  # writes are one per spread; favour ratio
+_DICT_ID = struct.Struct(">H")
+
+DICT_SIZE = 32 * 1024   # zlib can't use more (window size); plenty for zstd here
+_SHINGLE_WORDS = 6      # zlib dictionary: most frequent 6-word phrases
+
+# dict id -> (kind, data); kind is "zlib" or "zstd"
+_dictionaries: dict[int, tuple[str, bytes]] = {}
+_active: int | None = None
+_zstd_dicts: dict[int, "zstandard.ZstdCompressionDict"] = {}
+# dict id -> (kind, data) or None: fetches a dictionary trained by another
+# process (python -m services.compression) on first sight of its id
+_loader: Callable[[int], tuple[str, bytes] | None] | None = None
+
+
+def backend() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+
+# ─── Dictionaries ─────────────────────────────────────────────────────────────
+
+def reset():
+    """Forget loaded dictionaries (init_db reloads them from the database)."""
+    global _active
+    _dictionaries.clear()
+    _zstd_dicts.clear()
+    _active = None
+
+
+def load_dictionary(dict_id: int, kind: str, data: bytes, active: bool = False):
+    global _active
+    _dictionaries[dict_id] = (kind, bytes(data))
+    _zstd_dicts.pop(dict_id, None)
+    if active:
+        _active = dict_id
+
+
+def set_loader(loader: Callable[[int], tuple[str, bytes] | None]):
+    global _loader
+    _loader = loader
+
+
+def active_dictionary() -> int | None:
+    return _active
+
+
+def train_dictionary(samples: list[str], size: int = DICT_SIZE) -> tuple[str, bytes]:
+    """Build a dictionary from sample texts; returns (kind, data) for load_dictionary."""
+    if zstandard is not None:
+        trained = zstandard.train_dictionary(size, [s.encode("utf-8") for s in samples])
+        return "zstd", trained.as_bytes()
+    return "zlib", _train_zlib(samples, size)
+
+
+def _train_zlib(samples: list[str], size: int) -> bytes:
+    counts = Counter()
+    for text in samples:
+        words = text.split()
+        for i in range(len(words) - _SHINGLE_WORDS + 1):
+            counts[" ".join(words[i:i + _SHINGLE_WORDS])] += 1
+
+    picked, total = [], 0
+    for phrase, n in counts.most_common():
+        if n < 2:
+            break
+        chunk = (phrase + " ").encode("utf-8")
+        if total + len(chunk) > size:
+            break
+        if any(phrase.encode("utf-8") in p for p in picked):
+            continue
+        picked.append(chunk)
+        total += len(chunk)
+    # zlib matches closer to the data are cheaper: most frequent phrases last
+    return b"".join(reversed(picked))
+
+
+def _zstd_dict(dict_id: int) -> "zstandard.ZstdCompressionDict":
+    if dict_id not in _zstd_dicts:
+        _zstd_dicts[dict_id] = zstandard.ZstdCompressionDict(_dictionaries[dict_id][1])
+    return _zstd_dicts[dict_id]
+
+
+# ─── Blobs ────────────────────────────────────────────────────────────────────
+
+def compress(text: str) -> bytes:
+    """Compress with the active dictionary if one is loaded."""
+    data = text.encode("utf-8")
+    if _active is not None:
+        kind, zdict = _dictionaries[_active]
+        header = _DICT_ID.pack(_active)
+        if kind == "zstd" and zstandard is not None:
+            cctx = zstandard.ZstdCompressor(level=_ZSTD_LEVEL, dict_data=_zstd_dict(_active))
+            return bytes([FORMAT_ZSTD_DICT]) + header + cctx.compress(data)
+        if kind == "zlib":
+            comp = zlib.compressobj(_ZLIB_LEVEL, zdict=zdict)
+            return bytes([FORMAT_ZLIB_DICT]) + header + comp.compress(data) + comp.flush()
+    if zstandard is not None:
+        return bytes([FORMAT_ZSTD]) + zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(data)
+    return bytes([FORMAT_ZLIB]) + zlib.compress(data, _ZLIB_LEVEL)
+
+
+def decompress(blob: bytes) -> str:
+    if not blob:
+        raise ValueError("empty blob")
+    fmt, payload = blob[0], blob[1:]
+    if fmt in (FORMAT_ZSTD, FORMAT_ZSTD_DICT) and zstandard is None:
+        raise RuntimeError("zstd blob but the zstandard package is not installed")
+    if fmt == FORMAT_ZLIB:
+        return zlib.decompress(payload).decode("utf-8")
+    if fmt == FORMAT_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    if fmt in (FORMAT_ZLIB_DICT, FORMAT_ZSTD_DICT):
+        (dict_id,) = _DICT_ID.unpack_from(payload)
+        payload = payload[_DICT_ID.size:]
+        if dict_id not in _dictionaries and _loader is not None:
+            found = _loader(dict_id)
+            if found is not None:
+                load_dictionary(dict_id, *found)
+        if dict_id not in _dictionaries:
+            raise LookupError(f"compression dictionary {dict_id} is not loaded")
+        if fmt == FORMAT_ZSTD_DICT:
+            dctx = zstandard.ZstdDecompressor(dict_data=_zstd_dict(dict_id))
+            return dctx.decompress(payload).decode("utf-8")
+        decomp = zlib.decompressobj(zdict=_dictionaries[dict_id][1])
+        return (decomp.decompress(payload) + decomp.flush()).decode("utf-8")
+    raise ValueError(f"unknown blob format 0x{fmt:02x}")
+
+
+def encode(text: str) -> str | bytes:
+    """Blob if that is smaller than the UTF-8 text, else the text unchanged."""
+    blob = compress(text)
+    return blob if len(blob) < len(text.encode("utf-8")) else text
+
+
+def decode(value: str | bytes | None) -> str | None:
+    """Inverse of encode(): column values may be plain text or blobs."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return decompress(bytes(value))
+    return value
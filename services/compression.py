@@ -0,0 +1,90 @@
+"""
+Compressed spread responses (opt-in via RESPONSE_COMPRESSION).
+
+Readings repeat the same Cyrillic phrasing (two bytes per letter in UTF-8),
+so a dictionary trained on past responses compresses each one well on its
+own. save_spread encodes, the spread readers decode (database._spread_row).
+
+  python -m services.compression train     # dictionary from the latest readings
+  python -m services.compression migrate   # re-encode existing rows, then VACUUM
+  python -m services.compression report
+
+Training again is safe: older dictionaries stay for the rows that use them.
+migrate with RESPONSE_COMPRESSION off turns every row back into plain text.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from config import config
+from database import (
+    get_response_samples,
+    get_response_storage_report,
+    init_db,
+    recompress_spreads,
+    save_compression_dict,
+    vacuum,
+)
+from services import codec, metrics
+
+logger = logging.getLogger(__name__)
+
+TRAIN_SAMPLES = 2000
+MIN_SAMPLES = 50
+
+
+async def train(samples: int = TRAIN_SAMPLES, min_samples: int = MIN_SAMPLES) -> int | None:
+    """Train and activate a dictionary; None when there are too few readings yet."""
+    texts = await get_response_samples(samples)
+    if len(texts) < min_samples:
+        logger.info(f"[compression] {len(texts)} readings, need {min_samples} to train")
+        return None
+    kind, data = codec.train_dictionary(texts)
+    dict_id = await save_compression_dict(kind, data, len(texts))
+    logger.info(f"[compression] dictionary {dict_id}: {kind}, {len(data)} bytes from {len(texts)} readings")
+    return dict_id
+
+
+async def migrate(batch_size: int = 500, compact: bool = True) -> dict:
+    """Re-encode every spread in short batches (updates keep flowing between them)."""
+    after_id, rewritten = 0, 0
+    with metrics.timer("compression.migrate_ms"):
+        while True:
+            last_id, changed = await recompress_spreads(after_id, batch_size)
+            if last_id is None:
+                break
+            after_id = last_id
+            rewritten += changed
+            await asyncio.sleep(0)
+        if rewritten and compact:
+            await vacuum()
+    metrics.incr("compression.rewritten", rewritten)
+    return {"rewritten": rewritten, **await get_response_storage_report()}
+
+
+async def _main(args) -> dict:
+    await init_db()
+    if args.command == "train":
+        return {"dictionary": await train(args.samples)}
+    if args.command == "migrate":
+        if config.response_compression and codec.active_dictionary() is None:
+            logger.warning("[compression] no dictionary trained yet: rows get plain zlib/zstd")
+        return await migrate(args.batch_size)
+    return await get_response_storage_report()
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("command", choices=("train", "migrate", "report"))
+    p.add_argument("--samples", type=int, default=TRAIN_SAMPLES)
+    p.add_argument("--batch-size", type=int, default=500)
+    args = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    print(json.dumps(asyncio.run(_main(args)), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
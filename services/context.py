@@ -1,16 +1,27 @@
 """Context building: moon phase, time of day, personalised system prompt."""
 import datetime
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
+from config import config
+from services import tokens
+from services.memory import MEMORY_RULE, detect_topic, topic_of
+
 MOSCOW_TZ = ZoneInfo("Europe/Moscow")
 
 # ─── Moon phase via ephem ─────────────────────────────────────────────────────
 
-def get_moon_phase_text() -> str:
+def get_moon_phase_text(when: datetime.datetime | None = None) -> str:
+    """Moon phase now, or at `when` (aware datetime) — e.g. for pre-generated pools."""
+    if when is not None and when.tzinfo is not None:
+        when = when.astimezone(datetime.timezone.utc).replace(tzinfo=None)
     try:
         import ephem
         moon = ephem.Moon()
-        moon.compute()
+        if when is None:
+            moon.compute()
+        else:
+            moon.compute(when)
         phase = moon.phase  # 0-100
         if phase < 10:
             return "новолуние"
@@ -25,7 +36,9 @@ def get_moon_phase_text() -> str:
     except Exception:
         # Fallback to pure-math calculation
         from services.moon import days_to_fullmoon
-        d = days_to_fullmoon()
+        d = days_to_fullmoon(
+            when.replace(tzinfo=datetime.timezone.utc) if when is not None else None
+        )
         if abs(d) <= 2:
             return "полнолуние"
         elif -7 < d < -2:
@@ -91,33 +104,128 @@ BASE_SYSTEM_PROMPT = """Ты — VELHAR, космический оракул и
 - Используй разные карты для каждого расклада — не повторяй одни и те же"""
 
 
-def build_system_prompt(user: dict, recent_spreads: list[dict]) -> str:
-    """Build personalised system prompt with user context."""
+# Mode rules live in the stable prefix and are switched on by markers in the
+# session context, so every request starts with the same STABLE_SYSTEM_PROMPT
+# and the provider's prompt prefix cache can serve it.
+MEMORY_MARKER  = "ТЕМА ВОЗВРАЩАЕТСЯ"
+SUPPORT_MARKER = "РЕЖИМ ПОДДЕРЖКИ"
+
+SPREAD_FORMATS = """
+
+ФОРМАТЫ РАСКЛАДОВ (запрос называет нужный):
+
+«Карта дня» — одна карта. Послание на день: какую энергию несёт карта,
+на что обратить внимание, одна мысль-ориентир. 100-150 слов, без подробной структуры.
+
+«Три пути» — три карты: Прошлое, Настоящее, Будущее. Покажи, как прошлое
+привело к нынешнему узлу и куда ведёт поток. 250-350 слов.
+
+«Зеркало судьбы» — пять карт: Суть ситуации, Скрытые силы, Препятствие, Ресурс, Итог.
+Глубокий разбор, каждая позиция раскрыта отдельно. 500-700 слов.
+
+«Год под звёздами» — двенадцать карт, по одной на месяц с января по декабрь.
+Вступление 2-3 предложения, затем каждый месяц с новой строки, 2-4 предложения на месяц.
+
+«Ритуал полнолуния» — семь карт: Что отпустить, Что принять, Тайный союзник, Испытание,
+Дар луны, Послание предков, Путь к свету. Торжественный ритуальный тон —
+это особое, редкое послание луны. 600-800 слов.
+
+«Нити судеб» (совместимость) — шесть карт: Энергия первой души, Энергия второй души,
+Что притягивает, Что разделяет, Скрытая нить, Послание союза. 400-550 слов.
+
+«Расклад на месяц» (для подписчиков) — четыре карты: Энергия месяца, Главный урок,
+Скрытая возможность, Итог месяца. 300-450 слов.
+
+Если запрос не называет расклад — отвечай без структуры расклада, коротко и по сути."""
+
+STABLE_SYSTEM_PROMPT = (
+    BASE_SYSTEM_PROMPT
+    + SPREAD_FORMATS
+    + "\n\nОСОБЫЕ ОТМЕТКИ В КОНТЕКСТЕ СЕССИИ:"
+    + f"\n\nЕсли в контексте стоит отметка «{MEMORY_MARKER}»:"
+    + MEMORY_RULE
+    + f"\n\nЕсли в контексте стоит отметка «{SUPPORT_MARKER}»:\n"
+    "Пользователю сейчас тяжело. Отвечай тепло, без расклада таро. "
+    "Выслушай и поддержи. Не предлагай карты, если только пользователь не попросит сам. "
+    "Напомни: ты не заменяешь живых людей, которые могут помочь."
+    + "\n\nБез отметок эти правила не применяй."
+)
+
+
+# A single memory line never takes more than this, whatever the summary holds
+MEMORY_ITEM_MAX_TOKENS = 40
+
+FIRST_CONTACT = "Это первое обращение этой души к тебе."
+
+
+@lru_cache(maxsize=2048)
+def _memory_line(spread_type: str, summary: str) -> tuple[str, int]:
+    """A memory line and its token cost; a user's recent summaries recur on every request."""
+    line = f"- {spread_type}: {tokens.truncate(summary, MEMORY_ITEM_MAX_TOKENS)}"
+    return line, tokens.count(line) + 1  # newline
+
+
+def select_memories(recent_spreads: list[dict], question: str | None, budget: int) -> list[str]:
+    """
+    Memory lines that fit in `budget` tokens. Spreads on the current question's
+    topic come first, then by recency (recent_spreads is newest first); each
+    line is capped at MEMORY_ITEM_MAX_TOKENS. Deterministic for equal input.
+    """
+    topic = detect_topic(question)
+    candidates = [(i, s) for i, s in enumerate(recent_spreads) if s.get("summary")]
+    ranked = sorted(
+        candidates,
+        key=lambda c: (topic is None or topic_of(c[1]) != topic, c[0]),
+    )
+
+    lines, used = [], 0
+    for _, spread in ranked:
+        line, cost = _memory_line(spread.get("spread_type", "?"), spread["summary"])
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    return lines
+
+
+def build_session_context(
+    user: dict,
+    recent_spreads: list[dict],
+    memory: bool = False,
+    support: bool = False,
+    question: str | None = None,
+    budget: int | None = None,
+) -> str:
+    """
+    Volatile part of the prompt, sent after STABLE_SYSTEM_PROMPT. Ordered from
+    most to least shared: moon/time (all users this hour) → who → memory → marks.
+    Memories fill whatever is left of `budget` tokens (config.context_token_budget).
+    """
     name        = user.get("name") or "путник"
     zodiac      = user.get("zodiac_sign") or ""
     moon_phase  = get_moon_phase_text()
     time_of_day = get_time_of_day()
 
-    if recent_spreads:
-        summaries = "\n".join(
-            f"- {s.get('spread_type', '?')}: {s.get('summary', '...')}"
-            for s in recent_spreads
-            if s.get("summary")
-        )
-        memory_block = (
-            f"Из прошлых посланий ты помнишь:\n{summaries}"
-            if summaries
-            else "Это первое обращение этой души к тебе."
-        )
-    else:
-        memory_block = "Это первое обращение этой души к тебе."
-
-    context = (
-        f"\n\nКОНТЕКСТ СЕССИИ:\n"
+    marks = [m for m, on in ((MEMORY_MARKER, memory), (SUPPORT_MARKER, support)) if on]
+    head = (
+        f"КОНТЕКСТ СЕССИИ:\n"
+        f"Сейчас {time_of_day}, фаза луны: {moon_phase}.\n"
         f"Ты обращаешься к {name}.\n"
         + (f"Знак зодиака: {zodiac}.\n" if zodiac else "")
-        + f"Сейчас {time_of_day}, фаза луны: {moon_phase}.\n"
-        f"{memory_block}"
     )
+    tail = "".join(f"\nОтметка: {m}." for m in marks)
 
-    return BASE_SYSTEM_PROMPT + context
+    if not any(s.get("summary") for s in recent_spreads):
+        return head + FIRST_CONTACT + tail
+
+    memory_header = "Из прошлых посланий ты помнишь:\n"
+    budget = config.context_token_budget if budget is None else budget
+    remaining = budget - tokens.count(head + memory_header + tail)
+    lines = select_memories(recent_spreads, question, remaining)
+    memory_block = memory_header + "\n".join(lines) if lines else ""
+    return (head + memory_block).rstrip("\n") + tail
+
+
+def build_system_prompt(user: dict, recent_spreads: list[dict]) -> str:
+    """Stable prefix + session context as one string (legacy single-message layout)."""
+    return STABLE_SYSTEM_PROMPT + "\n\n" + build_session_context(user, recent_spreads)
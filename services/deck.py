@@ -0,0 +1,106 @@
+"""Full Rider-Waite deck, built once at import, with seedable card draws."""
+import random
+from typing import NamedTuple, Optional
+
+MAJOR_ARCANA = [
+    "Шут", "Маг", "Верховная Жрица", "Императрица", "Император",
+    "Иерофант", "Влюблённые", "Колесница", "Сила", "Отшельник",
+    "Колесо Фортуны", "Справедливость", "Повешенный", "Смерть",
+    "Умеренность", "Дьявол", "Башня", "Звезда", "Луна", "Солнце",
+    "Суд", "Мир",
+]
+MINOR_RANKS = [
+    "Туз", "Двойка", "Тройка", "Четвёрка", "Пятёрка",
+    "Шестёрка", "Семёрка", "Восьмёрка", "Девятка", "Десятка",
+    "Паж", "Рыцарь", "Королева", "Король",
+]
+MINOR_SUITS = {
+    suit: list(MINOR_RANKS)
+    for suit in ("Жезлов", "Кубков", "Мечей", "Пентаклей")
+}
+
+REVERSED_SUFFIX = " (перевёрнутая)"
+
+
+class Card(NamedTuple):
+    id: int                 # position in DECK, 0..77
+    name: str               # «Маг», «Туз Кубков»
+    arcana: str             # "major" | "minor"
+    suit: Optional[str]     # None for major arcana
+
+
+class DrawnCard(NamedTuple):
+    card: Card
+    reversed: bool = False
+
+    @property
+    def label(self) -> str:
+        return self.card.name + (REVERSED_SUFFIX if self.reversed else "")
+
+
+def _build_deck() -> tuple[Card, ...]:
+    cards = [Card(i, name, "major", None) for i, name in enumerate(MAJOR_ARCANA)]
+    for suit, ranks in MINOR_SUITS.items():
+        for rank in ranks:
+            cards.append(Card(len(cards), f"{rank} {suit}", "minor", suit))
+    return tuple(cards)
+
+
+DECK: tuple[Card, ...] = _build_deck()
+DECK_SIZE = len(DECK)
+CARD_NAMES: tuple[str, ...] = tuple(c.name for c in DECK)
+_CARD_IDS = range(DECK_SIZE)
+_BY_NAME = {c.name: c for c in DECK}
+
+# Module-level RNG; seed() makes every draw below reproducible (tests)
+_rng = random.Random()
+
+
+def seed(value) -> None:
+    _rng.seed(value)
+
+
+def make_rng(value=None) -> random.Random:
+    """Independent RNG for callers that need their own reproducible stream."""
+    return random.Random(value)
+
+
+def card_by_name(name: str) -> Optional[Card]:
+    return _BY_NAME.get(name)
+
+
+def draw_names(n: int, rng: random.Random | None = None) -> list[str]:
+    """Hot path: n unique card names, upright."""
+    return [CARD_NAMES[i] for i in (rng or _rng).sample(_CARD_IDS, min(n, DECK_SIZE))]
+
+
+def draw(
+    n: int,
+    rng: random.Random | None = None,
+    reversed_rate: float = 0.0,
+) -> list[DrawnCard]:
+    """n unique cards; each is reversed with probability reversed_rate."""
+    rng = rng or _rng
+    ids = rng.sample(_CARD_IDS, min(n, DECK_SIZE))
+    if not reversed_rate:
+        return [DrawnCard(DECK[i]) for i in ids]
+    return [DrawnCard(DECK[i], rng.random() < reversed_rate) for i in ids]
+
+
+def draw_many(
+    k_per_spread: int,
+    n_spreads: int,
+    rng: random.Random | None = None,
+    reversed_rate: float = 0.0,
+) -> list[list[DrawnCard]]:
+    """Batch draw for bulk jobs: n_spreads independent spreads of k unique cards."""
+    rng = rng or _rng
+    k = min(k_per_spread, DECK_SIZE)
+    sample = rng.sample
+    if not reversed_rate:
+        return [[DrawnCard(DECK[i]) for i in sample(_CARD_IDS, k)] for _ in range(n_spreads)]
+    rand = rng.random
+    return [
+        [DrawnCard(DECK[i], rand() < reversed_rate) for i in sample(_CARD_IDS, k)]
+        for _ in range(n_spreads)
+    ]
@@ -0,0 +1,54 @@
+"""
+The bot's own account (getMe), cached for deep links and share cards.
+
+Fetched in the background as soon as the bot is created (bot.create_bot_and_dp)
+and refreshed after IDENTITY_TTL — a rename via BotFather is rare, and until
+the refresh succeeds the last known identity keeps being served.
+"""
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.types import User
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_TTL = 6 * 3600.0
+
+# bot id -> (identity, fetched at monotonic)
+_cache: dict[int, tuple[User, float]] = {}
+_locks: dict[int, asyncio.Lock] = {}
+
+
+def reset():
+    _cache.clear()
+    _locks.clear()
+
+
+async def get_me(bot: Bot) -> User:
+    cached = _cache.get(bot.id)
+    if cached is not None and time.monotonic() - cached[1] < IDENTITY_TTL:
+        return cached[0]
+    async with _locks.setdefault(bot.id, asyncio.Lock()):
+        cached = _cache.get(bot.id)
+        if cached is not None and time.monotonic() - cached[1] < IDENTITY_TTL:
+            return cached[0]
+        try:
+            me = await bot.get_me()
+        except Exception as e:
+            if cached is None:
+                raise
+            logger.warning(f"[identity] getMe refresh failed, serving cached: {e!r}")
+            return cached[0]
+        _cache[bot.id] = (me, time.monotonic())
+        return me
+
+
+async def username(bot: Bot) -> str:
+    return (await get_me(bot)).username
+
+
+async def start_link(bot: Bot, payload: str) -> str:
+    """t.me deep link that opens the bot with /start <payload>."""
+    return f"https://t.me/{await username(bot)}?start={payload}"
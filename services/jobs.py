@@ -0,0 +1,188 @@
+"""
+Durable SQLite queue for paid spread generation (spread_jobs table).
+
+Handlers only enqueue; a pool of workers claims jobs under a lease, runs the
+registered process function and marks them done. A worker that dies leaves
+its job 'running' with a lease that expires, after which another worker
+retries it. Failed attempts back off exponentially; after job_max_attempts
+the job is 'failed' and the on_failed callback tells the user.
+
+pending → running → done
+            ↓  ↑ (retry)
+          failed
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+
+from config import config
+from database import (
+    enqueue_spread_job,
+    claim_spread_job,
+    finish_spread_job,
+    retry_or_fail_spread_job,
+    fail_abandoned_spread_jobs,
+    get_spread_job_counts,
+    release_spread_job,
+)
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+JobFn = Callable[[Bot, dict], Awaitable[None]]
+
+_RETRY_BASE_DELAY = 5.0      # seconds; doubles per failed attempt
+_SWEEP_INTERVAL = 30.0       # how often idle workers look for abandoned jobs
+
+_WORKER_PREFIX = f"{socket.gethostname()}:{os.getpid()}"
+_wakeup = asyncio.Event()
+_last_sweep = 0.0
+_stopping = False
+_current: dict[str, int] = {}   # worker -> id of the job it is running
+
+
+async def enqueue(
+    user_id: int,
+    chat_id: int,
+    spread_type: str,
+    question: str | None,
+    placeholder_message_id: int | None,
+    source_message_id: int | None = None,
+) -> int | None:
+    """
+    Job id, or None when source_message_id (the message that asked for the
+    spread) already has a job: Telegram redelivered the update.
+    """
+    job_id = await enqueue_spread_job(
+        user_id, chat_id, spread_type, question, placeholder_message_id, source_message_id,
+    )
+    if job_id is None:
+        metrics.incr("jobs.duplicates")
+        return None
+    metrics.incr("jobs.enqueued")
+    _wakeup.set()
+    return job_id
+
+
+async def _notify_failed(bot: Bot, job: dict, on_failed: JobFn):
+    try:
+        await on_failed(bot, job)
+    except Exception:
+        logger.exception(f"[jobs] failure notice for job {job['id']} not delivered")
+
+
+async def run_once(bot: Bot, process: JobFn, on_failed: JobFn, worker: str) -> bool:
+    """Claim and run one job; False when nothing was runnable."""
+    job = await claim_spread_job(worker, config.job_lease, config.job_max_attempts)
+    if job is None:
+        return False
+    metrics.incr("jobs.claimed")
+    if job["attempts"] > 1:
+        metrics.incr("jobs.retries")
+    _current[worker] = job["id"]
+    try:
+        with metrics.timer(f"jobs.run_ms.{job['spread_type']}"):
+            await process(bot, job)
+    except asyncio.CancelledError:
+        # Shutdown cut the job off: requeue it now instead of after the lease
+        await asyncio.shield(release_spread_job(job["id"], worker))
+        metrics.incr("jobs.released")
+        raise
+    except Exception as e:
+        logger.warning(f"[jobs] job {job['id']} attempt {job['attempts']} failed: {e!r}")
+        retry_at = time.time() + _RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1)
+        status = await retry_or_fail_spread_job(
+            job["id"], worker, repr(e), retry_at, config.job_max_attempts,
+        )
+        if status == "failed":
+            metrics.incr("jobs.failed")
+            await _notify_failed(bot, job, on_failed)
+    else:
+        if await finish_spread_job(job["id"], worker):
+            metrics.incr("jobs.done")
+        else:
+            # Lease expired mid-run and another worker took over; it will see spread_id
+            metrics.incr("jobs.lease_lost")
+    finally:
+        _current.pop(worker, None)
+    return True
+
+
+async def _sweep(bot: Bot, on_failed: JobFn):
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < _SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    for job in await fail_abandoned_spread_jobs(config.job_max_attempts):
+        metrics.incr("jobs.failed")
+        await _notify_failed(bot, job, on_failed)
+
+
+async def _worker_loop(bot: Bot, process: JobFn, on_failed: JobFn, worker: str):
+    while not _stopping:
+        _wakeup.clear()
+        try:
+            ran = await run_once(bot, process, on_failed, worker)
+            if not ran:
+                await _sweep(bot, on_failed)
+        except Exception:
+            logger.exception(f"[jobs] worker {worker} loop error")
+            ran = False
+        if not ran:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), config.job_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def start_workers(
+    bot: Bot, process: JobFn, on_failed: JobFn, count: int | None = None,
+) -> list[asyncio.Task]:
+    global _stopping
+    _stopping = False
+    count = config.job_workers if count is None else count
+    tasks = [
+        asyncio.create_task(
+            _worker_loop(bot, process, on_failed, f"{_WORKER_PREFIX}:{i}"),
+            name=f"spread-job-worker-{i}",
+        )
+        for i in range(count)
+    ]
+    logger.info(f"[jobs] {count} workers started")
+    return tasks
+
+
+async def stop_workers(tasks: list[asyncio.Task], timeout: float = 0.0) -> dict:
+    """
+    Stop claiming new jobs, give running ones up to `timeout` seconds to
+    finish, then cancel. Cancelled jobs go straight back to pending.
+    """
+    global _stopping
+    _stopping = True
+    _wakeup.set()
+    running = len(_current)
+    pending = set(tasks)
+    if tasks and timeout > 0:
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+    abandoned = len(_current)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    return {"drained": running - abandoned, "abandoned": abandoned}
+
+
+async def wait_idle(timeout: float, poll: float = 0.05) -> bool:
+    """Wait until nothing is pending or running; False on timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        counts = await get_spread_job_counts()
+        if not counts.get("pending") and not counts.get("running"):
+            return True
+        await asyncio.sleep(poll)
+    return False
@@ -0,0 +1,196 @@
+"""
+Graceful shutdown for both run modes.
+
+On SIGTERM/SIGINT the bot stops taking new updates (webhook closes its
+listening socket — Telegram reconnects to whichever process still listens on
+the port, see retire_previous(); polling stops fetching), then within
+config.shutdown_timeout seconds, in order:
+
+  1. pauses the scheduler — no new broadcasts start
+  2. waits for update handlers already running
+  3. lets job workers finish their current job (the rest requeue at once)
+  4. flushes the summarizer's write-behind buffer
+  5. waits for background tasks: spawn()ed work and scheduler jobs
+     (then flushes summaries they queued)
+  6. checkpoints SQLite
+
+Whatever is still running when the deadline hits is cancelled and reported
+as abandoned; the report is logged and returned.
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from config import config
+from database import checkpoint
+from services import jobs, metrics, summarizer
+from services.utils import drain_background, drain_tasks
+
+logger = logging.getLogger(__name__)
+
+_accepting = True
+_inflight: set[asyncio.Task] = set()
+_stop: asyncio.Event | None = None
+
+
+def accepting() -> bool:
+    return _accepting
+
+
+def stop_accepting():
+    global _accepting
+    _accepting = False
+
+
+def reset():
+    """Back to a fresh process state (tests, in-process restarts)."""
+    global _accepting, _stop
+    _accepting = True
+    _inflight.clear()
+    _stop = None
+
+
+def _stop_event() -> asyncio.Event:
+    global _stop
+    if _stop is None:
+        _stop = asyncio.Event()
+    return _stop
+
+
+def request_stop():
+    logger.info("[lifecycle] stop requested")
+    _stop_event().set()
+
+
+async def wait_for_stop():
+    await _stop_event().wait()
+
+
+def install_signal_handlers():
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, request_stop)
+
+
+def update_middleware():
+    """Outer update middleware: tracks the task handling each update."""
+    async def middleware(handler, event, data):
+        task = asyncio.current_task()
+        _inflight.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            _inflight.discard(task)
+
+    return middleware
+
+
+async def _drain_updates(timeout: float) -> dict:
+    # Re-polled: updates still arriving on open keep-alive connections are drained too
+    return await drain_tasks(lambda: _inflight, timeout)
+
+
+# ─── Process handover (webhook mode) ──────────────────────────────────────────
+
+def write_pid_file(path: str):
+    with open(path, "w") as f:
+        f.write(str(os.getpid()))
+
+
+def remove_pid_file(path: str):
+    """Remove the pid file unless a newer process has already claimed it."""
+    try:
+        with open(path) as f:
+            if f.read().strip() != str(os.getpid()):
+                return
+        os.remove(path)
+    except (FileNotFoundError, ValueError):
+        pass
+
+
+def _is_bot_process(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return b"bot.py" in f.read()
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return True  # no /proc: trust the pid file
+
+
+def retire_previous(path: str) -> int | None:
+    """
+    SIGTERM the process recorded in the pid file (it drains and exits), once
+    this one is listening and owns the webhook. Returns its pid, if any.
+    """
+    try:
+        with open(path) as f:
+            pid = int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+    if pid == os.getpid() or not _is_bot_process(pid):
+        return None
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return None
+    logger.info(f"[lifecycle] handover: asked process {pid} to drain")
+    return pid
+
+
+async def _flush_summaries(timeout: float) -> int:
+    pending = summarizer.pending()
+    if not pending:
+        return 0
+    try:
+        await asyncio.wait_for(summarizer.drain(), timeout=max(timeout, 1))
+    except Exception as e:
+        logger.warning(f"[lifecycle] summarizer flush failed: {e!r}")
+        return 0
+    return pending
+
+
+async def shutdown(
+    workers: list[asyncio.Task] | None = None,
+    scheduler=None,
+    timeout: float | None = None,
+    stop_intake=None,
+) -> dict:
+    """
+    Drain everything in flight within `timeout` seconds; returns what was
+    drained vs. abandoned. stop_intake: coroutine fn closing the update source.
+    """
+    timeout = config.shutdown_timeout if timeout is None else timeout
+    started = time.monotonic()
+
+    def remaining() -> float:
+        return max(timeout - (time.monotonic() - started), 0)
+
+    stop_accepting()
+    if stop_intake is not None:
+        await stop_intake()
+    if scheduler is not None and scheduler.running:
+        scheduler.pause()
+
+    report = {"updates": await _drain_updates(remaining())}
+    report["jobs"] = await jobs.stop_workers(workers or [], timeout=remaining())
+    flushed = await _flush_summaries(remaining())
+    report["background"] = await drain_background(remaining())
+    report["summaries_flushed"] = flushed + await _flush_summaries(remaining())
+
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=False)
+    try:
+        await checkpoint()
+        report["checkpoint"] = True
+    except Exception as e:
+        logger.warning(f"[lifecycle] database checkpoint failed: {e!r}")
+        report["checkpoint"] = False
+
+    report["seconds"] = round(time.monotonic() - started, 3)
+    abandoned = sum(part["abandoned"] for part in report.values() if isinstance(part, dict))
+    metrics.incr("lifecycle.abandoned", abandoned)
+    logger.info(f"[lifecycle] shutdown report: {report}")
+    return report
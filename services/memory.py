@@ -1,4 +1,5 @@
 """Topic detection and memory illusion logic for repeated-topic detection."""
+import json
 
 TOPIC_KEYWORDS: dict[str, list[str]] = {
     "отношения": [
@@ -38,6 +39,13 @@ def detect_topic(text: str | None) -> str | None:
     return None
 
 
+def topic_of(spread: dict) -> str | None:
+    """Topic of a ring entry (precomputed) or of a spreads row (from its question)."""
+    if "topic" in spread:
+        return spread["topic"]
+    return detect_topic(spread.get("question"))
+
+
 def has_recurring_topic(current_question: str, recent_spreads: list[dict]) -> bool:
     """True if the same topic appears in current question AND ≥2 recent spreads."""
     if len(recent_spreads) < 2:
@@ -45,10 +53,7 @@ def has_recurring_topic(current_question: str, recent_spreads: list[dict]) -> bo
     current_topic = detect_topic(current_question)
     if not current_topic:
         return False
-    matching = sum(
-        1 for s in recent_spreads
-        if detect_topic(s.get("question") or "") == current_topic
-    )
+    matching = sum(1 for s in recent_spreads if topic_of(s) == current_topic)
     return matching >= 2
 
 
@@ -60,9 +65,50 @@ def should_use_memory(user: dict, current_question: str, recent_spreads: list[di
     )
 
 
-MEMORY_ADDON = """
+# ─── Recent-memory ring ───────────────────────────────────────────────────────
+#
+# users.memory_ring: JSON list of the user's latest RING_SIZE spreads, newest
+# first, as {id, spread_type, topic, summary, created_at}. Written in the same
+# transaction as the spread (database.save_spread) and its summary, so the
+# spread flow reads one users row instead of querying and sorting spreads.
+
+RING_SIZE = 5
+
+
+def ring_entry(spread_id: int, spread_type: str, question: str | None,
+               summary: str | None, created_at: str) -> dict:
+    return {
+        "id": spread_id,
+        "spread_type": spread_type,
+        "topic": detect_topic(question),
+        "summary": summary,
+        "created_at": created_at,
+    }
+
+
+def read_ring(user: dict | None) -> list[dict]:
+    return json.loads((user or {}).get("memory_ring") or "[]")
+
+
+def ring_push(ring: str | None, entry: dict) -> str:
+    entries = json.loads(ring or "[]")
+    return json.dumps([entry] + entries[:RING_SIZE - 1], ensure_ascii=False)
+
+
+def ring_set_summaries(ring: str | None, summaries: dict[int, str]) -> str | None:
+    """Ring with summaries filled in by spread id; None when no entry matched."""
+    entries = json.loads(ring or "[]")
+    hit = False
+    for entry in entries:
+        if entry["id"] in summaries:
+            entry["summary"] = summaries[entry["id"]]
+            hit = True
+    return json.dumps(entries, ensure_ascii=False) if hit else None
+
 
-ДОПОЛНИТЕЛЬНОЕ ПРАВИЛО ДЛЯ ЭТОГО РАСКЛАДА:
+# Enabled per request by the MEMORY_MARKER in the session context
+# (services.context.STABLE_SYSTEM_PROMPT)
+MEMORY_RULE = """
 
 Текущий вопрос пользователя перекликается с темой,
 к которой он уже обращался раньше.
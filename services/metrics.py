@@ -0,0 +1,75 @@
+"""In-process counters and latency samples. No external deps — read via snapshot()."""
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Per-timer sample window; older samples fall off so memory stays bounded
+_MAX_SAMPLES = 10_000
+
+_counters: dict[str, float] = defaultdict(float)
+_samples: dict[str, deque] = defaultdict(lambda: deque(maxlen=_MAX_SAMPLES))
+
+
+def incr(name: str, value: float = 1) -> None:
+    _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample (milliseconds for timers, raw value otherwise)."""
+    _samples[name].append(value)
+
+
+@contextmanager
+def timer(name: str):
+    """Observe the wall time of the block in milliseconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000)
+
+
+def counter(name: str) -> float:
+    return _counters.get(name, 0)
+
+
+def count(name: str) -> int:
+    """Number of samples currently held for `name`."""
+    samples = _samples.get(name)
+    return len(samples) if samples else 0
+
+
+def percentile(name: str, q: float) -> float | None:
+    """Nearest-rank percentile (q in 0..100) of the samples for `name`."""
+    samples = _samples.get(name)
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summary(name: str) -> dict | None:
+    samples = _samples.get(name)
+    if not samples:
+        return None
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(name, 50),
+        "p95": percentile(name, 95),
+        "p99": percentile(name, 99),
+        "max": max(samples),
+    }
+
+
+def snapshot() -> dict:
+    return {
+        "counters": dict(_counters),
+        "timings": {name: summary(name) for name in list(_samples) if _samples[name]},
+    }
+
+
+def reset() -> None:
+    _counters.clear()
+    _samples.clear()
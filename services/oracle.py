@@ -1,59 +1,141 @@
-import random
-from openai import AsyncOpenAI
+import asyncio
+import json
+import threading
+from functools import cache, lru_cache
+from typing import TYPE_CHECKING, Awaitable, Callable
+
 from config import config
-from services.context import BASE_SYSTEM_PROMPT
+from services import card_pool, deck, metrics, resilience, response_cache, tokens, transport
+from services.context import BASE_SYSTEM_PROMPT, STABLE_SYSTEM_PROMPT
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# The OpenAI client (and the openai package, ~0.5 s of imports) is created on
+# first use, not at import: importing handlers must stay cheap for cold start.
+_client_lock = threading.Lock()
+
+
+def get_client() -> "AsyncOpenAI":
+    """Shared AsyncOpenAI client; safe to call from a thread (see bot.warm_up)."""
+    with _client_lock:
+        if "client" not in globals():
+            from openai import AsyncOpenAI
+            # Retries are handled by services.resilience, within the spread deadline
+            globals()["client"] = AsyncOpenAI(
+                api_key=config.openai_api_key,
+                base_url=config.openai_base_url or None,
+                max_retries=0,
+                timeout=transport.openai_timeout(),
+                http_client=transport.openai_http_client(),
+            )
+        return globals()["client"]
+
+
+def __getattr__(name: str):
+    # `oracle.client` keeps working for callers and tests that patch it
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Whole-call deadline (retries included) per spread type, seconds.
+# Longer readings get more room; the nightly pool is never user-facing.
+SPREAD_DEADLINES = {
+    "summary_batch":   30,
+    "support":         30,
+    "spread_day":      30,
+    "spread_question": 45,
+    "month_spread":    60,
+    "spread_compat":   75,
+    "spread_deep":     90,
+    "ritual":         100,
+    "spread_year":    120,
+    "spread_year_part": 60,
+    "card_pool":      120,
+}
+DEFAULT_DEADLINE = 60
 
-client = AsyncOpenAI(api_key=config.openai_api_key)
+# Hedging needs a latency history before p95 means anything
+_HEDGE_MIN_SAMPLES = 20
+
+_RETRYABLE_NAMES = ("RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError")
+
+_breaker = resilience.CircuitBreaker(
+    "openai",
+    failure_threshold=config.openai_breaker_threshold,
+    reset_timeout=config.openai_breaker_reset,
+)
 
 # Alias for legacy imports
 SYSTEM_PROMPT = BASE_SYSTEM_PROMPT
 
-# Full Rider-Waite deck for reference (oracle picks randomly)
-MAJOR_ARCANA = [
-    "Шут", "Маг", "Верховная Жрица", "Императрица", "Император",
-    "Иерофант", "Влюблённые", "Колесница", "Сила", "Отшельник",
-    "Колесо Фортуны", "Справедливость", "Повешенный", "Смерть",
-    "Умеренность", "Дьявол", "Башня", "Звезда", "Луна", "Солнце",
-    "Суд", "Мир",
-]
-MINOR_SUITS = {
-    "Жезлов": ["Туз", "Двойка", "Тройка", "Четвёрка", "Пятёрка",
-               "Шестёрка", "Семёрка", "Восьмёрка", "Девятка", "Десятка",
-               "Паж", "Рыцарь", "Королева", "Король"],
-    "Кубков": ["Туз", "Двойка", "Тройка", "Четвёрка", "Пятёрка",
-               "Шестёрка", "Семёрка", "Восьмёрка", "Девятка", "Десятка",
-               "Паж", "Рыцарь", "Королева", "Король"],
-    "Мечей": ["Туз", "Двойка", "Тройка", "Четвёрка", "Пятёрка",
-              "Шестёрка", "Семёрка", "Восьмёрка", "Девятка", "Десятка",
-              "Паж", "Рыцарь", "Королева", "Король"],
-    "Пентаклей": ["Туз", "Двойка", "Тройка", "Четвёрка", "Пятёрка",
-                  "Шестёрка", "Семёрка", "Восьмёрка", "Девятка", "Десятка",
-                  "Паж", "Рыцарь", "Королева", "Король"],
-}
+# Deck lives in services.deck; names re-exported for legacy imports
+MAJOR_ARCANA = deck.MAJOR_ARCANA
+MINOR_SUITS = deck.MINOR_SUITS
 
 
-def draw_cards(n: int) -> list[str]:
+def draw_cards(n: int, rng=None) -> list[str]:
     """Draw n unique cards from the full Rider-Waite deck."""
-    all_cards = list(MAJOR_ARCANA)
-    for suit, ranks in MINOR_SUITS.items():
-        for rank in ranks:
-            all_cards.append(f"{rank} {suit}")
-    return random.sample(all_cards, min(n, len(all_cards)))
+    return deck.draw_names(n, rng)
 
 
 # ─── Spread generators ────────────────────────────────────────────────────────
 
-async def generate_card_of_day(question: str, system_prompt: str | None = None) -> str:
+async def generate_card_of_day(
+    question: str, context: str | None = None, user: dict | None = None,
+) -> str:
     card = draw_cards(1)[0]
+    if config.card_pool_enabled and user:
+        pooled = await card_pool.serve(card, user)
+        if pooled:
+            return pooled
+    if config.card_cache_enabled and user:
+        return await response_cache.card_of_day(card, question, user, _generate_generic_card_of_day)
     prompt = (
         f"Пользователь просит карту дня. Его запрос или ситуация: «{question}»\n\n"
         f"Выпавшая карта: {card}\n\n"
         "Дай послание на день. Длина: 100-150 слов."
     )
-    return await _ask_velhar(prompt)
+    return await _ask_velhar(prompt, context, spread_type="spread_day")
 
 
-async def generate_three_paths(question: str, system_prompt: str | None = None) -> str:
+async def _generate_generic_card_of_day(
+    card: str, topic: str, zodiac: str, moon_phase: str, time_of_day: str,
+) -> tuple[str, int, int]:
+    """Reusable card-of-day text for the response cache — no name, no verbatim question."""
+    prompt = (
+        f"Пользователь просит карту дня. Тема его запроса: «{topic}».\n"
+        + (f"Знак зодиака: {zodiac}.\n" if zodiac else "")
+        + f"Сейчас {time_of_day}, фаза луны: {moon_phase}.\n\n"
+        f"Выпавшая карта: {card}\n\n"
+        "Дай послание на день. Не называй имени и не цитируй вопрос — "
+        "послание должно подойти любой душе с этой темой. Длина: 100-150 слов."
+    )
+    response = await _complete(prompt, spread_type="spread_day")
+    usage = response.usage
+    return (
+        response.choices[0].message.content,
+        usage.prompt_tokens if usage else 0,
+        usage.completion_tokens if usage else 0,
+    )
+
+
+async def generate_pool_card_of_day(card: str, zodiac: str, moon_phase: str) -> str:
+    """Card-of-day text for the overnight pool; the reader's name is a marker."""
+    prompt = (
+        "Пользователь просит карту дня.\n"
+        + (f"Знак зодиака: {zodiac}.\n" if zodiac else "")
+        + f"Фаза луны: {moon_phase}.\n\n"
+        f"Выпавшая карта: {card}\n\n"
+        f"Дай послание на день. Один раз обратись к человеку по имени, написав вместо имени "
+        f"ровно {card_pool.NAME_MARKER}. Длина: 100-150 слов."
+    )
+    return await _ask_velhar(prompt, spread_type="card_pool")
+
+
+async def generate_three_paths(
+    question: str, context: str | None = None, user: dict | None = None,
+) -> str:
     cards = draw_cards(3)
     prompt = (
         f"Пользователь просит расклад на три пути. Его запрос: «{question}»\n\n"
@@ -63,10 +145,12 @@ async def generate_three_paths(question: str, system_prompt: str | None = None)
         f"  3. Будущее — {cards[2]}\n\n"
         "Дай полный расклад. Длина: 250-350 слов."
     )
-    return await _ask_velhar(prompt, system_prompt)
+    return await _ask_velhar(prompt, context, spread_type="spread_question")
 
 
-async def generate_mirror_of_fate(question: str, system_prompt: str | None = None) -> str:
+async def generate_mirror_of_fate(
+    question: str, context: str | None = None, user: dict | None = None,
+) -> str:
     cards = draw_cards(5)
     positions = ["Суть ситуации", "Скрытые силы", "Препятствие", "Ресурс", "Итог"]
     cards_block = "\n".join(f"  {i+1}. {pos} — {card}"
@@ -76,27 +160,100 @@ async def generate_mirror_of_fate(question: str, system_prompt: str | None = Non
         f"Карты:\n{cards_block}\n\n"
         "Дай глубокий расклад. Длина: 500-700 слов."
     )
-    return await _ask_velhar(prompt, system_prompt)
+    return await _ask_velhar(prompt, context, spread_type="spread_deep")
+
+
+YEAR_MONTHS = [
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь",
+]
+
+# Fan-out budget per part; the monolithic call gets the default 2048 for all 12 months
+_YEAR_INTRO_MAX_TOKENS = 300
+_YEAR_QUARTER_MAX_TOKENS = 700
+
+SectionFn = Callable[[int, str], Awaitable[None]]
 
 
-async def generate_year_under_stars(question: str, system_prompt: str | None = None) -> str:
+async def generate_year_under_stars(
+    question: str,
+    context: str | None = None,
+    user: dict | None = None,
+    on_section: SectionFn | None = None,
+) -> str:
     cards = draw_cards(12)
-    months = [
-        "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
-        "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь",
-    ]
     cards_block = "\n".join(f"  {month} — {card}"
-                            for month, card in zip(months, cards))
+                            for month, card in zip(YEAR_MONTHS, cards))
+    # Half-open breaker admits one trial call, not five: go monolithic until it closes
+    if config.year_fanout and _breaker.state == "closed":
+        return await _generate_year_fanout(question, cards_block, context, on_section)
     prompt = (
         f"Пользователь заказал расклад «Год под звёздами». Его запрос: «{question}»\n\n"
         f"12 карт по месяцам:\n{cards_block}\n\n"
         "Дай краткое, но ёмкое мистическое послание на каждый месяц (2-4 предложения на месяц). "
         "Начни с вступления 2-3 предложения, затем каждый месяц с новой строки."
     )
-    return await _ask_velhar(prompt, system_prompt)
+    text = await _ask_velhar(prompt, context, spread_type="spread_year")
+    if on_section:
+        await on_section(0, text)
+    return text
+
 
+def year_fanout_prompts(question: str, cards_block: str) -> list[tuple[str, int]]:
+    """(prompt, max_tokens) for the introduction and the four quarters, in reading order."""
+    head = (
+        f"Пользователь заказал расклад «Год под звёздами». Его запрос: «{question}»\n\n"
+        f"12 карт по месяцам (весь расклад года):\n{cards_block}\n\n"
+    )
+    parts = [(
+        head + "Напиши только вступление к раскладу года: 2-3 предложения о его общей энергии. "
+        "Месяцы не разбирай — их раскроют отдельно.",
+        _YEAR_INTRO_MAX_TOKENS,
+    )]
+    for q in range(4):
+        months = ", ".join(YEAR_MONTHS[q * 3:q * 3 + 3])
+        parts.append((
+            head + f"Напиши только часть расклада за месяцы: {months}. "
+            "Каждый месяц с новой строки, начиная с его названия, 2-4 предложения на месяц. "
+            "Без вступления и без заключения — это часть общего послания.",
+            _YEAR_QUARTER_MAX_TOKENS,
+        ))
+    return parts
 
-async def generate_fullmoon_ritual(question: str, system_prompt: str | None = None) -> str:
+
+async def _generate_year_fanout(
+    question: str, cards_block: str, context: str | None, on_section: SectionFn | None,
+) -> str:
+    """
+    Introduction and four quarters as five concurrent completions over one card
+    draw. Sections are handed to on_section in reading order as soon as each
+    one and everything before it are ready.
+    """
+    async def part(prompt: str, max_tokens: int) -> str:
+        response = await _complete(
+            prompt, context, max_tokens=max_tokens, spread_type="spread_year_part",
+        )
+        return response.choices[0].message.content.strip()
+
+    tasks = [
+        asyncio.create_task(part(prompt, max_tokens))
+        for prompt, max_tokens in year_fanout_prompts(question, cards_block)
+    ]
+    sections = []
+    try:
+        for i, task in enumerate(tasks):
+            sections.append(await task)
+            if on_section:
+                await on_section(i, sections[-1])
+    finally:
+        for task in tasks:
+            task.cancel()
+    return "\n\n".join(sections)
+
+
+async def generate_fullmoon_ritual(
+    question: str, context: str | None = None, user: dict | None = None,
+) -> str:
     cards = draw_cards(7)
     positions = [
         "Что отпустить", "Что принять", "Тайный союзник",
@@ -110,10 +267,12 @@ async def generate_fullmoon_ritual(question: str, system_prompt: str | None = No
         "Дай торжественный ритуальный расклад. Длина: 600-800 слов. "
         "Помни — это особое, редкое послание луны."
     )
-    return await _ask_velhar(prompt, system_prompt)
+    return await _ask_velhar(prompt, context, spread_type="ritual")
 
 
-async def generate_compatibility(question: str, system_prompt: str | None = None) -> str:
+async def generate_compatibility(
+    question: str, context: str | None = None, user: dict | None = None,
+) -> str:
     cards = draw_cards(6)
     positions = [
         "Энергия первой души", "Энергия второй души", "Что притягивает",
@@ -128,10 +287,12 @@ async def generate_compatibility(question: str, system_prompt: str | None = None
         f"Шесть карт:\n{cards_block}\n\n"
         "Дай глубокий расклад на совместимость. Длина: 400-550 слов."
     )
-    return await _ask_velhar(prompt, system_prompt)
+    return await _ask_velhar(prompt, context, spread_type="spread_compat")
 
 
-async def generate_subscription_spread(question: str, system_prompt: str | None = None) -> str:
+async def generate_subscription_spread(
+    question: str, context: str | None = None, user: dict | None = None,
+) -> str:
     cards = draw_cards(4)
     positions = ["Энергия месяца", "Главный урок", "Скрытая возможность", "Итог месяца"]
     cards_block = "\n".join(f"  {i+1}. {pos} — {card}"
@@ -141,37 +302,146 @@ async def generate_subscription_spread(question: str, system_prompt: str | None
         f"Карты:\n{cards_block}\n\n"
         "Дай расклад на месяц. Длина: 300-450 слов."
     )
-    return await _ask_velhar(prompt, system_prompt)
+    return await _ask_velhar(prompt, context, spread_type="month_spread")
 
 
 # ─── Core API call ────────────────────────────────────────────────────────────
 
-async def _ask_velhar(user_prompt: str, system_prompt: str | None = None) -> str:
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        max_tokens=2048,
-        messages=[
-            {"role": "system", "content": system_prompt or SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
+@lru_cache(maxsize=8)
+def _system_tokens(system_prompt: str) -> int:
+    """Token count of a system prompt; there are only a few and they never change."""
+    return tokens.count(system_prompt)
+
+
+@cache
+def _retryable_errors() -> tuple[type[BaseException], ...]:
+    import openai
+    return tuple(getattr(openai, name) for name in _RETRYABLE_NAMES)
+
+
+def _is_retryable(error: BaseException) -> bool:
+    return isinstance(error, _retryable_errors())
+
+
+def _policy_for(spread_type: str) -> resilience.RetryPolicy:
+    deadline = SPREAD_DEADLINES.get(spread_type, DEFAULT_DEADLINE)
+    hedge_after = None
+    latency_metric = f"openai.latency_ms.{spread_type}"
+    if config.openai_hedging and metrics.count(latency_metric) >= _HEDGE_MIN_SAMPLES:
+        p95 = metrics.percentile(latency_metric, 95) / 1000
+        # A hedge that can't finish before the deadline only burns tokens
+        if p95 < deadline / 2:
+            hedge_after = p95
+    return resilience.RetryPolicy(
+        deadline=deadline,
+        attempts=config.openai_max_attempts,
+        hedge_after=hedge_after,
+    )
+
+
+async def _complete(
+    user_prompt: str,
+    context: str | None = None,
+    max_tokens: int = 2048,
+    spread_type: str = "default",
+    json_output: bool = False,
+    system_prompt: str = STABLE_SYSTEM_PROMPT,
+):
+    """
+    Chat completion under the spread type's resilience policy; returns the raw response.
+
+    Message layout is prefix-cache friendly: the identical system prompt first,
+    then the per-user session context, then the spread-specific request.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    if context:
+        messages.append({"role": "system", "content": context})
+    messages.append({"role": "user", "content": user_prompt})
+    metrics.observe(
+        f"prompt_tokens.{spread_type}",
+        _system_tokens(system_prompt) + sum(tokens.count(m["content"]) for m in messages[1:]),
+    )
+    extra = {"response_format": {"type": "json_object"}} if json_output else {}
+
+    async def attempt():
+        with metrics.timer(f"openai.latency_ms.{spread_type}"):
+            return await get_client().chat.completions.create(
+                model="gpt-4o", max_tokens=max_tokens, messages=messages, **extra,
+            )
+
+    response = await resilience.call(
+        attempt, _policy_for(spread_type), _breaker, _is_retryable, name="openai",
     )
+    metrics.incr("openai.requests")
+    _record_usage(response.usage, spread_type)
+    return response
+
+
+def _record_usage(usage, spread_type: str):
+    if not usage:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    for suffix in ("", f".{spread_type}"):
+        metrics.incr(f"openai.prompt_tokens{suffix}", usage.prompt_tokens)
+        metrics.incr(f"openai.cached_tokens{suffix}", cached)
+    metrics.incr("openai.completion_tokens", usage.completion_tokens)
+
+
+def prompt_cache_report() -> dict:
+    """Share of input tokens served from the provider's prefix cache since start."""
+    prompt = metrics.counter("openai.prompt_tokens")
+    cached = metrics.counter("openai.cached_tokens")
+    return {
+        "prompt_tokens": int(prompt),
+        "cached_tokens": int(cached),
+        "cached_rate": cached / prompt if prompt else 0.0,
+    }
+
+
+async def _ask_velhar(
+    user_prompt: str, context: str | None = None, spread_type: str = "default",
+) -> str:
+    response = await _complete(user_prompt, context, spread_type=spread_type)
     return response.choices[0].message.content
 
 
-async def generate_summary(full_response: str) -> str:
-    """Generate a 1-sentence summary of a spread for memory context."""
+_BATCH_SUMMARY_INSTRUCTION = (
+    "Тебе дан список таро-раскладов с номерами. Сократи каждый до одного предложения "
+    "(не более 15 слов) — только суть послания, без вступлений. "
+    'Ответь JSON-объектом: {"summaries": [{"id": <номер>, "summary": "<предложение>"}]}.'
+)
+
+
+async def generate_summaries(full_responses: list[str]) -> list[str | None]:
+    """
+    One JSON-output request for several spreads. Returns a summary per input,
+    None where the model's answer is missing or unparseable (caller falls back).
+    """
+    items = "\n\n".join(f"[{i}]\n{text}" for i, text in enumerate(full_responses))
+    resp = await _complete(
+        items,
+        system_prompt=_BATCH_SUMMARY_INSTRUCTION,
+        max_tokens=60 * len(full_responses) + 50,
+        spread_type="summary_batch",
+        json_output=True,
+    )
+    return parse_summaries(resp.choices[0].message.content, len(full_responses))
+
+
+def parse_summaries(content: str | None, n: int) -> list[str | None]:
+    result: list[str | None] = [None] * n
     try:
-        resp = await client.chat.completions.create(
-            model="gpt-4o",
-            max_tokens=60,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Сократи таро-расклад до одного предложения (не более 15 слов). Только суть послания, без вступлений.",
-                },
-                {"role": "user", "content": full_response},
-            ],
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception:
-        return full_response[:100] + "..."
+        entries = json.loads(content or "")["summaries"]
+    except (ValueError, KeyError, TypeError):
+        return result
+    if not isinstance(entries, list):
+        return result
+    for entry in entries:
+        try:
+            i, summary = int(entry["id"]), entry["summary"]
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= i < n and isinstance(summary, str) and summary.strip():
+            result[i] = summary.strip()
+    return result
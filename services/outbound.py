@@ -0,0 +1,142 @@
+"""
+Outbound Bot API budget: a request middleware on the Telegram session
+(services.transport) plus an update middleware for accounting.
+
+  accounting  — telegram.calls.<method> counters; telegram.calls_per_update
+                samples (every call made while handling one update, including
+                tasks it started, e.g. the typing indicator)
+  coalescing  — a sendChatAction repeating the one still shown in that chat is
+                answered locally; a message sent to the chat clears it
+  rate limits — messages and edits wait for a per-chat slot (private chats
+                ~1/s with a small burst, groups 20/min) and a global one
+                (30/s), so Telegram never has to answer 429. A 429 that still
+                arrives blocks the chat for retry_after and is retried once.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendChatAction
+
+from config import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Telegram shows a chat action for ~5 s and presence refreshes it every 4.5 s
+# (services.utils.TYPING_REFRESH): repeats inside this window are redundant
+CHAT_ACTION_TTL = 4.0
+
+_GLOBAL = "*"
+_PRUNE_ABOVE = 4096
+
+_calls: ContextVar[Counter | None] = ContextVar("telegram_calls", default=None)
+# chat_id -> (action, sent at monotonic)
+_actions: dict[int, tuple[str, float]] = {}
+# chat_id | _GLOBAL -> theoretical arrival time of the next call (GCRA)
+_slots: dict[int | str, float] = {}
+
+
+def reset():
+    _actions.clear()
+    _slots.clear()
+
+
+def current_calls() -> Counter | None:
+    """Calls made so far while handling the current update (None outside one)."""
+    return _calls.get()
+
+
+def update_middleware():
+    """Outer update middleware: counts the Bot API calls each update causes."""
+    async def middleware(handler, event, data):
+        calls = Counter()
+        token = _calls.set(calls)
+        try:
+            return await handler(event, data)
+        finally:
+            _calls.reset(token)
+            metrics.observe("telegram.calls_per_update", sum(calls.values()))
+            logger.debug(f"[outbound] update {event.update_id}: {dict(calls)}")
+
+    return middleware
+
+
+def _limits(chat_id: int) -> tuple[float, int]:
+    if chat_id < 0:
+        return 60.0 / config.telegram_group_per_minute, config.telegram_chat_burst
+    return 1.0 / config.telegram_chat_rate, config.telegram_chat_burst
+
+
+def _reserve(key: int | str, interval: float, burst: int, now: float) -> float:
+    """Book the next slot for `key`; returns how long to wait for it."""
+    tat = max(_slots.get(key, now), now)
+    _slots[key] = tat + interval
+    return max(0.0, tat - interval * (burst - 1) - now)
+
+
+def _prune(now: float):
+    for key in [k for k, tat in _slots.items() if tat <= now]:
+        del _slots[key]
+    for chat_id in [c for c, (_, at) in _actions.items() if now - at >= CHAT_ACTION_TTL]:
+        del _actions[chat_id]
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(chat_id, int):
+            chat_id = None
+        now = time.monotonic()
+        if len(_slots) + len(_actions) > _PRUNE_ABOVE:
+            _prune(now)
+
+        if isinstance(method, SendChatAction) and chat_id is not None:
+            shown = _actions.get(chat_id)
+            if shown and shown[0] == method.action and now - shown[1] < CHAT_ACTION_TTL:
+                metrics.incr("telegram.coalesced.sendChatAction")
+                return True
+            _actions[chat_id] = (method.action, now)
+
+        metrics.incr(f"telegram.calls.{name}")
+        calls = _calls.get()
+        if calls is not None:
+            calls[name] += 1
+
+        limited = (
+            chat_id is not None
+            and name.startswith(("send", "edit", "copy", "forward"))
+            and name != "sendChatAction"
+        )
+        if limited:
+            if name.startswith("send"):
+                _actions.pop(chat_id, None)  # a new message hides the chat action
+            interval, burst = _limits(chat_id)
+            delay = _reserve(chat_id, interval, burst, now)
+            # The global slot is booked for when the chat slot opens, not for
+            # now: otherwise calls released together after a chat wait would
+            # all ride on global slots that expired long ago
+            delay += _reserve(
+                _GLOBAL, 1.0 / config.telegram_global_rate, config.telegram_global_rate, now + delay,
+            )
+            if delay > 0:
+                metrics.observe("telegram.rate_wait_ms", delay * 1000)
+                await asyncio.sleep(delay)
+
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            metrics.incr("telegram.retry_after")
+            if not limited:
+                raise
+            logger.warning(f"[outbound] 429 for chat {chat_id}: retry after {e.retry_after}s")
+            interval, burst = _limits(chat_id)
+            blocked = time.monotonic() + e.retry_after + interval * (burst - 1)
+            _slots[chat_id] = max(_slots.get(chat_id, 0.0), blocked)
+            await asyncio.sleep(e.retry_after)
+            return await make_request(bot, method)
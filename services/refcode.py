@@ -0,0 +1,66 @@
+"""
+Referral codes as a keyed permutation of the user id.
+
+The id goes through a 4-round Feistel network (round function: keyed
+BLAKE2b) and is written in Crockford base32, so a code is computed, never
+probed for: distinct users always get distinct codes and nothing about the
+id or signup order shows through. Ids below 2**50 — every Telegram id today —
+give 10 characters, larger ones (Telegram allows 52 bits) 12. Codes from the
+old random scheme are all 8 characters long, so the two never collide;
+users.referral_code keeps both behind a unique index.
+
+The key is REFERRAL_CODE_KEY, or derived from BOT_TOKEN when unset. Codes are
+stored when first issued, so changing the key only affects users who have
+no code yet — but a new code may then equal one issued under the old key.
+For that case encode(fallback=True) appends FALLBACK_MARK: an odd length
+(11 or 13) that neither scheme produces, unique among fallback codes for
+the same reason permutation codes are.
+"""
+import hashlib
+from functools import lru_cache
+
+from config import config
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford: no I, L, O, U
+ROUNDS = 4
+WIDTHS = (50, 60)  # bits; 5 bits per character
+FALLBACK_MARK = "X"
+
+
+@lru_cache(maxsize=4)
+def _derive_key(secret: str) -> bytes:
+    return hashlib.blake2b(secret.encode("utf-8"), person=b"velhar-refcode").digest()
+
+
+def _key() -> bytes:
+    return _derive_key(config.referral_code_key or config.bot_token)
+
+
+def _round(key: bytes, i: int, half: int, mask: int) -> int:
+    digest = hashlib.blake2b(
+        (i << 56 | half).to_bytes(8, "big"), key=key, digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") & mask
+
+
+def _permute(n: int, bits: int, key: bytes) -> int:
+    half = bits // 2
+    mask = (1 << half) - 1
+    left, right = n >> half, n & mask
+    for i in range(ROUNDS):
+        left, right = right, left ^ _round(key, i, right, mask)
+    return left << half | right
+
+
+def encode(user_id: int, fallback: bool = False) -> str:
+    if user_id < 0:
+        raise ValueError(f"user id must be non-negative: {user_id}")
+    for bits in WIDTHS:
+        if user_id < 1 << bits:
+            n = _permute(user_id, bits, _key())
+            code = "".join(
+                ALPHABET[n >> shift & 31] for shift in range(bits - 5, -1, -5)
+            )
+            return code + FALLBACK_MARK if fallback else code
+    raise ValueError(f"user id too large for a referral code: {user_id}")
+
@@ -1,17 +1,21 @@
 """APScheduler-based reminder jobs for VELHAR bot."""
 import logging
 import random
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 
 from database import (
     get_inactive_users,
     get_all_active_users,
     get_users_with_spreads_this_week,
 )
+from config import config
 from services.context import get_days_until_fullmoon
+from services.utils import background
 
 logger = logging.getLogger(__name__)
 MOSCOW_TZ = ZoneInfo("Europe/Moscow")
@@ -50,11 +54,39 @@ def setup_scheduler(bot) -> AsyncIOScheduler:
         replace_existing=True,
     )
 
+    if config.card_pool_enabled:
+        # Nightly (off-peak) — pre-generate today's «Карта дня» pool
+        _scheduler.add_job(
+            _build_card_pool,
+            CronTrigger(hour=config.card_pool_hour, minute=0, timezone=MOSCOW_TZ),
+            id="card_pool",
+            replace_existing=True,
+            misfire_grace_time=3600,
+        )
+        # Shortly after start — resume a build interrupted by a restart
+        _scheduler.add_job(
+            _build_card_pool,
+            DateTrigger(run_date=datetime.now(MOSCOW_TZ) + timedelta(minutes=1)),
+            id="card_pool_resume",
+            replace_existing=True,
+        )
+
+    if config.archive_enabled:
+        # Nightly (off-peak) — move old spreads to cold storage, then VACUUM
+        _scheduler.add_job(
+            _archive_spreads,
+            CronTrigger(hour=config.archive_hour, minute=30, timezone=MOSCOW_TZ),
+            id="archive_spreads",
+            replace_existing=True,
+            misfire_grace_time=3600,
+        )
+
     return _scheduler
 
 
 # ─── Job implementations ──────────────────────────────────────────────────────
 
+@background
 async def _remind_inactive():
     """Send a nudge to users who haven't interacted in 3+ days."""
     if not _bot:
@@ -90,6 +122,7 @@ async def _remind_inactive():
             logger.debug(f"Cannot notify {user['user_id']}: {e}")
 
 
+@background
 async def _fullmoon_reminder():
     """Warn active users 2 days before full moon."""
     if not _bot:
@@ -116,6 +149,7 @@ async def _fullmoon_reminder():
             logger.debug(f"Cannot notify {user['user_id']}: {e}")
 
 
+@background
 async def _weekly_summary():
     """Send weekly recap to users who had spreads this week."""
     if not _bot:
@@ -139,3 +173,16 @@ async def _weekly_summary():
             )
         except Exception as e:
             logger.debug(f"Cannot notify {user['user_id']}: {e}")
+
+
+@background
+async def _build_card_pool():
+    """Generate missing «Карта дня» pool entries for today (resumable)."""
+    from services import card_pool, oracle
+    await card_pool.build_pool(oracle.generate_pool_card_of_day)
+
+
+@background
+async def _archive_spreads():
+    from services import archive
+    await archive.run()
@@ -0,0 +1,165 @@
+"""
+Resilience for upstream calls: overall deadline, jittered exponential retries,
+optional hedged duplicate request and a circuit breaker. Every outcome is
+counted in services.metrics under the caller-supplied name prefix.
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from services import metrics
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the breaker is open."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    deadline: float                     # seconds for the whole call, retries included
+    attempts: int = 3
+    base_delay: float = 0.5             # first backoff; doubles per attempt (full jitter)
+    max_delay: float = 8.0
+    hedge_after: float | None = None    # send a duplicate if no answer after this many seconds
+
+
+class CircuitBreaker:
+    """
+    closed → open after `failure_threshold` consecutive failures;
+    open → half-open after `reset_timeout` s, where a single trial call decides.
+
+    allow() hands out a ticket per admitted call; the caller passes it back to
+    record_success / record_failure / release_trial, so a late verdict from a
+    call admitted earlier can't end (or double up) the half-open trial.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial: object | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> object | None:
+        """A ticket for the admitted call, or None while the circuit rejects it."""
+        state = self.state
+        if state == "closed":
+            return object()
+        if state == "half_open" and self._trial is None:
+            self._trial = object()
+            return self._trial
+        return None
+
+    def release_trial(self, ticket: object | None = None):
+        """The call ended without a verdict (cancelled): if it was the trial, let the next call try."""
+        if ticket is not None and ticket is self._trial:
+            self._trial = None
+
+    def record_success(self, ticket: object | None = None):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = None  # closed: whatever trial is still running is an ordinary call now
+
+    def record_failure(self, ticket: object | None = None):
+        self.failures += 1
+        trial = ticket is not None and ticket is self._trial
+        if trial:
+            self._trial = None
+            metrics.incr(f"{self.name}.circuit_opened")
+            self.opened_at = time.monotonic()
+        elif self.opened_at is None and self.failures >= self.failure_threshold:
+            metrics.incr(f"{self.name}.circuit_opened")
+            self.opened_at = time.monotonic()
+
+
+async def _hedged(fn: Callable[[], Awaitable[T]], hedge_after: float | None, name: str) -> T:
+    """Run fn; if it hasn't answered after hedge_after s, race a duplicate against it."""
+    first = asyncio.ensure_future(fn())
+    tasks = {first}
+    try:
+        if hedge_after is None:
+            return await first
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            metrics.incr(f"{name}.hedges")
+            second = asyncio.ensure_future(fn())
+            tasks.add(second)
+        error: BaseException | None = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        metrics.incr(f"{name}.hedge_wins")
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def call(
+    fn: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    breaker: CircuitBreaker,
+    is_retryable: Callable[[BaseException], bool],
+    name: str,
+) -> T:
+    """Call fn under policy. Raises CircuitOpenError, TimeoutError or the last upstream error."""
+    loop = asyncio.get_running_loop()
+    call_started = loop.time()
+    deadline_at = call_started + policy.deadline
+
+    for attempt in range(1, policy.attempts + 1):
+        ticket = breaker.allow()
+        if ticket is None:
+            metrics.incr(f"{name}.circuit_rejected")
+            raise CircuitOpenError(f"{breaker.name} circuit is open")
+
+        started = loop.time()
+        try:
+            result = await asyncio.wait_for(
+                _hedged(fn, policy.hedge_after, name), deadline_at - started,
+            )
+        except asyncio.TimeoutError:
+            metrics.incr(f"{name}.deadline_exceeded")
+            breaker.record_failure(ticket)
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                # Caller error (4xx) — says nothing about upstream health
+                breaker.record_success(ticket)
+                raise
+            metrics.incr(f"{name}.retryable_errors")
+            breaker.record_failure(ticket)
+            delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1)))
+            if attempt == policy.attempts or loop.time() + delay >= deadline_at:
+                raise
+            metrics.incr(f"{name}.retries")
+            await asyncio.sleep(delay)
+        except BaseException:
+            # Cancelled mid-attempt: no verdict on upstream, stay half-open
+            breaker.release_trial(ticket)
+            raise
+        else:
+            breaker.record_success(ticket)
+            metrics.observe(f"{name}.call_ms", (loop.time() - call_started) * 1000)
+            return result
+
+    raise RuntimeError("unreachable")  # pragma: no cover
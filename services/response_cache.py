@@ -0,0 +1,124 @@
+"""
+Response cache for «Карта дня» (opt-in via CARD_CACHE_ENABLED).
+
+Key: (card, question topic, moon phase, time of day, zodiac). Each key holds
+several generic variants; a user is never served a variant they saw within
+card_cache_fresh_days — in that case a new variant is generated and added.
+
+Tiers: in-process LRU of entries per key → SQLite (response_cache table,
+trimmed by least recent use) → live generation. Keys that lose rows to the
+SQLite trim are dropped from memory too, so both tiers serve the same set.
+"""
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from config import config
+from database import (
+    get_cache_entries,
+    get_seen_cache_entry_ids,
+    mark_cache_entry_served,
+    add_cache_entry,
+)
+from services import metrics
+from services.context import get_moon_phase_text, get_time_of_day
+from services.memory import detect_topic
+
+DEFAULT_TOPIC = "общее"
+
+# fn(card, topic, zodiac, moon_phase, time_of_day) -> (text, prompt_tokens, completion_tokens)
+GenericGenerator = Callable[[str, str, str, str, str], Awaitable[tuple[str, int, int]]]
+
+_memory: "OrderedDict[str, list[dict]]" = OrderedDict()
+
+
+def make_key(card: str, topic: str, moon_phase: str, time_of_day: str, zodiac: str) -> str:
+    return "|".join((card, topic, moon_phase, time_of_day, zodiac or "-"))
+
+
+def _remember(key: str, entries: list[dict]):
+    _memory[key] = entries
+    _memory.move_to_end(key)
+    while len(_memory) > config.card_cache_memory_keys:
+        _memory.popitem(last=False)
+
+
+async def _entries_for(key: str) -> list[dict]:
+    entries = _memory.get(key)
+    if entries is not None:
+        _memory.move_to_end(key)
+        metrics.incr("card_cache.memory_hits")
+        return entries
+    entries = await get_cache_entries(key)
+    _remember(key, entries)
+    return entries
+
+
+async def card_of_day(card: str, question: str, user: dict, generate: GenericGenerator) -> str:
+    """Serve a cached variant the user hasn't seen recently, else generate and store one."""
+    topic       = detect_topic(question) or DEFAULT_TOPIC
+    zodiac      = user.get("zodiac_sign") or ""
+    moon_phase  = get_moon_phase_text()
+    time_of_day = get_time_of_day()
+    key = make_key(card, topic, moon_phase, time_of_day, zodiac)
+    user_id = user["user_id"]
+
+    entries = await _entries_for(key)
+    if entries:
+        seen = await get_seen_cache_entry_ids(user_id, key, config.card_cache_fresh_days)
+        fresh = [e for e in entries if e["id"] not in seen]
+        if fresh:
+            entry = min(fresh, key=lambda e: e["hits"])
+            entry["hits"] += 1
+            await mark_cache_entry_served(user_id, key, entry["id"], hit=True)
+            metrics.incr("card_cache.hits")
+            metrics.incr("card_cache.latency_saved_ms", entry["latency_ms"] or 0)
+            metrics.incr(
+                "card_cache.tokens_saved",
+                (entry["prompt_tokens"] or 0) + (entry["completion_tokens"] or 0),
+            )
+            return entry["text"]
+
+    metrics.incr("card_cache.misses")
+    started = time.perf_counter()
+    text, prompt_tokens, completion_tokens = await generate(card, topic, zodiac, moon_phase, time_of_day)
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    entry_id, evicted = await add_cache_entry(
+        key, text, prompt_tokens, completion_tokens, latency_ms,
+        max_rows=config.card_cache_max_rows,
+        fresh_days=config.card_cache_fresh_days,
+    )
+    entries.append({
+        "id": entry_id,
+        "cache_key": key,
+        "text": text,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_ms": latency_ms,
+        "hits": 0,
+    })
+    _remember(key, entries)
+    for evicted_key in evicted:
+        _memory.pop(evicted_key, None)
+    await mark_cache_entry_served(user_id, key, entry_id, hit=False)
+    return text
+
+
+def report() -> dict:
+    """Hit rate and savings since process start (all-time: database.get_response_cache_report)."""
+    hits   = metrics.counter("card_cache.hits")
+    misses = metrics.counter("card_cache.misses")
+    total  = hits + misses
+    return {
+        "hits": int(hits),
+        "misses": int(misses),
+        "hit_rate": hits / total if total else 0.0,
+        "memory_hits": int(metrics.counter("card_cache.memory_hits")),
+        "latency_saved_ms": metrics.counter("card_cache.latency_saved_ms"),
+        "tokens_saved": int(metrics.counter("card_cache.tokens_saved")),
+    }
+
+
+def clear_memory():
+    _memory.clear()
@@ -0,0 +1,71 @@
+"""
+Single-flight guard for spread generation, keyed by (user_id, spread_type).
+
+A double-tap or a second message while a reading is being generated must not
+start another gpt-4o run. The in-process table rejects repeats from the same
+worker without touching the database; the inflight_locks table covers other
+workers. Both expire after config.spread_lock_ttl in case a holder dies.
+"""
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from config import config
+from database import try_acquire_inflight_lock, release_inflight_lock
+from services import metrics
+
+# (user_id, spread_type) -> (expires_at monotonic, token)
+_local: dict[tuple[int, str], tuple[float, str]] = {}
+
+_PRUNE_ABOVE = 1024
+
+
+def _prune(now: float):
+    for key in [k for k, (expires, _) in _local.items() if expires <= now]:
+        del _local[key]
+
+
+async def acquire(user_id: int, spread_type: str, ttl: float | None = None) -> str | None:
+    """Lock token if this call owns the generation, None if one is already in flight."""
+    ttl = config.spread_lock_ttl if ttl is None else ttl
+    key = (user_id, spread_type)
+    now = time.monotonic()
+    held = _local.get(key)
+    if held and held[0] > now:
+        metrics.incr("singleflight.rejected_local")
+        return None
+    if len(_local) > _PRUNE_ABOVE:
+        _prune(now)
+
+    token = uuid.uuid4().hex
+    # Reserve locally before awaiting the DB, so a concurrent tap sees it
+    _local[key] = (now + ttl, token)
+    if not await try_acquire_inflight_lock(user_id, spread_type, token, ttl):
+        if _local.get(key, (0, None))[1] == token:
+            del _local[key]
+        metrics.incr("singleflight.rejected_db")
+        return None
+    metrics.incr("singleflight.acquired")
+    return token
+
+
+async def release(user_id: int, spread_type: str, token: str):
+    key = (user_id, spread_type)
+    if _local.get(key, (0, None))[1] == token:
+        del _local[key]
+    await release_inflight_lock(user_id, spread_type, token)
+
+
+@asynccontextmanager
+async def guard(user_id: int, spread_type: str):
+    """`async with guard(...) as acquired:` — run the generation only if acquired."""
+    token = await acquire(user_id, spread_type)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            await release(user_id, spread_type, token)
+
+
+def clear_local():
+    _local.clear()
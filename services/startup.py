@@ -0,0 +1,106 @@
+"""
+Cold-start measurements.
+
+  profile_imports()  — per-module import cost of `bot` in a fresh interpreter
+                       (python -X importtime), for `python bot.py --profile-startup`
+  mark(name)         — seconds since this module was imported (≈ process start,
+                       bot.py imports it first), logged and kept in metrics
+"""
+import logging
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+_T0 = time.perf_counter()
+
+# Our own top-level packages, reported separately from third-party imports
+FIRST_PARTY = ("bot", "config", "database", "handlers", "keyboards", "services", "texts")
+
+
+@dataclass(frozen=True)
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> list[ImportTiming]:
+    """Rows of `-X importtime` output (`import time: self | cumulative | name`)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # header row
+        rows.append(ImportTiming(
+            module=name.strip(),
+            self_us=int(self_us),
+            cumulative_us=int(cumulative_us),
+            depth=(len(name) - len(name.lstrip(" "))) // 2,
+        ))
+    return rows
+
+
+def profile_imports(module: str = "bot") -> list[ImportTiming]:
+    """Import `module` in a fresh interpreter and return its import timings."""
+    env = dict(os.environ)
+    # config.py reads these at import; dummies are enough to import the tree
+    env.setdefault("BOT_TOKEN", "0:profile")
+    env.setdefault("OPENAI_API_KEY", "sk-profile")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def format_report(timings: list[ImportTiming], top: int = 25) -> str:
+    total = max((t.cumulative_us for t in timings), default=0)
+    top_level = sorted(
+        (t for t in timings if t.depth <= 1), key=lambda t: -t.cumulative_us,
+    )[:top]
+    ours = sorted(
+        (t for t in timings if t.module.split(".")[0] in FIRST_PARTY),
+        key=lambda t: -t.self_us,
+    )[:top]
+
+    lines = [f"total import time: {total / 1000:.1f} ms", "", "heaviest imports (cumulative):"]
+    lines += [f"  {t.cumulative_us / 1000:>9.1f} ms  {t.module}" for t in top_level]
+    lines += ["", "first-party modules (self):"]
+    lines += [f"  {t.self_us / 1000:>9.1f} ms  {t.module}" for t in ours]
+    return "\n".join(lines)
+
+
+def mark(name: str) -> float:
+    elapsed = time.perf_counter() - _T0
+    metrics.observe(f"startup.{name}_s", elapsed)
+    logger.info(f"[startup] {name}: {elapsed:.2f} s")
+    return elapsed
+
+
+def first_update_middleware():
+    """Outer update middleware that marks time-to-first-handled-update once."""
+    seen = False
+
+    async def middleware(handler, event, data):
+        nonlocal seen
+        if seen:
+            return await handler(event, data)
+        seen = True
+        try:
+            return await handler(event, data)
+        finally:
+            mark("first_update")
+
+    return middleware
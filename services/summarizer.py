@@ -0,0 +1,108 @@
+"""
+Batched spread summaries for the memory context.
+
+Spreads are saved without a summary and queued here; the queue is flushed as
+one JSON-output request once it holds summary_batch_size items or
+summary_window seconds after the first item arrived. Items the model skipped
+or mangled fall back to the first 100 characters of the reading. The queue
+lives in memory: at startup, requeue_unsummarized() picks up whatever a
+crashed or killed process left with summary NULL.
+"""
+import asyncio
+import logging
+
+from config import config
+from database import get_unsummarized_spreads, set_spread_summaries
+from services import metrics, oracle
+from services.utils import spawn
+
+logger = logging.getLogger(__name__)
+
+# Startup requeue bound: older spreads are past the memory context anyway
+REQUEUE_LIMIT = 1000
+
+_pending: list[tuple[int, str]] = []   # (spread_id, full_response)
+_window_task: asyncio.Task | None = None
+# flushes in flight -> batch size; their items are no longer in _pending
+_flushes: dict[asyncio.Task, int] = {}
+
+
+def fallback_summary(full_response: str) -> str:
+    return full_response[:100] + "..."
+
+
+def enqueue(spread_id: int, full_response: str):
+    """Queue a saved spread for summarization; never blocks the caller."""
+    global _window_task
+    _pending.append((spread_id, full_response))
+    metrics.incr("summarizer.enqueued")
+    if len(_pending) >= config.summary_batch_size:
+        _start_flush(_take())
+    elif _window_task is None or _window_task.done():
+        _window_task = spawn(_flush_after(config.summary_window), name="summarizer-window")
+
+
+async def requeue_unsummarized(limit: int = REQUEUE_LIMIT) -> int:
+    """Queue the latest spreads still without a summary; returns how many."""
+    rows = await get_unsummarized_spreads(limit)
+    for spread_id, text in rows:
+        enqueue(spread_id, text)
+    if rows:
+        logger.info(f"[summarizer] requeued {len(rows)} spreads left without a summary")
+    return len(rows)
+
+
+def pending() -> int:
+    """Spreads still waiting for a summary, queued or in a flush."""
+    return len(_pending) + sum(_flushes.values())
+
+
+def _take() -> list[tuple[int, str]]:
+    batch = _pending[:config.summary_batch_size]
+    del _pending[:config.summary_batch_size]
+    return batch
+
+
+def _start_flush(batch: list[tuple[int, str]]):
+    task = spawn(_flush(batch), name="summarizer-batch")
+    _flushes[task] = len(batch)
+    task.add_done_callback(lambda t: _flushes.pop(t, None))
+
+
+async def _flush_after(delay: float):
+    # Only ever cancelled while sleeping: the flushes run as their own tasks
+    await asyncio.sleep(delay)
+    while _pending:
+        _start_flush(_take())
+
+
+async def drain():
+    """Summarize everything queued right now and wait for flushes in flight (shutdown, tests)."""
+    if _window_task is not None and not _window_task.done():
+        _window_task.cancel()
+    while _pending:
+        _start_flush(_take())
+    # asyncio.wait never cancels them, even if drain() itself is cancelled
+    while _flushes:
+        await asyncio.wait(list(_flushes))
+
+
+async def _flush(batch: list[tuple[int, str]]):
+    if not batch:
+        return
+    texts = [text for _, text in batch]
+    try:
+        summaries = await oracle.generate_summaries(texts)
+    except Exception as e:
+        logger.warning(f"[summarizer] batch of {len(batch)} failed: {e!r}")
+        summaries = [None] * len(batch)
+
+    rows = []
+    for (spread_id, text), summary in zip(batch, summaries):
+        if not summary:
+            metrics.incr("summarizer.fallbacks")
+            summary = fallback_summary(text)
+        rows.append((spread_id, summary))
+    await set_spread_summaries(rows)
+    metrics.incr("summarizer.batches")
+    metrics.incr("summarizer.items", len(batch))
@@ -0,0 +1,63 @@
+"""
+Local token counting for prompt budgets.
+
+Uses tiktoken (gpt-4o's o200k_base) when installed; otherwise a conservative
+character-based estimate that over-counts Cyrillic rather than under-counts.
+"""
+import math
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+ENCODING = "o200k_base"
+
+# Russian text runs ~3-4 chars per token on o200k; 3 keeps budgets on the safe side
+_APPROX_CHARS_PER_TOKEN = 3.0
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        _encoding = tiktoken.get_encoding(ENCODING)
+    return _encoding
+
+
+def backend() -> str:
+    return "tiktoken" if tiktoken is not None else "approx"
+
+
+def count(text: str) -> int:
+    """Uncached: prompts are mostly unique text. Memoise at call sites with stable input."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / _APPROX_CHARS_PER_TOKEN)
+
+
+def _head(text: str, budget: int) -> str:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:budget])
+    head = text[:int(budget * _APPROX_CHARS_PER_TOKEN)]
+    # Prefer a word boundary when one is reasonably close
+    cut = head.rfind(" ")
+    return head[:cut] if cut > len(head) * 0.6 else head
+
+
+def truncate(text: str, max_tokens: int, ellipsis: str = "…") -> str:
+    """Cut text to at most max_tokens (ellipsis included). Same input → same output."""
+    if count(text) <= max_tokens:
+        return text
+    budget = max(max_tokens - count(ellipsis), 0)
+    while True:
+        result = _head(text, budget).rstrip(" ,.;:—-") + ellipsis
+        # Re-encoding the joined string can merge tokens differently
+        if count(result) <= max_tokens or budget == 0:
+            return result
+        budget -= 1
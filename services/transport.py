@@ -0,0 +1,142 @@
+"""
+HTTP transports for the Bot API (aiohttp) and OpenAI (httpx) clients.
+
+Both share the pool / keep-alive / timeout settings from config and report
+connection reuse to services.metrics:
+  http.<client>.requests         — every request sent
+  http.<client>.new_connections  — requests that had to open a TCP (+TLS) connection
+
+openai is imported inside the OpenAI helpers only: it is the heaviest import
+in the bot and must stay off the startup path (see services.startup).
+"""
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import config
+from services import metrics, outbound
+
+if TYPE_CHECKING:
+    import openai
+
+logger = logging.getLogger(__name__)
+
+
+# ─── Telegram (aiohttp) ───────────────────────────────────────────────────────
+
+def _aiohttp_trace(name: str) -> TraceConfig:
+    trace = TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        metrics.incr(f"http.{name}.requests")
+
+    async def on_connection_create_end(session, ctx, params):
+        metrics.incr(f"http.{name}.new_connections")
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    return trace
+
+
+class TelegramSession(AiohttpSession):
+    """AiohttpSession with keep-alive tuning and connection metrics."""
+
+    def __init__(self, **kwargs):
+        super().__init__(limit=config.http_pool_size, timeout=config.telegram_timeout, **kwargs)
+        self._connector_init.update(
+            keepalive_timeout=config.http_keepalive,
+            limit_per_host=config.http_pool_size,
+        )
+
+    async def create_session(self) -> ClientSession:
+        # AiohttpSession.create_session plus the trace hooks
+        if self._should_reset_connector:
+            await self.close()
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[_aiohttp_trace("telegram")],
+            )
+            self._should_reset_connector = False
+        return self._session
+
+
+def telegram_session() -> TelegramSession:
+    if config.telegram_api_url:
+        session = TelegramSession(api=TelegramAPIServer.from_base(config.telegram_api_url))
+    else:
+        session = TelegramSession()
+    session.middleware(outbound.OutboundMiddleware())
+    return session
+
+
+# ─── OpenAI (httpx) ───────────────────────────────────────────────────────────
+
+async def _httpx_trace(event: str, info: dict):
+    if event == "connection.connect_tcp.complete":
+        metrics.incr("http.openai.new_connections")
+
+
+async def _httpx_on_request(request):
+    metrics.incr("http.openai.requests")
+    request.extensions["trace"] = _httpx_trace
+
+
+def openai_timeout() -> "openai.Timeout":
+    import openai
+    return openai.Timeout(config.openai_read_timeout, connect=config.http_connect_timeout)
+
+
+def openai_http_client():
+    """httpx.AsyncClient for AsyncOpenAI(http_client=...). HTTP/2 needs the `h2` package."""
+    import openai
+    # httpx types come from the SDK so we don't pin httpx ourselves
+    httpx_limits = type(openai.DEFAULT_CONNECTION_LIMITS)
+    return openai.DefaultAsyncHttpxClient(
+        limits=httpx_limits(
+            max_connections=config.http_pool_size,
+            max_keepalive_connections=config.http_pool_size,
+            keepalive_expiry=config.http_keepalive,
+        ),
+        timeout=openai_timeout(),
+        http2=config.openai_http2,
+        event_hooks={"request": [_httpx_on_request]},
+    )
+
+
+# ─── Warm-up and report ───────────────────────────────────────────────────────
+
+async def warm_up(bot, openai_client, connections: int | None = None):
+    """Open keep-alive connections to both APIs before the first update arrives."""
+    n = config.http_warmup_connections if connections is None else connections
+    if n <= 0:
+        return
+    calls = [bot.get_me() for _ in range(n)] + [openai_client.models.list() for _ in range(n)]
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    for error in failed:
+        logger.warning(f"[transport] warm-up call failed: {error!r}")
+    logger.info(f"[transport] warm-up: {len(results) - len(failed)}/{len(results)} calls ok")
+
+
+def report() -> dict:
+    """Connection reuse per client since process start."""
+    result = {}
+    for name in ("telegram", "openai"):
+        requests = metrics.counter(f"http.{name}.requests")
+        new = metrics.counter(f"http.{name}.new_connections")
+        result[name] = {
+            "requests": int(requests),
+            "new_connections": int(new),
+            "reused": int(max(requests - new, 0)),
+            "reuse_rate": (requests - new) / requests if requests else 0.0,
+        }
+    return result
@@ -1,9 +1,108 @@
 """Shared async utilities for VELHAR bot."""
 import asyncio
+import functools
+import logging
+from contextlib import asynccontextmanager
+from typing import Callable, Iterable
+
 from aiogram.enums import ChatAction
 
+logger = logging.getLogger(__name__)
+
+# Telegram shows a chat action for ~5 s — refresh slightly before it fades
+TYPING_REFRESH = 4.5
+
+# Strong references to fire-and-forget tasks (asyncio only keeps weak ones)
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _on_background_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed", task.get_name(), exc_info=task.exception())
+
+
+def spawn(coro, name: str | None = None) -> asyncio.Task:
+    """Run coro in the background, off the handler's request path."""
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+def background(fn):
+    """
+    Decorator for coroutines run as their own task by someone else (scheduler
+    jobs): registers that task like spawn() does, so shutdown waits for it.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        task = asyncio.current_task()
+        _background_tasks.add(task)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _background_tasks.discard(task)
+
+    return wrapper
 
-async def velhar_typing(bot, chat_id: int, long: bool = False):
-    """Send typing action and wait a bit to simulate Velhar thinking."""
+
+async def drain_tasks(tasks_fn: Callable[[], Iterable[asyncio.Task]], timeout: float) -> dict:
+    """
+    Wait up to `timeout` for the tasks tasks_fn() returns, then cancel the rest.
+    Polled again after each wait, so tasks started meanwhile are drained too.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    drained = 0
+    current = asyncio.current_task()
+    while True:
+        tasks = {t for t in tasks_fn() if t is not current and not t.done()}
+        remaining = deadline - loop.time()
+        if not tasks or remaining <= 0:
+            break
+        done, _ = await asyncio.wait(tasks, timeout=remaining)
+        drained += len(done)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {"drained": drained, "abandoned": len(tasks)}
+
+
+async def drain_background(timeout: float) -> dict:
+    """Wait up to `timeout` for background tasks (incl. ones they spawn), then cancel the rest."""
+    return await drain_tasks(lambda: _background_tasks, timeout)
+
+
+async def velhar_typing(bot, chat_id: int):
+    """Send a single typing action (no artificial delay)."""
     await bot.send_chat_action(chat_id, ChatAction.TYPING)
-    await asyncio.sleep(1.5 if long else 0.8)
+
+
+async def _keep_typing(bot, chat_id: int):
+    while True:
+        try:
+            await bot.send_chat_action(chat_id, ChatAction.TYPING)
+        except Exception as e:
+            logger.debug(f"Typing action failed for {chat_id}: {e}")
+        await asyncio.sleep(TYPING_REFRESH)
+
+
+@asynccontextmanager
+async def velhar_presence(bot, chat_id: int, min_duration: float = 0.0):
+    """
+    Keep «typing…» alive in a background task while the block runs.
+
+    min_duration pads the block to at least that many seconds, so a pacing
+    pause overlaps the real work instead of being added after it.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    presence = asyncio.create_task(_keep_typing(bot, chat_id))
+    try:
+        yield
+        remaining = min_duration - (loop.time() - started)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+    finally:
+        presence.cancel()
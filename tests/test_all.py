@@ -4,6 +4,7 @@ Run:  python -m pytest tests/test_all.py -v
 """
 import asyncio
 import os
+import random
 import sys
 import pytest
 import pytest_asyncio
@@ -320,6 +321,7 @@ from database import (
     save_spread, get_recent_spreads, get_spread_by_id,
     increment_ai_question_count, set_velhar_state, reset_velhar_state,
     increment_spreads_since_memory, reset_spreads_since_memory,
+    create_payment, update_payment_status, get_stats, get_stats_daily,
 )
 
 # Use a temp file so each test has isolation
@@ -448,6 +450,51 @@ async def test_spreads_since_memory(tmp_db):
     assert user["spreads_since_memory"] == 0
 
 
+@pytest.mark.asyncio
+async def test_save_spread_settles_memory_counter(tmp_db):
+    await create_user(62, "mem")
+    await save_spread(62, "spread_day", "q", "r", memory_used=False)
+    await save_spread(62, "spread_day", "q", "r", memory_used=False)
+    assert (await get_user(62))["spreads_since_memory"] == 2
+    await save_spread(62, "spread_day", "q", "r", memory_used=True)
+    assert (await get_user(62))["spreads_since_memory"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stats_rollup(tmp_db):
+    await create_user(70, "a")
+    await create_user(71, "b")
+    await create_user(71, "b")  # duplicate insert is not counted
+    await save_spread(70, "spread_day", "q", "r")
+    await save_spread(71, "spread_year", "q", "r")
+    await create_payment(70, 80, "charge-1", "spread_year")
+    await update_payment_status("charge-1", "succeeded")
+    await update_payment_status("charge-1", "succeeded")  # idempotent
+    stats = await get_stats()
+    assert stats["total_users"] == 2
+    assert stats["spreads_today"] == 2
+    assert stats["spreads_total"] == 2
+    assert stats["month_revenue"] == 80
+    assert stats["revenue_by_product"] == {"spread_year": 80}
+    rows = await get_stats_daily(7)
+    assert {(r["metric"], r["dimension"]) for r in rows} >= {
+        ("new_users", ""), ("spreads", "spread_day"), ("payments", "spread_year"),
+    }
+
+@pytest.mark.asyncio
+async def test_stats_backfill(tmp_db):
+    import aiosqlite
+    await create_user(72, "old")
+    await save_spread(72, "ritual", "q", "r")
+    async with aiosqlite.connect(tmp_db) as db:
+        await db.execute("DELETE FROM stats_daily")
+        await db.commit()
+    await init_db()
+    rows = await get_stats_daily(1)
+    assert sum(r["value"] for r in rows if r["metric"] == "spreads") == 1
+    assert sum(r["value"] for r in rows if r["metric"] == "new_users") == 1
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # 7. VELHAR_STATE COLD LOGIC (integration)
 # ─────────────────────────────────────────────────────────────────────────────
@@ -524,3 +571,1507 @@ class TestConfig:
 
     def test_config_admin_id_is_int(self):
         assert isinstance(config.admin_id, int)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 10. FAKE TELEGRAM / OPENAI SERVERS (benchmarks harness)
+# ─────────────────────────────────────────────────────────────────────────────
+
+from benchmarks.fake_servers import FakeOpenAI, FakeTelegram
+
+@pytest.mark.asyncio
+async def test_fake_openai_roundtrip_and_stream():
+    from openai import AsyncOpenAI
+    fake = FakeOpenAI(responder=lambda body: "раз два три")
+    url = await fake.start()
+    try:
+        client = AsyncOpenAI(api_key="sk-fake", base_url=url + "/v1")
+        resp = await client.chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": "привет"}],
+        )
+        assert resp.choices[0].message.content == "раз два три"
+        assert resp.usage.total_tokens > 0
+
+        stream = await client.chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": "привет"}], stream=True,
+        )
+        pieces = [c.choices[0].delta.content async for c in stream if c.choices[0].delta.content]
+        assert "".join(pieces) == "раз два три"
+        assert len(fake.requests) == 2
+        await client.close()
+    finally:
+        await fake.stop()
+
+@pytest.mark.asyncio
+async def test_fake_openai_429_injection():
+    from openai import AsyncOpenAI, RateLimitError
+    fake = FakeOpenAI(error_429_rate=1.0)
+    url = await fake.start()
+    try:
+        client = AsyncOpenAI(api_key="sk-fake", base_url=url + "/v1", max_retries=0)
+        with pytest.raises(RateLimitError):
+            await client.chat.completions.create(
+                model="gpt-4o", messages=[{"role": "user", "content": "x"}],
+            )
+        assert fake.rate_limited == 1
+        await client.close()
+    finally:
+        await fake.stop()
+
+@pytest.mark.asyncio
+async def test_fake_telegram_records_calls():
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    fake = FakeTelegram()
+    url = await fake.start()
+    bot = Bot("123456:fake", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    try:
+        me = await bot.get_me()
+        assert me.username == "velhar_fake_bot"
+        msg = await bot.send_message(77, "тест")
+        assert msg.chat.id == 77
+        assert fake.calls["getMe"] == 1 and fake.calls["sendMessage"] == 1
+    finally:
+        await bot.session.close()
+        await fake.stop()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 11. PRESENCE / BACKGROUND TASKS
+# ─────────────────────────────────────────────────────────────────────────────
+
+import services.utils as utils_module
+from services.utils import velhar_presence, spawn
+
+
+class _ActionRecorder:
+    def __init__(self):
+        self.actions = []
+
+    async def send_chat_action(self, chat_id, action):
+        self.actions.append((chat_id, action))
+
+
+@pytest.mark.asyncio
+async def test_presence_overlaps_work(monkeypatch):
+    monkeypatch.setattr(utils_module, "TYPING_REFRESH", 0.01)
+    bot = _ActionRecorder()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    async with velhar_presence(bot, 5, min_duration=0.05):
+        await asyncio.sleep(0.04)  # "generation"
+    elapsed = loop.time() - started
+    # Padding overlaps the work: ~0.05 s total, not 0.04 + 0.05
+    assert 0.05 <= elapsed < 0.085
+    assert len(bot.actions) >= 2
+    count = len(bot.actions)
+    await asyncio.sleep(0.03)
+    assert len(bot.actions) == count  # typing task cancelled on exit
+
+
+@pytest.mark.asyncio
+async def test_presence_no_padding_when_work_is_slow():
+    bot = _ActionRecorder()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    async with velhar_presence(bot, 5, min_duration=0.01):
+        await asyncio.sleep(0.05)
+    assert loop.time() - started < 0.08
+
+
+@pytest.mark.asyncio
+async def test_spawn_keeps_reference_until_done():
+    done = asyncio.Event()
+
+    async def job():
+        done.set()
+
+    task = spawn(job())
+    assert task in utils_module._background_tasks
+    await task
+    assert done.is_set()
+    assert task not in utils_module._background_tasks
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 12. DECK
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import deck
+from services.oracle import draw_cards
+
+class TestDeck:
+
+    def test_deck_is_full_and_indexed(self):
+        assert deck.DECK_SIZE == 78
+        assert len(set(deck.CARD_NAMES)) == 78
+        assert all(card.id == i for i, card in enumerate(deck.DECK))
+        assert sum(1 for c in deck.DECK if c.arcana == "major") == 22
+        assert deck.card_by_name("Туз Кубков").suit == "Кубков"
+        assert deck.card_by_name("Маг").suit is None
+
+    def test_seeded_draws_are_reproducible(self):
+        a = deck.draw(5, deck.make_rng(7), reversed_rate=0.5)
+        b = deck.draw(5, deck.make_rng(7), reversed_rate=0.5)
+        assert a == b
+        deck.seed(3)
+        first = draw_cards(3)
+        deck.seed(3)
+        assert draw_cards(3) == first
+
+    def test_draw_unique_and_capped(self):
+        names = draw_cards(12)
+        assert len(set(names)) == 12
+        assert len(draw_cards(100)) == 78
+
+    def test_reversed_label(self):
+        drawn = deck.draw(78, deck.make_rng(1), reversed_rate=1.0)
+        assert all(d.reversed and d.label.endswith(deck.REVERSED_SUFFIX) for d in drawn)
+        assert deck.draw(1, deck.make_rng(1))[0].label in deck.CARD_NAMES
+
+    def test_draw_many_shape(self):
+        spreads = deck.draw_many(3, 50, deck.make_rng(2))
+        assert len(spreads) == 50
+        assert all(len({d.card.id for d in s}) == 3 for s in spreads)
+        assert spreads == deck.draw_many(3, 50, deck.make_rng(2))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 13. CARD-OF-DAY RESPONSE CACHE
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import response_cache
+from database import get_response_cache_report
+
+@pytest.mark.asyncio
+async def test_card_cache_hits_and_freshness(tmp_db):
+    response_cache.clear_memory()
+    calls = []
+
+    async def generate(card, topic, zodiac, moon, tod):
+        calls.append((card, topic, zodiac))
+        return f"послание {len(calls)}", 100, 200
+
+    alice = {"user_id": 1, "zodiac_sign": "Лев"}
+    bob   = {"user_id": 2, "zodiac_sign": "Лев"}
+
+    first = await response_cache.card_of_day("Маг", "что с работой", alice, generate)
+    assert first == "послание 1" and calls[0] == ("Маг", "работа", "Лев")
+
+    # Same key, other user → served from cache
+    assert await response_cache.card_of_day("Маг", "карьера и деньги", bob, generate) == first
+    assert len(calls) == 1
+
+    # Same user again → never a repeat, a new variant is generated
+    second = await response_cache.card_of_day("Маг", "работа", alice, generate)
+    assert second == "послание 2"
+
+    # Bob has seen variant 1 → gets variant 2 from cache, even after memory tier is dropped
+    response_cache.clear_memory()
+    assert await response_cache.card_of_day("Маг", "работа", bob, generate) == second
+    assert len(calls) == 2
+
+    report = await get_response_cache_report()
+    assert report["entries"] == 2 and report["hits"] == 2
+    assert report["tokens_saved"] == 600
+    assert report["hit_rate"] == 0.5
+
+@pytest.mark.asyncio
+async def test_card_cache_key_includes_zodiac(tmp_db):
+    response_cache.clear_memory()
+    n = 0
+
+    async def generate(*_):
+        nonlocal n
+        n += 1
+        return f"t{n}", 1, 1
+
+    await response_cache.card_of_day("Луна", "любовь", {"user_id": 1, "zodiac_sign": "Рыбы"}, generate)
+    await response_cache.card_of_day("Луна", "любовь", {"user_id": 2, "zodiac_sign": "Овен"}, generate)
+    assert n == 2
+
+@pytest.mark.asyncio
+async def test_card_cache_memory_drops_keys_trimmed_from_sqlite(tmp_db, monkeypatch):
+    response_cache.clear_memory()
+    monkeypatch.setattr(config, "card_cache_max_rows", 1)
+    n = 0
+
+    async def generate(*_):
+        nonlocal n
+        n += 1
+        return f"t{n}", 1, 1
+
+    pisces = {"user_id": 1, "zodiac_sign": "Рыбы"}
+    assert await response_cache.card_of_day("Луна", "любовь", pisces, generate) == "t1"
+    # A second key pushes the first one's only row out of the table...
+    await response_cache.card_of_day("Луна", "любовь", {"user_id": 2, "zodiac_sign": "Овен"}, generate)
+    assert len(response_cache._memory) == 1
+    # ...so the memory tier can't keep serving it either
+    other_pisces = {"user_id": 3, "zodiac_sign": "Рыбы"}
+    assert await response_cache.card_of_day("Луна", "любовь", other_pisces, generate) == "t3"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 14. CARD-OF-DAY POOL
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import card_pool
+
+@pytest.mark.asyncio
+async def test_card_pool_build_resumes(tmp_db):
+    attempts = []
+    outage = True
+
+    async def flaky(card, zodiac, moon_phase):
+        attempts.append((card, zodiac))
+        if zodiac == "Рак" and outage:
+            raise RuntimeError("upstream hiccup")
+        return f"{card} для {card_pool.NAME_MARKER} ({zodiac or 'все'})"
+
+    cards, zodiacs = ["Маг", "Луна"], ["Лев", "Рак", ""]
+    first = await card_pool.build_pool(flaky, concurrency=2, cards=cards, zodiacs=zodiacs)
+    assert first["generated"] == 4 and first["failed"] == 2
+
+    attempts.clear()
+    outage = False
+    second = await card_pool.build_pool(flaky, concurrency=2, cards=cards, zodiacs=zodiacs)
+    assert second["already_present"] == 4 and second["generated"] == 2
+    assert sorted(attempts) == [("Луна", "Рак"), ("Маг", "Рак")]
+
+@pytest.mark.asyncio
+async def test_card_pool_serve_fills_name(tmp_db, monkeypatch):
+    monkeypatch.setattr(card_pool, "get_moon_phase_text", lambda when=None: "полнолуние")
+
+    async def generate(card, zodiac, moon_phase):
+        return f"Слушай, {card_pool.NAME_MARKER}: {card}"
+
+    await card_pool.build_pool(generate, cards=["Звезда"], zodiacs=["Дева"])
+    text = await card_pool.serve("Звезда", {"name": "Ника", "zodiac_sign": "Дева"})
+    assert text == "Слушай, Ника: Звезда"
+    assert await card_pool.serve("Звезда", {"name": "Ника", "zodiac_sign": "Овен"}) is None
+    assert card_pool.fill("без маркера", {}) == "путник... без маркера"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 15. OPENAI RESILIENCE (retries, hedging, breaker, deadlines)
+# ─────────────────────────────────────────────────────────────────────────────
+
+import time as _time
+from services import metrics, resilience
+
+@pytest_asyncio.fixture
+async def fake_openai():
+    """Factory: start a FakeOpenAI and return (fake, client with SDK retries off)."""
+    from openai import AsyncOpenAI
+    started = []
+
+    async def make(**kwargs):
+        fake = FakeOpenAI(**kwargs)
+        url = await fake.start()
+        client = AsyncOpenAI(api_key="sk-fake", base_url=url + "/v1", max_retries=0)
+        started.append((fake, client))
+        return fake, client
+
+    metrics.reset()
+    yield make
+    for fake, client in started:
+        await client.close()
+        await fake.stop()
+
+
+def _completion(client):
+    return lambda: client.chat.completions.create(
+        model="gpt-4o", messages=[{"role": "user", "content": "x"}],
+    )
+
+
+def _is_retryable(error):
+    from services.oracle import _is_retryable
+    return _is_retryable(error)
+
+
+@pytest.mark.asyncio
+async def test_resilience_retries_rate_limit(fake_openai):
+    fake, client = await fake_openai(fail_first=2)
+    policy = resilience.RetryPolicy(deadline=5, attempts=3, base_delay=0.01)
+    breaker = resilience.CircuitBreaker("t", failure_threshold=10)
+    resp = await resilience.call(_completion(client), policy, breaker, _is_retryable, name="t")
+    assert resp.choices[0].message.content
+    assert len(fake.requests) == 3
+    assert metrics.counter("t.retries") == 2
+    assert breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_resilience_gives_up_after_attempts(fake_openai):
+    from openai import RateLimitError
+    fake, client = await fake_openai(fail_first=10)
+    policy = resilience.RetryPolicy(deadline=5, attempts=2, base_delay=0.01)
+    breaker = resilience.CircuitBreaker("t", failure_threshold=10)
+    with pytest.raises(RateLimitError):
+        await resilience.call(_completion(client), policy, breaker, _is_retryable, name="t")
+    assert len(fake.requests) == 2
+    assert metrics.counter("t.retryable_errors") == 2
+
+@pytest.mark.asyncio
+async def test_resilience_hedge_beats_slow_request(fake_openai):
+    fake, client = await fake_openai(latencies=[2.0, 0.0])
+    policy = resilience.RetryPolicy(deadline=5, hedge_after=0.1)
+    breaker = resilience.CircuitBreaker("t")
+    started = _time.perf_counter()
+    await resilience.call(_completion(client), policy, breaker, _is_retryable, name="t")
+    assert _time.perf_counter() - started < 1.0
+    assert metrics.counter("t.hedges") == 1
+    assert metrics.counter("t.hedge_wins") == 1
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_and_recovers(fake_openai):
+    from openai import RateLimitError
+    fake, client = await fake_openai(fail_first=2)
+    policy = resilience.RetryPolicy(deadline=5, attempts=1)
+    breaker = resilience.CircuitBreaker("t", failure_threshold=2, reset_timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(RateLimitError):
+            await resilience.call(_completion(client), policy, breaker, _is_retryable, name="t")
+    assert breaker.state == "open"
+    with pytest.raises(resilience.CircuitOpenError):
+        await resilience.call(_completion(client), policy, breaker, _is_retryable, name="t")
+    assert len(fake.requests) == 2
+    assert metrics.counter("t.circuit_rejected") == 1
+
+    await asyncio.sleep(0.25)
+    assert breaker.state == "half_open"
+    await resilience.call(_completion(client), policy, breaker, _is_retryable, name="t")
+    assert breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_trial_frees_the_slot(fake_openai):
+    fake, client = await fake_openai(latency=5.0)
+    policy = resilience.RetryPolicy(deadline=10, attempts=1)
+    breaker = resilience.CircuitBreaker("t", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+
+    trial = asyncio.create_task(
+        resilience.call(_completion(client), policy, breaker, _is_retryable, name="t")
+    )
+    await asyncio.sleep(0.05)
+    assert not breaker.allow()                  # the trial holds the slot
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+def test_late_failure_from_before_the_outage_keeps_the_trial():
+    breaker = resilience.CircuitBreaker("t", failure_threshold=1, reset_timeout=0.0)
+    early = breaker.allow()                     # admitted while closed, still running
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    trial = breaker.allow()
+    assert trial
+
+    breaker.record_failure(early)
+    assert not breaker.allow()                  # the trial still holds the slot
+    breaker.record_success(trial)
+    assert breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_oracle_spread_deadline(fake_openai, monkeypatch):
+    from services import oracle
+    fake, client = await fake_openai(latency=2.0)
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", resilience.CircuitBreaker("openai"))
+    monkeypatch.setitem(oracle.SPREAD_DEADLINES, "spread_day", 0.2)
+    started = _time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        await oracle._ask_velhar("x", spread_type="spread_day")
+    assert _time.perf_counter() - started < 1.0
+    assert metrics.counter("openai.deadline_exceeded") == 1
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 16. HTTP TRANSPORT (pooling, warm-up, reuse metrics)
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import transport
+
+@pytest.mark.asyncio
+async def test_openai_transport_reuses_connections():
+    from openai import AsyncOpenAI
+    metrics.reset()
+    fake = FakeOpenAI()
+    url = await fake.start()
+    client = AsyncOpenAI(
+        api_key="sk-fake", base_url=url + "/v1", max_retries=0,
+        http_client=transport.openai_http_client(),
+    )
+    try:
+        for _ in range(5):
+            await _completion(client)()
+        stats = transport.report()["openai"]
+        assert stats["requests"] == 5
+        assert stats["new_connections"] == 1
+        assert stats["reuse_rate"] == pytest.approx(0.8)
+        assert len(fake.connections) == 1
+    finally:
+        await client.close()
+        await fake.stop()
+
+@pytest.mark.asyncio
+async def test_warm_up_opens_pooled_connections(monkeypatch):
+    from aiogram import Bot
+    from openai import AsyncOpenAI
+    metrics.reset()
+    tg, ai = FakeTelegram(), FakeOpenAI()
+    tg_url, ai_url = await tg.start(), await ai.start()
+    monkeypatch.setattr(config, "telegram_api_url", tg_url)
+    bot = Bot(token="123:abc", session=transport.telegram_session())
+    client = AsyncOpenAI(
+        api_key="sk-fake", base_url=ai_url + "/v1", max_retries=0,
+        http_client=transport.openai_http_client(),
+    )
+    try:
+        await transport.warm_up(bot, client, connections=2)
+        assert tg.calls["getMe"] == 2
+        new_after_warm_up = transport.report()["telegram"]["new_connections"]
+        assert 1 <= new_after_warm_up <= 2
+
+        for i in range(5):
+            await bot.send_message(chat_id=7, text=f"msg {i}")
+        stats = transport.report()["telegram"]
+        assert stats["requests"] == 7
+        assert stats["new_connections"] == new_after_warm_up
+        assert transport.report()["openai"]["requests"] == 2
+    finally:
+        await bot.session.close()
+        await client.close()
+        await tg.stop()
+        await ai.stop()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 17. BATCHED SUMMARIZER
+# ─────────────────────────────────────────────────────────────────────────────
+
+import json as _json
+from services import summarizer
+
+@pytest.mark.asyncio
+async def test_summarizer_batches_and_falls_back(tmp_db, fake_openai, monkeypatch):
+    from services import oracle
+    from database import get_spread_by_id, save_spread
+
+    def responder(body):
+        # Answer for items 0 and 2 only; item 1 must fall back to truncation
+        assert body["response_format"] == {"type": "json_object"}
+        return _json.dumps({"summaries": [
+            {"id": 0, "summary": "Путь открыт."},
+            {"id": 2, "summary": "Отпусти прошлое."},
+        ]}, ensure_ascii=False)
+
+    fake, client = await fake_openai(responder=responder)
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", resilience.CircuitBreaker("openai"))
+    monkeypatch.setattr(config, "summary_window", 60)
+
+    await create_user(50, "s")
+    texts = ["а" * 150, "б" * 150, "в" * 150]
+    ids = [await save_spread(50, "spread_day", "q", t) for t in texts]
+    for spread_id, text in zip(ids, texts):
+        summarizer.enqueue(spread_id, text)
+    await summarizer.drain()
+
+    assert len(fake.requests) == 1
+    summaries = [(await get_spread_by_id(i))["summary"] for i in ids]
+    assert summaries == ["Путь открыт.", "б" * 100 + "...", "Отпусти прошлое."]
+    assert metrics.counter("summarizer.fallbacks") == 1
+
+@pytest.mark.asyncio
+async def test_summarizer_drain_waits_for_window_flush_in_flight(tmp_db, fake_openai, monkeypatch):
+    from services import oracle
+    from database import get_spread_by_id, save_spread
+
+    def responder(body):
+        return _json.dumps({"summaries": [{"id": 0, "summary": "Итог."}]}, ensure_ascii=False)
+
+    fake, client = await fake_openai(responder=responder, latency=0.3)
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", resilience.CircuitBreaker("openai"))
+    monkeypatch.setattr(config, "summary_window", 0.05)
+
+    await create_user(51, "s")
+    first = await save_spread(51, "spread_day", "q", "а" * 150)
+    summarizer.enqueue(first, "а" * 150)
+    await asyncio.sleep(0.15)               # window expired, its flush waits on OpenAI
+    assert summarizer.pending() == 1
+    second = await save_spread(51, "spread_day", "q", "б" * 150)
+    summarizer.enqueue(second, "б" * 150)
+    assert summarizer.pending() == 2
+
+    await summarizer.drain()
+    assert summarizer.pending() == 0
+    assert [(await get_spread_by_id(i))["summary"] for i in (first, second)] == ["Итог.", "Итог."]
+
+@pytest.mark.asyncio
+async def test_summarizer_requeues_spreads_a_dead_process_left_behind(tmp_db, fake_openai, monkeypatch):
+    from services import oracle
+    from database import get_spread_by_id, save_spread
+
+    def responder(body):
+        return _json.dumps({"summaries": [{"id": 0, "summary": "Итог."}, {"id": 1, "summary": "Итог."}]})
+
+    fake, client = await fake_openai(responder=responder)
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", resilience.CircuitBreaker("openai"))
+    monkeypatch.setattr(config, "summary_window", 60)
+
+    await create_user(52, "s")
+    done = await save_spread(52, "spread_day", "q", "r", summary="есть")
+    # queued in a process that was then killed: nothing in memory, NULL in the table
+    lost = [await save_spread(52, "spread_day", "q", t) for t in ("а" * 150, "б" * 150)]
+
+    assert await summarizer.requeue_unsummarized() == 2
+    await summarizer.drain()
+    assert [(await get_spread_by_id(i))["summary"] for i in lost] == ["Итог.", "Итог."]
+    assert (await get_spread_by_id(done))["summary"] == "есть"
+    assert [e["summary"] for e in read_ring(await get_user(52))][:2] == ["Итог.", "Итог."]
+    assert await summarizer.requeue_unsummarized() == 0
+
+def test_parse_summaries_tolerates_garbage():
+    from services.oracle import parse_summaries
+    assert parse_summaries("не json", 2) == [None, None]
+    assert parse_summaries('{"summaries": [{"id": "1", "summary": " Да "}, {"id": 9}]}', 2) == [None, "Да"]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 18. PROMPT PREFIX CACHING LAYOUT
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services.context import STABLE_SYSTEM_PROMPT, build_session_context, MEMORY_MARKER
+
+@pytest.mark.asyncio
+async def test_generators_share_stable_prefix(fake_openai, monkeypatch):
+    from services import oracle
+    fake, client = await fake_openai(prefix_cache_min_tokens=256)
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", resilience.CircuitBreaker("openai"))
+
+    alice = build_session_context({"name": "Алиса", "zodiac_sign": "Лев"}, [])
+    bob = build_session_context({"name": "Боб"}, [], memory=True)
+    await oracle.generate_card_of_day("что сегодня", context=alice)
+    await oracle.generate_three_paths("работа", context=bob)
+    await oracle.generate_mirror_of_fate("любовь", context=alice)
+
+    for body in fake.requests:
+        assert body["messages"][0] == {"role": "system", "content": STABLE_SYSTEM_PROMPT}
+        assert body["messages"][-1]["role"] == "user"
+    assert [b["messages"][1]["content"] for b in fake.requests] == [alice, bob, alice]
+    assert MEMORY_MARKER in bob and MEMORY_MARKER not in alice
+
+    # First request warms the cache; the others reuse at least the stable prefix
+    assert metrics.counter("openai.cached_tokens.spread_day") == 0
+    assert metrics.counter("openai.cached_tokens.spread_question") >= 256
+    assert oracle.prompt_cache_report()["cached_rate"] > 0
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 19. TOKEN-BUDGETED CONTEXT
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import tokens
+from services.context import select_memories, MEMORY_ITEM_MAX_TOKENS
+
+class TestTokenBudget:
+
+    def test_count_and_truncate(self):
+        text = "Звёзды расступаются и открывают путь " * 20
+        assert tokens.count(text) > tokens.count(text[:50]) > 0
+        cut = tokens.truncate(text, 20)
+        assert tokens.count(cut) <= 20 and cut.endswith("…")
+        assert cut == tokens.truncate(text, 20)
+        assert tokens.truncate("коротко", 20) == "коротко"
+
+    def test_topic_match_ranks_before_recency(self):
+        recent = [  # newest first
+            {"id": 3, "spread_type": "spread_day", "question": "что сегодня", "summary": "День светел."},
+            {"id": 2, "spread_type": "spread_question", "question": "любовь и отношения", "summary": "Сердце ищет ответ."},
+            {"id": 1, "spread_type": "spread_deep", "question": "работа", "summary": "Карьера в движении."},
+        ]
+        lines = select_memories(recent, "как быть с отношениями", budget=1000)
+        assert lines[0].endswith("Сердце ищет ответ.")
+        assert lines[1:] == [
+            "- spread_day: День светел.",
+            "- spread_deep: Карьера в движении.",
+        ]
+        # Tight budget keeps only the best-ranked line
+        assert select_memories(recent, "как быть с отношениями", budget=15) == lines[:1]
+
+    def test_context_respects_budget(self):
+        long_summary = "очень длинное послание звёзд " * 40
+        recent = [{"spread_type": "spread_day", "question": "", "summary": long_summary}] * 5
+        context = build_session_context({"name": "Ника"}, recent, budget=120)
+        assert tokens.count(context) <= 120
+        assert "Ника" in context and "…" in context
+        assert all(tokens.count(l) <= MEMORY_ITEM_MAX_TOKENS + 10 for l in context.splitlines())
+
+    def test_only_stable_text_is_memoised(self):
+        from services import context as context_mod
+        assert not hasattr(tokens.count, "cache_info")  # prompts are unique text
+        context_mod._memory_line.cache_clear()
+        recent = [{"spread_type": "spread_day", "question": "", "summary": "День светел."}]
+        select_memories(recent, None, budget=100)
+        select_memories(recent, "другой вопрос", budget=100)
+        assert context_mod._memory_line.cache_info().hits == 1
+
+@pytest.mark.asyncio
+async def test_prompt_tokens_metric_per_spread_type(fake_openai, monkeypatch):
+    from services import oracle
+    fake, client = await fake_openai()
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", resilience.CircuitBreaker("openai"))
+    await oracle.generate_three_paths("работа", context="КОНТЕКСТ СЕССИИ:\nТы обращаешься к Нике.")
+    stats = metrics.summary("prompt_tokens.spread_question")
+    assert stats["count"] == 1 and stats["max"] > tokens.count(STABLE_SYSTEM_PROMPT)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 20. SINGLE-FLIGHT GUARD
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import singleflight
+
+@pytest.mark.asyncio
+async def test_singleflight_rejects_concurrent_repeat(tmp_db):
+    singleflight.clear_local()
+    runs = 0
+    gate = asyncio.Event()
+
+    async def tap():
+        nonlocal runs
+        async with singleflight.guard(7, "spread_day") as acquired:
+            if acquired:
+                runs += 1
+                await gate.wait()
+            return acquired
+
+    first = asyncio.create_task(tap())
+    await asyncio.sleep(0.05)
+    assert await tap() is False          # double-tap while in flight
+    gate.set()
+    assert await first is True
+    assert runs == 1
+    # Different spread type is independent; after release the same one is free again
+    async with singleflight.guard(7, "spread_question") as acquired:
+        assert acquired
+    async with singleflight.guard(7, "spread_day") as acquired:
+        assert acquired
+
+@pytest.mark.asyncio
+async def test_singleflight_lock_is_shared_through_db(tmp_db):
+    singleflight.clear_local()
+    token = await singleflight.acquire(8, "ritual", ttl=60)
+    assert token
+    singleflight.clear_local()           # another worker: empty local table
+    assert await singleflight.acquire(8, "ritual", ttl=60) is None
+    assert metrics.counter("singleflight.rejected_db") >= 1
+    await singleflight.release(8, "ritual", token)
+    assert await singleflight.acquire(8, "ritual", ttl=60)
+
+@pytest.mark.asyncio
+async def test_singleflight_expired_lock_is_taken_over(tmp_db):
+    singleflight.clear_local()
+    assert await singleflight.acquire(9, "spread_deep", ttl=0.05)
+    await asyncio.sleep(0.1)             # holder died without releasing
+    assert await singleflight.acquire(9, "spread_deep", ttl=60)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 21. SPREAD JOB QUEUE
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import jobs
+
+@pytest.mark.asyncio
+async def test_job_queue_dedupes_retries_and_fails(tmp_db, monkeypatch):
+    from database import get_spread_job_counts
+    monkeypatch.setattr(config, "job_max_attempts", 2)
+    monkeypatch.setattr(jobs, "_RETRY_BASE_DELAY", 0)
+    failed = []
+
+    async def boom(bot, job):
+        raise RuntimeError("openai down")
+
+    async def on_failed(bot, job):
+        failed.append(job["id"])
+
+    first = await jobs.enqueue(1, 1, "ritual", "q", 10, source_message_id=100)
+    assert first
+    assert await jobs.enqueue(1, 1, "ritual", "q", 11, source_message_id=100) is None  # redelivered
+    assert await jobs.run_once(None, boom, on_failed, "w")
+    assert await get_spread_job_counts() == {"pending": 1}
+    assert await jobs.run_once(None, boom, on_failed, "w")           # last attempt
+    assert failed == [first]
+    assert await jobs.run_once(None, boom, on_failed, "w") is False
+
+@pytest.mark.asyncio
+async def test_second_purchase_while_first_job_is_live_gets_its_own_job(tmp_db):
+    from database import get_spread_job_counts
+    first = await jobs.enqueue(4, 4, "spread_deep", "q1", 40, source_message_id=400)
+    second = await jobs.enqueue(4, 4, "spread_deep", "q2", 41, source_message_id=401)
+    assert first and second and first != second
+    assert await get_spread_job_counts() == {"pending": 2}
+
+@pytest.mark.asyncio
+async def test_job_lease_expiry_hands_job_to_another_worker(tmp_db, monkeypatch):
+    from database import claim_spread_job, fail_abandoned_spread_jobs, finish_spread_job
+    ran = []
+
+    async def process(bot, job):
+        ran.append((job["id"], job["attempts"]))
+
+    async def on_failed(bot, job):
+        pass
+
+    job_id = await jobs.enqueue(2, 2, "spread_year", "q", 20)
+    dead = await claim_spread_job("dead-worker", lease=0.05, max_attempts=3)
+    assert dead["id"] == job_id
+    assert await jobs.run_once(None, process, on_failed, "w") is False   # still leased
+    await asyncio.sleep(0.1)
+    assert await jobs.run_once(None, process, on_failed, "w")
+    assert ran == [(job_id, 2)]
+    assert await finish_spread_job(job_id, "dead-worker") is False
+
+    # Out of attempts: the sweep fails it instead of re-running
+    other = await jobs.enqueue(3, 3, "spread_year", "q", 30)
+    await claim_spread_job("dead-worker", lease=0.01, max_attempts=1)
+    await asyncio.sleep(0.05)
+    assert [j["id"] for j in await fail_abandoned_spread_jobs(max_attempts=1)] == [other]
+
+@pytest.mark.asyncio
+async def test_spread_job_never_generates_or_delivers_twice(tmp_db, fake_openai, monkeypatch):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from database import get_spread_job_counts
+    from handlers import spreads
+    from services import oracle
+
+    fake, client = await fake_openai()
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", resilience.CircuitBreaker("openai"))
+    monkeypatch.setattr(summarizer, "enqueue", lambda *args: None)
+    monkeypatch.setattr(jobs, "_RETRY_BASE_DELAY", 0)
+    tg = FakeTelegram()
+    url = await tg.start()
+    bot = Bot("123456:fake", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    try:
+        await create_user(60, "j")
+        await jobs.enqueue(60, 60, "spread_deep", "Что меня ждёт?", 501)
+
+        # First attempt dies right after the reading's commit, before anything else
+        def killed(*args, **kwargs):
+            raise RuntimeError("process killed")
+
+        monkeypatch.setattr(summarizer, "enqueue", killed)
+        await jobs.run_once(bot, spreads.process_spread_job, spreads.on_spread_job_failed, "w1")
+        monkeypatch.setattr(summarizer, "enqueue", lambda *args: None)
+        await jobs.run_once(bot, spreads.process_spread_job, spreads.on_spread_job_failed, "w2")
+
+        assert len(fake.requests) == 1
+        edits = [params for method, params in tg.log if method == "editMessageText"]
+        assert len(edits) == 1 and edits[0]["message_id"] == "501"
+        assert tg.calls["sendMessage"] == 0
+        assert await get_spread_job_counts() == {"done": 1}
+        assert (await get_user(60))["daily_paid_mirror"] == 1
+    finally:
+        await bot.session.close()
+        await tg.stop()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 22. YEAR SPREAD FAN-OUT
+# ─────────────────────────────────────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_year_fanout_streams_sections_in_order(fake_openai, monkeypatch):
+    from services import oracle
+
+    def responder(body):
+        prompt = body["messages"][-1]["content"]
+        for month in ("Январь", "Апрель", "Июль", "Октябрь"):
+            if f"месяцы: {month}" in prompt:
+                return month
+        return "Вступление"
+
+    # Intro answers last: nothing may be shown before it
+    fake, client = await fake_openai(responder=responder, latencies=[0.3, 0.1, 0.0, 0.0, 0.0])
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", resilience.CircuitBreaker("openai"))
+    monkeypatch.setattr(config, "year_fanout", True)
+    shown = []
+
+    async def on_section(index, text):
+        shown.append((index, text))
+
+    text = await oracle.generate_year_under_stars("год", on_section=on_section)
+    assert shown == list(enumerate(["Вступление", "Январь", "Апрель", "Июль", "Октябрь"]))
+    assert text == "Вступление\n\nЯнварь\n\nАпрель\n\nИюль\n\nОктябрь"
+    assert len(fake.requests) == 5
+    # One card draw shared by every part
+    blocks = {r["messages"][-1]["content"].split("\n\n")[1] for r in fake.requests}
+    assert len(blocks) == 1
+
+
+@pytest.mark.asyncio
+async def test_year_after_outage_closes_the_breaker(fake_openai, monkeypatch):
+    from services import oracle
+
+    fake, client = await fake_openai(responder=lambda body: "Год")
+    breaker = resilience.CircuitBreaker("openai", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", breaker)
+    monkeypatch.setattr(config, "year_fanout", True)
+
+    # one trial call instead of five parts competing for it
+    assert await oracle.generate_year_under_stars("год") == "Год"
+    assert len(fake.requests) == 1
+    assert breaker.state == "closed"
+
+    await oracle.generate_year_under_stars("год")
+    assert len(fake.requests) == 6
+
+
+@pytest.mark.asyncio
+async def test_year_fanout_against_half_open_breaker_leaves_it_usable(fake_openai, monkeypatch):
+    from services import oracle
+
+    fake, client = await fake_openai(latency=1.0)
+    breaker = resilience.CircuitBreaker("openai", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    monkeypatch.setattr(oracle, "client", client)
+    monkeypatch.setattr(oracle, "_breaker", breaker)
+
+    # one part takes the trial, the other four are rejected; then the spread
+    # is abandoned (deadline, shutdown) and the trial gets cancelled
+    fanout = asyncio.create_task(oracle._generate_year_fanout("год", "  Январь — Шут", None, None))
+    await asyncio.sleep(0.1)
+    assert metrics.counter("openai.circuit_rejected") == 4
+    fanout.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await fanout
+    await asyncio.sleep(0)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 23. STARTUP PROFILE / LAZY IMPORTS
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import startup
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   config\n"
+        "import time:      1500 |       9000 | bot\n"
+        "something else\n"
+    )
+    rows = startup.parse_importtime(stderr)
+    assert rows == [
+        startup.ImportTiming("config", 120, 120, 1),
+        startup.ImportTiming("bot", 1500, 9000, 0),
+    ]
+    assert "9.0 ms" in startup.format_report(rows)
+
+def test_bot_import_keeps_openai_lazy():
+    modules = {t.module for t in startup.profile_imports("bot")}
+    assert "handlers.spreads" in modules
+    assert not any(m == "openai" or m.startswith("openai.") for m in modules)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 24. GRACEFUL SHUTDOWN
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import lifecycle
+
+@pytest.mark.asyncio
+async def test_shutdown_drains_in_flight_work(tmp_db, monkeypatch):
+    from database import get_spread_by_id, get_spread_job_counts, save_spread
+    from services import oracle
+    lifecycle.reset()
+
+    async def summaries(texts):
+        return ["Кратко."] * len(texts)
+
+    monkeypatch.setattr(oracle, "generate_summaries", summaries)
+    monkeypatch.setattr(config, "summary_window", 60)
+    await create_user(70, "l")
+    spread_id = await save_spread(70, "spread_day", "q", "Полный текст")
+    summarizer.enqueue(spread_id, "Полный текст")
+
+    handled = []
+
+    async def slow_handler(event, data):
+        await asyncio.sleep(0.1)
+        handled.append(event)
+
+    update = asyncio.create_task(lifecycle.update_middleware()(slow_handler, "update", {}))
+
+    async def process(bot, job):
+        await asyncio.sleep(3600 if job["user_id"] == 2 else 0.1)   # user 2's job hangs
+
+    async def on_failed(bot, job):
+        pass
+
+    await jobs.enqueue(1, 1, "ritual", "q", 1)
+    await jobs.enqueue(2, 2, "ritual", "q", 2)
+    workers = jobs.start_workers(None, process, on_failed, count=2)
+    await asyncio.sleep(0.05)
+    stuck = spawn(asyncio.sleep(3600))
+
+    report = await lifecycle.shutdown(workers, timeout=0.5)
+
+    assert not lifecycle.accepting()
+    assert handled == ["update"] and update.done()
+    assert report["updates"] == {"drained": 1, "abandoned": 0}
+    assert report["jobs"] == {"drained": 1, "abandoned": 1}
+    assert report["background"] == {"drained": 0, "abandoned": 1} and stuck.cancelled()
+    assert report["summaries_flushed"] == 1 and report["checkpoint"]
+    # The hung job is back in the queue for the next process, attempt not spent
+    assert await get_spread_job_counts() == {"done": 1, "pending": 1}
+    assert (await get_spread_by_id(spread_id))["summary"] == "Кратко."
+    lifecycle.reset()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 25. WEBHOOK HANDOVER
+# ─────────────────────────────────────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_webhook_handover_loses_no_updates(tmp_path):
+    import signal
+    import socket
+    import subprocess
+    import sys
+    from benchmarks.load_test import _message
+
+    tg, ai = FakeTelegram(), FakeOpenAI()
+    tg_url, ai_url = await tg.start(), await ai.start()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = {
+        **os.environ,
+        "BOT_TOKEN": "123456:fake",
+        "OPENAI_API_KEY": "sk-fake",
+        "TELEGRAM_API_URL": tg_url,
+        "OPENAI_BASE_URL": ai_url + "/v1",
+        "WEBHOOK_URL": f"http://127.0.0.1:{port}",
+        "WEBHOOK_PORT": str(port),
+        "DATABASE_URL": str(tmp_path / "bot.db"),
+        "PID_FILE": str(tmp_path / "bot.pid"),
+        "SHUTDOWN_TIMEOUT": "5",
+    }
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    async def launch(name, *args):
+        log = open(tmp_path / f"{name}.log", "w")
+        return await asyncio.create_subprocess_exec(
+            sys.executable, "bot.py", "webhook", *args,
+            cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=log,
+        )
+
+    async def webhook_set(times):
+        while tg.calls["setWebhook"] < times:
+            await asyncio.sleep(0.05)
+
+    old = new = None
+    try:
+        # velhar@.service instances always run with --handover
+        old = await launch("old", "--handover")
+        await asyncio.wait_for(webhook_set(1), 30)
+
+        # A plain start doesn't share the port: it fails instead of splitting updates
+        dup = await launch("dup")
+        assert await asyncio.wait_for(dup.wait(), 30) != 0
+        assert "address already in use" in (tmp_path / "dup.log").read_text()
+        assert tg.calls["setWebhook"] == 1
+
+        # Telegram keeps delivering throughout; the new instance takes over mid-stream
+        sent, after_exit = [], 0
+        while after_exit < 10:
+            update = _message(len(sent) + 500, text="/start")
+            await tg.deliver(update)
+            sent.append(update["message"]["chat"]["id"])
+            if len(sent) == 5:
+                new = await launch("new", "--handover")
+            if old.returncode is not None:
+                after_exit += 1
+            await asyncio.sleep(0.02)
+            assert len(sent) < 2000, "old instance never retired"
+
+        assert old.returncode == 0
+        assert new.returncode is None
+        assert (tmp_path / "bot.pid").read_text() == str(new.pid)
+        answered = {int(p["chat_id"]) for m, p in tg.log if m == "sendMessage"}
+        assert set(sent) <= answered
+        assert tg.calls["deleteWebhook"] == 0
+    finally:
+        for proc in (old, new):
+            if proc is not None and proc.returncode is None:
+                proc.send_signal(signal.SIGTERM)
+                await asyncio.wait_for(proc.wait(), 30)
+        await tg.stop()
+        await ai.stop()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 26. SPREAD ARCHIVE (COLD STORAGE)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_codec_round_trip():
+    from services import codec
+    text = "Карты говорят: " + "путь открыт. " * 200
+    blob = codec.compress(text)
+    assert blob[0] in (codec.FORMAT_ZLIB, codec.FORMAT_ZSTD)
+    assert len(blob) < len(text.encode())
+    assert codec.decompress(blob) == text
+    with pytest.raises(ValueError):
+        codec.decompress(b"\x7f" + blob[1:])
+
+
+@pytest.mark.asyncio
+async def test_archive_moves_old_spreads_and_reads_stay_transparent(tmp_db):
+    import aiosqlite
+    from services import archive
+
+    await create_user(1, "alice")
+    await create_user(2, "bob")
+    ids = [await save_spread(1, "three_paths", f"q{i}", f"ответ {i} " * 50) for i in range(8)]
+    lone = await save_spread(2, "card_of_day", None, "одна карта")
+    async with aiosqlite.connect(tmp_db) as db:
+        await db.execute("UPDATE spreads SET created_at = '2020-01-01 00:00:00'")
+        await db.commit()
+
+    report = await archive.run()
+    assert report["moved"] == 3                 # alice keeps her latest 5, bob his only one
+    assert report["hot_rows"] == 6 and report["archive_rows"] == 3
+    assert os.path.exists(db_module.archive_path())
+
+    archived = await get_spread_by_id(ids[0])
+    assert archived["response"] == "ответ 0 " * 50
+    assert archived["user_id"] == 1 and archived["question"] == "q0"
+    assert (await get_spread_by_id(lone))["response"] == "одна карта"
+    assert {s["id"] for s in await get_recent_spreads(1, limit=10)} == set(ids[3:])
+
+    # Nothing left to move: idempotent
+    assert (await archive.run())["moved"] == 0
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 27. COMPRESSED SPREAD RESPONSES
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _readings(n):
+    rng = random.Random(7)
+    lines = [
+        "{c} говорит о силе, которая уже есть в тебе, но пока молчит.",
+        "{c} указывает на перемену: старое уходит, чтобы освободить место новому.",
+        "{c} просит терпения — не торопи события, они созревают сами.",
+        "Совет карт: доверься интуиции и не бойся тишины.",
+    ]
+    cards = ["Шут", "Маг", "Башня", "Звезда", "Луна", "Солнце"]
+    return [" ".join(rng.choice(lines).format(c=rng.choice(cards)) for _ in range(6)) for _ in range(n)]
+
+
+def test_codec_dictionary_blobs_carry_their_dictionary_id(tmp_db):
+    from services import codec
+    samples = _readings(200)
+    kind, data = codec.train_dictionary(samples)
+    text = samples[0]
+    plain = codec.compress(text)
+    try:
+        codec.load_dictionary(7, kind, data, active=True)
+        blob = codec.compress(text)
+        assert blob[0] in (codec.FORMAT_ZLIB_DICT, codec.FORMAT_ZSTD_DICT)
+        assert int.from_bytes(blob[1:3], "big") == 7
+        assert len(blob) < len(plain)
+        assert codec.decode(codec.encode(text)) == text
+        assert codec.decode("plain") == "plain"
+        codec.reset()
+        assert codec.decompress(plain) == text     # dictionary-less blobs need nothing
+        with pytest.raises(LookupError):
+            codec.decompress(blob)
+    finally:
+        codec.reset()
+
+
+@pytest.mark.asyncio
+async def test_response_compression_migration_round_trip(tmp_db, monkeypatch):
+    import aiosqlite
+    from services import codec, compression
+
+    await create_user(1, "alice")
+    texts = _readings(60)
+    ids = [await save_spread(1, "three_paths", None, t) for t in texts]
+
+    monkeypatch.setattr(config, "response_compression", True)
+    assert await compression.train(min_samples=50) is not None
+    report = await compression.migrate(batch_size=25)
+    assert report["rewritten"] == 60 and report["compressed"] == 60
+    fresh = await save_spread(1, "three_paths", None, texts[0])
+
+    async def types():
+        async with aiosqlite.connect(tmp_db) as db:
+            async with db.execute("SELECT DISTINCT typeof(response) FROM spreads") as cur:
+                return {r[0] for r in await cur.fetchall()}
+
+    assert await types() == {"blob"}
+    codec.reset()                                   # as if trained by another process
+    assert (await get_spread_by_id(ids[5]))["response"] == texts[5]
+    codec.reset()
+    await init_db()                                 # a restart reloads the dictionaries
+    assert codec.active_dictionary() is not None
+    assert (await get_spread_by_id(fresh))["response"] == texts[0]
+    assert {s["response"] for s in await get_recent_spreads(1, limit=100)} == set(texts)
+
+    # Turning compression off and migrating again restores plain text
+    monkeypatch.setattr(config, "response_compression", False)
+    assert (await compression.migrate())["compressed"] == 0
+    assert await types() == {"text"}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 28. RECENT-MEMORY RING
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services.memory import RING_SIZE, read_ring
+
+
+@pytest.mark.asyncio
+async def test_memory_ring_empty_for_new_and_unknown_users(tmp_db):
+    assert read_ring(await get_user(9999)) == []
+    await create_user(61, "prefetch")
+    assert read_ring(await get_user(61)) == []
+    for i in range(3):
+        await save_spread(61, "spread_day", f"q{i}", f"r{i}", f"s{i}")
+    ring = read_ring(await get_user(61))
+    assert [e["summary"] for e in ring] == ["s2", "s1", "s0"]
+    assert "response" not in ring[0]
+
+
+@pytest.mark.asyncio
+async def test_memory_ring_follows_spreads_and_summaries(tmp_db):
+    await create_user(71, "ring")
+    ids = [
+        await save_spread(71, "three_paths", f"что с работой {i}?", f"text {i}")
+        for i in range(RING_SIZE + 2)
+    ]
+    ring = read_ring(await get_user(71))
+    assert [e["id"] for e in ring] == ids[::-1][:RING_SIZE]
+    assert ring[0]["topic"] == "работа" and ring[0]["summary"] is None
+    assert set(ring[0]) == {"id", "spread_type", "topic", "summary", "created_at"}
+
+    await db_module.set_spread_summaries([(ids[-1], "путь к новой работе"), (ids[0], "вне кольца")])
+    ring = read_ring(await get_user(71))
+    assert ring[0]["summary"] == "путь к новой работе"
+    assert [e["summary"] for e in ring[1:]] == [None] * (RING_SIZE - 1)
+
+    # The ring drives memory exactly like the spreads rows did
+    user = {"total_spreads": 7, "spreads_since_memory": 3}
+    assert should_use_memory(user, "опять про работу", ring)
+
+
+@pytest.mark.asyncio
+async def test_memory_ring_backfilled_for_existing_users(tmp_db):
+    import aiosqlite
+    await create_user(72, "old")
+    await create_user(73, "silent")
+    ids = [await save_spread(72, "card_of_day", "любовь?", "t", summary=f"s{i}") for i in range(3)]
+    async with aiosqlite.connect(tmp_db) as db:
+        await db.execute("UPDATE users SET memory_ring = NULL")
+        await db.commit()
+
+    await init_db()
+    ring = read_ring(await get_user(72))
+    assert [e["id"] for e in ring] == ids[::-1]
+    assert [e["summary"] for e in ring] == ["s2", "s1", "s0"]
+    assert ring[0]["topic"] == "отношения"
+    assert (await get_user(73))["memory_ring"] == "[]"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 29. BOT IDENTITY CACHE
+# ─────────────────────────────────────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_deep_links_reuse_cached_bot_identity(tmp_db, monkeypatch):
+    from collections import Counter
+    from aiogram.types import Update
+    from benchmarks.load_test import _callback, _message
+    from bot import create_bot_and_dp
+    from services import identity
+    from services.utils import drain_background
+
+    tg = FakeTelegram()
+    monkeypatch.setattr(config, "telegram_api_url", await tg.start())
+    identity.reset()
+    bot, dp = await create_bot_and_dp()
+    try:
+        await drain_background(5)                   # startup prefetch
+        assert tg.calls["getMe"] == 1
+        await create_user(81, "share")
+        spread_id = await save_spread(81, "three_paths", None, "Карты говорят.")
+
+        # Outbound Bot API calls per handler, over repeated clicks
+        per_handler = {}
+        for name, update in [
+            ("share", lambda: _callback(81, f"react:share_{spread_id}")),
+            ("referral", lambda: _message(81, text="/referral")),
+        ] * 3:
+            before = Counter(tg.calls)
+            await dp.feed_update(bot, Update(**update()))
+            per_handler.setdefault(name, []).append(dict(Counter(tg.calls) - before))
+
+        assert per_handler["share"] == [{"answerCallbackQuery": 1, "sendMessage": 1}] * 3
+        assert per_handler["referral"] == [{"sendMessage": 1}] * 3
+        sent = [p["text"] for m, p in tg.log if m == "sendMessage"]
+        assert "@velhar_fake_bot" in sent[0]
+        assert "https://t.me/velhar_fake_bot?start=" in sent[1]
+        assert tg.calls["getMe"] == 1
+
+        monkeypatch.setattr(identity, "IDENTITY_TTL", 0)  # expired: refreshed once
+        await identity.get_me(bot)
+        assert tg.calls["getMe"] == 2
+    finally:
+        identity.reset()
+        await bot.session.close()
+        await tg.stop()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 30. OUTBOUND BOT API BUDGET
+# ─────────────────────────────────────────────────────────────────────────────
+
+from services import outbound
+
+
+@pytest_asyncio.fixture
+async def budget_bot(monkeypatch):
+    """Bot on the production session (outbound middleware) against FakeTelegram."""
+    from aiogram import Bot
+
+    async def make(**fake_kwargs):
+        tg = FakeTelegram(**fake_kwargs)
+        monkeypatch.setattr(config, "telegram_api_url", await tg.start())
+        made.append((tg, bot := Bot("123456:fake", session=transport.telegram_session())))
+        return tg, bot
+
+    made = []
+    outbound.reset()
+    yield make
+    outbound.reset()
+    for tg, bot in made:
+        await bot.session.close()
+        await tg.stop()
+
+
+@pytest.mark.asyncio
+async def test_outbound_counts_calls_per_update_and_coalesces_chat_actions(budget_bot):
+    from types import SimpleNamespace
+    from services.utils import velhar_typing
+
+    tg, bot = await budget_bot()
+    seen = {}
+
+    async def handler(event, data):
+        await velhar_typing(bot, 91)
+        async with velhar_presence(bot, 91):        # would repeat the same «typing…»
+            await asyncio.sleep(0.05)
+        await bot.send_message(91, "ответ")
+        await velhar_typing(bot, 91)                # the message cleared it: sent again
+        seen.update(outbound.current_calls())
+
+    await outbound.update_middleware()(handler, SimpleNamespace(update_id=1), {})
+    assert seen == {"sendChatAction": 2, "sendMessage": 1}
+    assert tg.calls["sendChatAction"] == 2
+    assert metrics.counter("telegram.coalesced.sendChatAction") >= 1
+    assert outbound.current_calls() is None
+
+
+@pytest.mark.asyncio
+async def test_outbound_paces_a_burst_to_one_chat_below_telegram_limit(budget_bot, monkeypatch):
+    # Telegram side: at most 5 messages per chat per 0.5 s; locally 8/s, no burst
+    monkeypatch.setattr(config, "telegram_chat_rate", 8.0)
+    monkeypatch.setattr(config, "telegram_chat_burst", 1)
+    tg, bot = await budget_bot(chat_limit=(5, 0.5))
+
+    started = _time.monotonic()
+    await asyncio.gather(*(bot.send_message(92, f"m{i}") for i in range(10)))
+    assert tg.rate_limited == 0
+    assert _time.monotonic() - started >= 9 / 8 - 0.05
+    assert tg.calls["sendMessage"] == 10
+
+
+@pytest.mark.asyncio
+async def test_outbound_global_limit_holds_after_chat_waits(monkeypatch):
+    from collections import Counter
+    from aiogram.methods import SendMessage
+
+    # 20 chats, two messages each, all at t=0 on a frozen clock: the second
+    # ones wait 5 s for their chat, and must not then go out all at once
+    monkeypatch.setattr(config, "telegram_global_rate", 10)
+    monkeypatch.setattr(config, "telegram_chat_rate", 0.2)
+    monkeypatch.setattr(config, "telegram_chat_burst", 1)
+    monkeypatch.setattr(outbound.time, "monotonic", lambda: 1000.0)
+    waited = []
+
+    async def no_sleep(delay):
+        waited.append(delay)
+
+    monkeypatch.setattr(outbound.asyncio, "sleep", no_sleep)
+    sent_at = Counter()
+
+    async def make_request(bot, method):
+        sent_at[round(waited.pop() if waited else 0.0, 6)] += 1
+
+    outbound.reset()
+    middleware = outbound.OutboundMiddleware()
+    for _ in range(2):
+        for chat_id in range(100, 120):
+            await middleware(make_request, None, SendMessage(chat_id=chat_id, text="m"))
+    outbound.reset()
+    assert sum(sent_at.values()) == 40
+    assert max(sent_at.values()) <= 10              # never more than the global burst
+
+
+@pytest.mark.asyncio
+async def test_spread_result_edits_the_placeholder_in_place(tmp_db, budget_bot, monkeypatch):
+    from handlers import spreads
+
+    monkeypatch.setattr(spreads, "_MIN_PRESENCE", 0)
+    monkeypatch.setattr(summarizer, "enqueue", lambda *args: None)
+    tg, bot = await budget_bot()
+    await create_user(93, "edit")
+    placeholder = (await bot.send_message(93, "…")).as_(bot)
+
+    async def generate(question, context=None, user=None):
+        return "Карты молчат."
+
+    await spreads._generate_and_send(placeholder, "✨ ", generate, "q", 93, "spread_day")
+    assert tg.calls["editMessageText"] == 1
+    assert tg.calls["deleteMessage"] == 0
+    assert tg.calls["sendMessage"] == 1                 # the placeholder only
+    assert tg.log[-1][1]["text"] == "✨ Карты молчат."
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 31. REFERRAL COUNTER
+# ─────────────────────────────────────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_concurrent_signups_award_one_bonus_per_three(tmp_db):
+    await create_user(100, "referrer")
+    for uid in range(101, 108):
+        await create_user(uid, f"invited{uid}")
+
+    results = await asyncio.gather(*(set_referred_by(uid, 100) for uid in range(101, 108)))
+    assert sorted(count for count, _ in results) == list(range(1, 8))
+    assert sum(awarded for _, awarded in results) == 2
+    user = await get_user(100)
+    assert user["referral_count"] == 7
+    assert user["referral_bonuses_available"] == 2
+
+    # a second /start with a code counts nothing
+    assert await set_referred_by(101, 100) is None
+    assert await count_referrals(100) == 7
+
+
+@pytest.mark.asyncio
+async def test_referral_count_backfilled_once(tmp_db):
+    import aiosqlite
+    await create_user(110, "referrer")
+    await create_user(111, "a")
+    await create_user(112, "b")
+    async with aiosqlite.connect(tmp_db) as db:
+        await db.execute("UPDATE users SET referred_by = 110 WHERE user_id IN (111, 112)")
+        await db.execute("ALTER TABLE users DROP COLUMN referral_count")
+        await db.commit()
+
+    await init_db()
+    assert await count_referrals(110) == 2
+    await init_db()
+    assert await count_referrals(110) == 2
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 32. REFERRAL CODES (keyed permutation)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_refcode_is_a_bijection():
+    from services import refcode
+
+    ids = [0, 1, 2, 42, 123456789, 8_000_000_000, 2**50 - 1, 2**50, 2**52 + 7]
+    codes = [refcode.encode(uid) for uid in ids]
+    assert len(set(codes)) == len(ids)
+    assert [len(c) for c in codes] == [10] * 7 + [12] * 2
+    assert all(set(c) <= set(refcode.ALPHABET) for c in codes)
+    # consecutive ids don't give related codes
+    assert codes[1][:5] != codes[2][:5]
+
+    block = {refcode.encode(uid) for uid in range(10_000, 30_000)}
+    assert len(block) == 20_000
+
+
+@pytest.mark.asyncio
+async def test_referral_code_issued_once_and_indexed(tmp_db):
+    import aiosqlite
+    import sqlite3
+    from services import refcode
+
+    await create_user(120, "a")
+    code = await generate_and_save_referral_code(120)
+    assert code == refcode.encode(120)
+    assert await generate_and_save_referral_code(120) == code
+    assert (await find_user_by_referral_code(code.lower()))["user_id"] == 120
+
+    # a migrated table without the UNIQUE column constraint gets the index;
+    # duplicates the old scheme could race into are cleared first
+    async with aiosqlite.connect(tmp_db) as db:
+        await db.execute("CREATE TABLE users_old AS SELECT * FROM users")
+        await db.execute("DROP TABLE users")
+        await db.execute("ALTER TABLE users_old RENAME TO users")
+        await db.execute("INSERT INTO users (user_id, referral_code) VALUES (122, 'ABCD2345'), (123, 'ABCD2345')")
+        await db.commit()
+    await init_db()
+    assert (await get_user(122))["referral_code"] == "ABCD2345"
+    assert (await get_user(123))["referral_code"] is None
+    assert await generate_and_save_referral_code(123) == refcode.encode(123)
+    async with aiosqlite.connect(tmp_db) as db:
+        with pytest.raises(sqlite3.IntegrityError):
+            await db.execute("INSERT INTO users (user_id, referral_code) VALUES (121, ?)", (code,))
+
+
+@pytest.mark.asyncio
+async def test_referral_code_after_key_rotation_falls_back(tmp_db, monkeypatch):
+    import aiosqlite
+    from services import refcode
+
+    monkeypatch.setattr(config, "referral_code_key", "new-key")
+    await create_user(130, "old")
+    await create_user(131, "new")
+    # user 130's code from the old key happens to be user 131's under the new one
+    taken = refcode.encode(131)
+    async with aiosqlite.connect(tmp_db) as db:
+        await db.execute("UPDATE users SET referral_code = ? WHERE user_id = 130", (taken,))
+        await db.commit()
+
+    code = await generate_and_save_referral_code(131)
+    assert code == taken + refcode.FALLBACK_MARK and len(code) == 11
+    assert (await find_user_by_referral_code(code))["user_id"] == 131
+    assert (await find_user_by_referral_code(taken))["user_id"] == 130
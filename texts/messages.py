@@ -108,6 +108,8 @@ ERROR_GENERIC = (
     "Попробуй ещё раз чуть позже."
 )
 
+SPREAD_IN_PROGRESS = "Карты уже раскладываются для тебя... Дождись послания."
+
 ADMIN_STATS_TEMPLATE = (
     "📊 *Статистика VELHAR*\n\n"
     "👤 Пользователей всего: *{total_users}*\n"
@@ -117,4 +119,22 @@ ADMIN_STATS_TEMPLATE = (
     "📖 Раскладов всего: *{spreads_total}*"
 )
 
+ADMIN_STATS_PRODUCTS_HEADER = "💳 *Выручка по продуктам за месяц:*"
+ADMIN_STATS_PRODUCT_LINE = "• `{product}`: *{revenue}*"
+ADMIN_STATS_DAYS_HEADER = "📅 *Последние 7 дней* (расклады / выручка / новые):"
+ADMIN_STATS_DAY_LINE = "`{day}` — {spreads} / {revenue} / {new_users}"
+
+ADMIN_CACHE_TEMPLATE = (
+    "🗃 *Кэш «Карты дня»*\n\n"
+    "Записей: *{entries}*\n"
+    "Попаданий: *{hits}* ({hit_rate:.0%})\n"
+    "Сэкономлено времени: *{latency_saved_s:.0f} с*\n"
+    "Сэкономлено токенов: *{tokens_saved}*"
+)
+
+ADMIN_PROMPT_CACHE_TEMPLATE = (
+    "⚡️ *Префиксный кэш OpenAI* (с запуска)\n\n"
+    "Из кэша: *{cached_tokens}* из *{prompt_tokens}* входных токенов ({cached_rate:.0%})"
+)
+
 NOT_ADMIN = "Это измерение закрыто для тебя."